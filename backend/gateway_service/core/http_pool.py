@@ -0,0 +1,87 @@
+import importlib.util
+import httpx
+from loguru import logger
+from prometheus_client import Gauge
+from backend.shared.core.config import settings
+
+UPSTREAM_IN_FLIGHT = Gauge(
+    "gateway_upstream_requests_in_flight",
+    "Proxied requests currently holding an upstream connection",
+    ["upstream"],
+)
+UPSTREAM_POOL_CONNECTIONS = Gauge(
+    "gateway_upstream_pool_connections",
+    "Open connections in the upstream keep-alive pool by state",
+    ["upstream", "state"],
+)
+UPSTREAM_POOL_UTILIZATION = Gauge(
+    "gateway_upstream_pool_utilization",
+    "In-flight upstream requests divided by GATEWAY_MAX_CONNECTIONS (>=1 means requests wait for a connection)",
+    ["upstream"],
+)
+
+
+class UpstreamPool:
+    """
+    网关到各上游服务的长连接池：每个上游服务一个 httpx.AsyncClient，
+    由 FastAPI lifespan 创建和关闭，所有请求复用其中的 keep-alive 连接（可选 HTTP/2 多路复用）。
+    同一服务的多个实例按 origin 各自维护连接，连接数上限为 GATEWAY_MAX_CONNECTIONS。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._in_flight = {}
+
+    @property
+    def http2(self) -> bool:
+        if settings.GATEWAY_HTTP2 and importlib.util.find_spec("h2") is None:
+            logger.warning("GATEWAY_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+            return False
+        return settings.GATEWAY_HTTP2
+
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        client = self._clients.get(upstream)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.GATEWAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GATEWAY_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.GATEWAY_KEEPALIVE_EXPIRY,
+                ),
+                http2=self.http2,
+            )
+            self._clients[upstream] = client
+        return client
+
+    def start(self, upstreams: list):
+        for upstream in upstreams:
+            self.client(upstream)
+        logger.info(f"Gateway upstream pools ready for {', '.join(upstreams)}")
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+    def acquired(self, upstream: str):
+        self._track(upstream, 1)
+
+    def released(self, upstream: str):
+        self._track(upstream, -1)
+
+    def _track(self, upstream: str, delta: int):
+        in_flight = self._in_flight.get(upstream, 0) + delta
+        self._in_flight[upstream] = in_flight
+        UPSTREAM_IN_FLIGHT.labels(upstream).set(in_flight)
+        UPSTREAM_POOL_UTILIZATION.labels(upstream).set(in_flight / settings.GATEWAY_MAX_CONNECTIONS)
+
+        # httpx 不公开连接池状态，这里读取底层 httpcore 连接池（取不到时跳过）
+        pool = getattr(getattr(self._clients.get(upstream), "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            idle = sum(1 for connection in connections if connection.is_idle())
+            UPSTREAM_POOL_CONNECTIONS.labels(upstream, "idle").set(idle)
+            UPSTREAM_POOL_CONNECTIONS.labels(upstream, "active").set(len(connections) - idle)
+
+
+http_pool = UpstreamPool()
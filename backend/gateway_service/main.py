@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
@@ -10,6 +11,8 @@ sys.path.append(
 )
 
 from backend.gateway_service.routers.proxy import router
+from backend.gateway_service.core.http_pool import http_pool
+from backend.shared.core.discovery import registry
 from backend.shared.telemetry.logging import setup_logging
 from backend.shared.telemetry.tracing import setup_tracing, instrument_app
 from backend.shared.telemetry.metrics import setup_metrics
@@ -23,10 +26,18 @@ setup_tracing("gateway-service")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    用于处理应用启动和关闭时的生命周期事件。
+    用于处理应用启动和关闭时的生命周期事件：
+    - 启动时：预加载上游服务的实例列表（之后由后台线程刷新），为各上游服务创建长连接池
+    - 关闭时：关闭连接池中的所有连接
     """
+    upstreams = ["auth-service", "knowledge-service", "rag-engine"]
+    await asyncio.to_thread(registry.watch, upstreams)
+    http_pool.start(upstreams)
+
     yield
 
+    await http_pool.close()
+
 
 app = FastAPI(title="Gateway Service", lifespan=lifespan)
 
@@ -1,8 +1,15 @@
+import json
+import time
 import httpx
-import random
 import logging
 from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from backend.gateway_service.core.auth_middleware import verify_jwt
+from backend.gateway_service.core.http_pool import http_pool
+from backend.shared.core.balancer import get_balancer, healthy_instances
+from backend.shared.core.circuit_breaker import CircuitOpenError
+from backend.shared.core.config import settings
 from backend.shared.core.discovery import registry
 
 logger = logging.getLogger(__name__)
@@ -10,43 +17,182 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def get_service_url(service_name: str) -> str:
+# 服务发现不可用时的本地默认地址
+DEFAULT_TARGETS = {
+    "auth-service": "localhost:8003",
+    "knowledge-service": "localhost:8001",
+    "rag-engine": "localhost:8002",
+}
+
+
+def pick_instance(service_name: str) -> str:
     """
-    从 Nacos 注册中心解析服务地址，如果失败则降级到默认配置。
+    从服务发现缓存中的健康实例里，由负载均衡器（按未完成请求数和 EWMA 延迟）选择一个实例，
+    返回 "host:port"；没有可用实例时降级到默认配置。
+    被摘除的实例过多时负载均衡器回退到全部实例（panic 模式）；仍没有实例可以放行请求时直接返回 503。
     """
-    # Try Nacos first (优先尝试从 Nacos 获取)
+    balancer = get_balancer(service_name)
+    try:
+        balancer.update(healthy_instances(registry.get_service(service_name)))
+    except Exception as e:
+        logger.error(f"Error resolving {service_name}: {e}")
+
     try:
-        instances = registry.get_service(service_name)
+        target = balancer.pick(DEFAULT_TARGETS.get(service_name))
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(settings.CIRCUIT_OPEN_SECONDS))},
+        )
+    if target is None:
+        raise HTTPException(status_code=503, detail=f"Service {service_name} unavailable")
+    return target
+
+
+# 计入实例熔断器的上游状态码：网关、实例不可用或超时；其他 5xx 通常是请求本身触发的应用错误
+INSTANCE_FAILURE_STATUS = {502, 503, 504}
+
+# 由网关根据鉴权结果注入的身份头部，客户端自带的同名头部一律丢弃，不能冒充其他租户
+IDENTITY_HEADERS = {"x-tenant-id"}
+
+# 逐跳头部 (RFC 7230 6.1)：只对单个连接有效，代理不转发
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
 
-        hosts = instances.get("hosts", []) if isinstance(instances, dict) else instances
 
-        # 过滤出健康且已启用的实例
-        healthy_instances = [
-            ins
-            for ins in hosts
-            if (ins.get("healthy", True) and ins.get("enabled", True))
-        ]
+def forward_headers(request: Request, body_replaced: bool) -> list:
+    """
+    转发给上游的请求头：去掉逐跳头部、host（由 httpx 按上游地址设置）和客户端自带的身份头部，
+    请求体被改写时同时去掉 content-length，由 httpx 重新计算。
+    """
+    dropped = HOP_BY_HOP_HEADERS | IDENTITY_HEADERS | {"host"}
+    if body_replaced:
+        dropped = dropped | {"content-length"}
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in dropped]
+    if request.client:
+        headers.append(("x-forwarded-for", request.client.host))
+    return headers
+
+
+class UpstreamResponse(StreamingResponse):
+    """
+    透传上游响应的 StreamingResponse：无论正常发送完毕、客户端断开还是出错都执行后台任务。
+    Starlette 在客户端断开（ASGI spec 2.4 的 ClientDisconnect）时不运行后台任务。
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.background is not None:
+                await self.background()
 
-        if healthy_instances:
-            # 负载均衡策略：随机选择
-            instance = random.choice(healthy_instances)
-            return f"http://{instance['ip']}:{instance['port']}"
 
+async def proxy_request(
+    request: Request,
+    service_name: str,
+    path: str,
+    timeout: float,
+    content: bytes = None,
+    extra_headers: list = None,
+) -> UpstreamResponse:
+    """
+    通用的流式反向代理：
+    - 复用该上游服务的长连接池（http_pool），不为每个请求新建连接
+    - 请求体逐块透传给上游（content 不为空时改为发送改写后的请求体），
+      extra_headers 为网关注入的头部（如租户标识）
+    - 上游响应的状态码和响应头原样返回，响应体逐块透传，不在网关缓冲或解析
+    - 响应头返回的耗时计入所选实例的延迟统计，只有连接失败、超时和 502/503/504 计入实例的熔断器，
+      未完成请求数持续到响应体发送完毕
+    响应体由异步生成器透传，生成器结束时（发送完毕、客户端断开或出错）关闭上游响应、连接归还连接池，
+    并释放实例的未完成请求数；客户端在响应体开始发送前断开时由 UpstreamResponse 兜底，两条路径只释放一次。
+    """
+    target = pick_instance(service_name)
+    url = f"http://{target}{path}"
+    client = http_pool.client(service_name)
+    balancer = get_balancer(service_name)
+    started = time.perf_counter()
+
+    def finished(failed: bool):
+        http_pool.released(service_name)
+        balancer.release(target, time.perf_counter() - started, failed=failed)
+
+    http_pool.acquired(service_name)
+    balancer.acquire(target)
+    try:
+        upstream_request = client.build_request(
+            request.method,
+            url,
+            params=request.query_params,
+            headers=forward_headers(request, body_replaced=content is not None) + (extra_headers or []),
+            content=request.stream() if content is None else content,
+            timeout=httpx.Timeout(
+                timeout,
+                connect=settings.GATEWAY_CONNECT_TIMEOUT,
+                pool=settings.GATEWAY_POOL_TIMEOUT,
+            ),
+        )
+        response = await client.send(upstream_request, stream=True)
+    except httpx.PoolTimeout:
+        # 网关自身的连接池排队超时，与上游实例无关
+        http_pool.released(service_name)
+        balancer.release(target)
+        raise HTTPException(status_code=503, detail=f"Too many concurrent requests to {service_name}")
+    except httpx.TimeoutException as e:
+        finished(failed=True)
+        raise HTTPException(status_code=504, detail=f"Upstream timeout: {e}")
     except Exception as e:
-        logger.error(f"Error resolving {service_name}: {e}")
+        # 只有连接失败说明实例不可用；其他错误（如客户端请求体中断）不计入熔断器
+        finished(failed=isinstance(e, httpx.ConnectError))
+        logger.error(f"Proxy to {url} failed: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+    balancer.observe(
+        target, time.perf_counter() - started, failed=response.status_code in INSTANCE_FAILURE_STATUS
+    )
 
-    # Fallback to localhost defaults (降级到本地默认端口)
-    defaults = {
-        "auth-service": ("localhost", 8003),
-        "knowledge-service": ("localhost", 8001),
-        "rag-engine": ("localhost", 8002),
-    }
+    closed = False
 
-    if service_name in defaults:
-        host, port = defaults[service_name]
-        return f"http://{host}:{port}"
+    async def close_upstream():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        try:
+            await response.aclose()
+        finally:
+            http_pool.released(service_name)
+            balancer.release(target)
+
+    async def stream_upstream():
+        # 客户端断开时发送任务被取消，生成器的 finally 仍会执行
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await close_upstream()
 
-    raise HTTPException(status_code=503, detail=f"Service {service_name} unavailable")
+    proxied = UpstreamResponse(
+        stream_upstream(),
+        status_code=response.status_code,
+        background=BackgroundTask(close_upstream),
+    )
+    # 使用原始响应头（保留重复的头部如 set-cookie，以及 content-encoding 等与原始字节匹配的头部）
+    proxied.raw_headers = [
+        (name, value)
+        for name, value in response.headers.raw
+        if name.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS
+    ]
+    return proxied
 
 
 # 认证路由转发
@@ -55,14 +201,9 @@ async def proxy_register(request: Request):
     """
     转发注册请求到认证服务。
     """
-    url = get_service_url("auth-service")
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            body = await request.json()
-            response = await client.post(f"{url}/api/v1/auth/register", json=body)
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    return await proxy_request(
+        request, "auth-service", "/api/v1/auth/register", timeout=settings.GATEWAY_AUTH_TIMEOUT
+    )
 
 
 @router.post("/auth/login")
@@ -70,14 +211,9 @@ async def proxy_login(request: Request):
     """
     转发登录请求到认证服务。
     """
-    url = get_service_url("auth-service")
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            body = await request.json()
-            response = await client.post(f"{url}/api/v1/auth/login", json=body)
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    return await proxy_request(
+        request, "auth-service", "/api/v1/auth/login", timeout=settings.GATEWAY_AUTH_TIMEOUT
+    )
 
 
 # 知识库路由转发（需鉴权）
@@ -85,46 +221,46 @@ async def proxy_login(request: Request):
 async def proxy_upload(request: Request, user: dict = Depends(verify_jwt)):
     """
     转发文件上传请求到知识库服务。
+    multipart 请求体边接收边转发，大文件不会整体驻留在网关内存中。
+    文档所属租户取自已认证的用户，以 X-Tenant-Id 请求头注入。
     """
-    url = get_service_url("knowledge-service")
+    return await proxy_request(
+        request,
+        "knowledge-service",
+        "/api/v1/upload",
+        timeout=settings.GATEWAY_UPLOAD_TIMEOUT,
+        extra_headers=[("x-tenant-id", str(user["user_id"]))],
+    )
 
-    # 获取原始请求体以支持文件上传转发
-    body = await request.body()
-    headers = dict(request.headers)
-    # 移除 host 头，避免转发时混淆
-    headers.pop("host", None)
-    headers.pop("content-length", None)  # Let httpx handle this
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            # 直接透传原始请求体和 Content-Type 头
-            response = await client.post(
-                f"{url}/api/v1/upload", content=body, headers=headers
-            )
-            try:
-                return response.json()
-            except Exception:
-                logger.error(
-                    f"Proxy upload failed. Status: {response.status_code}, Body: {response.text}"
-                )
-                raise HTTPException(
-                    status_code=response.status_code, detail=response.text
-                )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+@router.get("/knowledge/documents/{doc_id}")
+async def proxy_document_status(doc_id: str, request: Request, user: dict = Depends(verify_jwt)):
+    """
+    转发文档索引状态查询到知识库服务（只能查询当前用户的文档）。
+    """
+    return await proxy_request(
+        request,
+        "knowledge-service",
+        f"/api/v1/documents/{doc_id}",
+        timeout=settings.GATEWAY_UPLOAD_TIMEOUT,
+        extra_headers=[("x-tenant-id", str(user["user_id"]))],
+    )
 
 
 # RAG Routes (Protected)
 @router.post("/chat")
 async def proxy_chat(request: Request, user: dict = Depends(verify_jwt)):
-    url = get_service_url("rag-engine")
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        try:
-            body = await request.json()
-
-            body["user_id"] = str(user["user_id"])
+    """
+    转发对话请求到 RAG 引擎。
+    请求体需要注入 user_id，因此是唯一解析 JSON 的路由；响应（含 SSE 流）原样透传。
+    """
+    try:
+        body = await request.json()
+        body["user_id"] = str(user["user_id"])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
 
-            response = await client.post(f"{url}/api/v1/chat", json=body)
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    return await proxy_request(
+        request, "rag-engine", "/api/v1/chat", timeout=settings.GATEWAY_CHAT_TIMEOUT, content=content
+    )
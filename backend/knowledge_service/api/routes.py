@@ -1,80 +1,153 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException
 from backend.knowledge_service.core.mq import producer
+from backend.knowledge_service.core.chunker import get_chunker
+from backend.knowledge_service.core.ingest import iter_pdf_pages, iter_text_file, spool_to_disk
+from backend.knowledge_service.core.documents import get_document, mark_indexed, stable_doc_id, start_sync
+from backend.knowledge_service.core.vector_client import vector_client
+from backend.shared.models.document import DocumentStatus
 from loguru import logger
-import uuid
-import io
+from typing import Optional
+import json
+import os
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from pypdf import PdfReader
 
 router = APIRouter()
 
-# 创建线程池以处理阻塞型操作（如 PDF 解析）
+# 创建线程池以处理阻塞型文件操作（PDF 解析本身在 ingest.parser_pool 进程池中执行）
 executor = ThreadPoolExecutor(max_workers=4)
 
 
-def parse_pdf(content: bytes) -> str:
+def request_tenant(x_tenant_id: Optional[str]) -> Optional[str]:
     """
-    从 PDF 文件内容中提取文本。
+    文档所属租户：由网关根据 JWT 中的用户注入 X-Tenant-Id 请求头（客户端自带的同名头会被网关丢弃）。
     """
-    try:
-        pdf_file = io.BytesIO(content)
-        reader = PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return text
-    except Exception as e:
-        logger.error(f"Error parsing PDF: {e}")
-        return ""
+    return x_tenant_id or None
 
 
 @router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(
+    file: UploadFile = File(...),
+    chunker: Optional[str] = Form(None),
+    chunk_size: Optional[int] = Form(None),
+    chunk_overlap: Optional[int] = Form(None),
+    doc_id: Optional[str] = Form(None),
+    x_tenant_id: Optional[str] = Header(None),
+):
     """
-    上传并处理文档 (PDF/TXT)：
-    1. 解析文档内容
-    2. 按段落切分文本
-    3. 将切片发送到消息队列以进行向量化
+    上传并处理文档 (PDF/TXT)，流水线式处理：
+    1. 按页区间并行解析 PDF（进程池中执行，结果按页序合并）或按块读取 TXT
+    2. 文本到达后增量切片：默认按 token 滑动窗口（可通过表单字段 chunker / chunk_size /
+       chunk_overlap 按本次上传选择策略与参数），或按段落切分
+    3. 切片边生成边发送到消息队列进行向量化（多个切片打包为一条消息，异步流水线确认），
+       无需等待全文解析完成
+    4. 每个切片附带内容指纹 content_hash，向量服务据此复用已有向量；
+       同一文档内重复的切片只发送一次
+    5. 增量重新索引：文档标识稳定（表单字段 doc_id，或由租户 + 文件名生成），
+       只有向量服务确认已写入索引的旧切片视为无需发送，其余切片（含上次未确认的）重新发送，
+       并从向量库删除新版本中已不存在的切片
+    6. 有切片等待向量化时文档状态为 PENDING，全部确认后（GET /documents/{doc_id}）变为 INDEXED
+    内存占用只与缓冲的页数有关，与文档大小无关。
     """
-    text = ""
-    if file.filename.endswith(".pdf"):
-        content = await file.read()
-        # 在独立线程中运行 CPU 密集型的 PDF 解析任务
-        loop = asyncio.get_running_loop()
-        text = await loop.run_in_executor(executor, parse_pdf, content)
-
-        if not text:
+    try:
+        text_chunker = get_chunker(chunker, chunk_size, chunk_overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not file.filename.endswith((".pdf", ".txt")):
+        raise HTTPException(
+            status_code=400, detail="Only .txt and .pdf files are supported"
+        )
+
+    tenant = request_tenant(x_tenant_id)
+    try:
+        doc_id = stable_doc_id(file.filename, tenant, doc_id)
+        sync = await start_sync(doc_id, file.filename, tenant, producer.batch())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    spooled_path = None
+    ingested = False
+    try:
+        if file.filename.endswith(".pdf"):
+            loop = asyncio.get_running_loop()
+            spooled_path = await loop.run_in_executor(executor, spool_to_disk, file.file, ".pdf")
+            pages = iter_pdf_pages(spooled_path)
+        else:
+            pages = iter_text_file(file)
+
+        async for text in pages:
+            for chunk in text_chunker.feed(text):
+                await sync.add(chunk)
+        for chunk in text_chunker.finish():
+            await sync.add(chunk)
+        await sync.publisher.flush()
+        ingested = bool(sync.chunk_count)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Text file must be UTF-8 encoded")
+    except Exception as e:
+        logger.error(f"Error ingesting {file.filename} after {sync.chunk_count} chunks: {e}")
+        if not sync.chunk_count:
             raise HTTPException(
                 status_code=400, detail="Failed to extract text from PDF or empty file"
             )
+        raise HTTPException(status_code=500, detail=f"Document ingestion failed: {e}")
+    finally:
+        if spooled_path:
+            os.unlink(spooled_path)
+        if not ingested:
+            await sync.fail()
 
-    elif file.filename.endswith(".txt"):
-        content = await file.read()
-        text = content.decode("utf-8")
-    else:
+    if not sync.chunk_count:
         raise HTTPException(
-            status_code=400, detail="Only .txt and .pdf files are supported"
+            status_code=400, detail="Failed to extract text from PDF or empty file"
         )
 
-    # 简单的按段落切分策略
-    chunks = [chunk.strip() for chunk in text.split("\n\n") if chunk.strip()]
+    try:
+        status = await sync.commit()
+    except Exception as e:
+        logger.error(f"Failed to delete {len(sync.removed)} stale chunks of {file.filename}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete stale chunks: {e}")
+
+    return {
+        "message": "Document processed and queued for embedding",
+        "doc_id": doc_id,
+        "status": status.value,
+        "chunks": sync.chunk_count,
+        "unique_chunks": len(sync.seen),
+        "added_chunks": len(sync.published),
+        "removed_chunks": len(sync.removed),
+    }
+
 
-    doc_id = str(uuid.uuid4())
+@router.get("/documents/{doc_id}")
+async def get_document_status(doc_id: str, x_tenant_id: Optional[str] = Header(None)):
+    """
+    查询文档的索引状态。等待确认 (PENDING) 的文档会向向量服务核对切片，
+    全部写入索引后标记为 INDEXED；未确认的切片在下次上传同一文档时重新发送。
+    """
+    document = await get_document(doc_id, request_tenant(x_tenant_id))
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
 
-    for i, chunk in enumerate(chunks):
-        chunk_id = f"{doc_id}_{i}"
-        message = {
-            "id": chunk_id,
-            "text": chunk,
-            "metadata": {"source": file.filename, "doc_id": doc_id, "chunk_index": i},
-        }
-        producer.publish(message)
+    chunk_hashes = set(json.loads(document.chunk_hashes or "[]"))
+    status = document.status
+    indexed = None
+    if status == DocumentStatus.PENDING:
+        try:
+            indexed = len(await vector_client.indexed_chunks(doc_id, sorted(chunk_hashes)))
+        except Exception as e:
+            logger.warning(f"Failed to confirm indexed chunks of document {doc_id}: {e}")
+        if indexed == len(chunk_hashes):
+            await mark_indexed(doc_id, chunk_hashes)
+            status = DocumentStatus.INDEXED
 
     return {
-        "message": "Document processed and queued for embedding",
         "doc_id": doc_id,
-        "chunks": len(chunks),
+        "title": document.title,
+        "status": status.value,
+        "chunks": document.chunk_count,
+        "unique_chunks": len(chunk_hashes),
+        "indexed_chunks": len(chunk_hashes) if status == DocumentStatus.INDEXED else indexed,
     }
@@ -0,0 +1,210 @@
+import re
+from typing import Optional
+from backend.shared.core.config import settings
+from backend.shared.core.tokenizer import tokenizer
+
+# 句子边界：中文/全角终止符（可跟引号、括号），英文终止符后须跟空白（避免切开小数和缩写中间），以及空行
+SENTENCE_BOUNDARY = re.compile(
+    r"[。！？；…]+[”’」』）)\]\"']*\s*"
+    r"|[.!?;]+[”’)\]\"']*\s+"
+    r"|\n\s*\n\s*"
+)
+
+
+class ParagraphChunker:
+    """
+    按空行切分段落的增量切片器：
+    feed() 逐段输入文本（如逐页），返回其中已完整的段落；finish() 返回剩余的最后一段。
+    输出与对全文执行 text.split("\n\n") 一致，但无需拼接全文。
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._ends_with_newline = False
+
+    def feed(self, text: str) -> list:
+        if not text:
+            return []
+        # 只有出现段落分隔符（含跨两次输入的 "\n" + "\n"）时才拼接缓冲区，整体保持线性复杂度
+        has_separator = "\n\n" in text or (self._ends_with_newline and text.startswith("\n"))
+        self._pending.append(text)
+        self._ends_with_newline = text.endswith("\n")
+        if not has_separator:
+            return []
+
+        *paragraphs, rest = "".join(self._pending).split("\n\n")
+        self._pending = [rest]
+        return [p.strip() for p in paragraphs if p.strip()]
+
+    def finish(self) -> list:
+        rest = "".join(self._pending).strip()
+        self._pending = []
+        self._ends_with_newline = False
+        return [rest] if rest else []
+
+
+class SlidingWindowChunker:
+    """
+    按 token 数切分的滑动窗口切片器（增量接口与 ParagraphChunker 相同）：
+    - 以句子为最小单位（支持中文标点，无需空格分词）装入窗口，窗口不超过 max_tokens
+    - 相邻窗口重叠约 overlap_tokens 个 token（取上一窗口末尾的整句）
+    - 超过窗口大小的超长句子按 token 数强制切开
+    - 末尾不足 min_tokens 的碎片从前一个切片末尾借入整句补足上下文（不超过 max_tokens），
+      不会产生几乎只有碎片内容的切片
+    """
+
+    def __init__(self, max_tokens: int, overlap_tokens: int, min_tokens: int):
+        if max_tokens <= 0:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("chunk_overlap must be non-negative and smaller than chunk_size")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self._pending = ""
+        self._window = []  # [(sentence, tokens)]
+        self._window_tokens = 0
+        self._fresh_start = 0  # 窗口中第一个不属于重叠部分的句子下标
+        self._fresh_tokens = 0  # 窗口中不属于重叠部分的 token 数
+        self._held = None  # 最近完成的切片，暂缓输出以便为末尾碎片补足上下文
+        self._held_window = []  # 最近完成的切片包含的句子
+
+    def feed(self, text: str) -> list:
+        self._pending += text
+        sentences = []
+        position = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._pending):
+            # 缓冲区末尾的边界可能被下一段输入延续（如 ". " 之后的 "\n\n"），等待更多输入再确定
+            if match.end() == len(self._pending):
+                break
+            sentences.append(self._pending[position:match.end()])
+            position = match.end()
+        self._pending = self._pending[position:]
+
+        # 长时间没有句子边界时，按 token 数强制切开，避免缓冲区无限增长
+        if len(self._pending) > self.max_tokens * 8 and tokenizer.count(self._pending) > self.max_tokens:
+            *parts, self._pending = split_by_tokens(self._pending, self.max_tokens)
+            sentences.extend(parts)
+
+        output = []
+        for sentence in sentences:
+            output.extend(self._add(sentence))
+        return output
+
+    def finish(self) -> list:
+        output = []
+        if self._pending.strip():
+            output.extend(self._add(self._pending))
+        self._pending = ""
+
+        if self._fresh_tokens:
+            if self._held is not None and self._fresh_tokens < self.min_tokens:
+                self._borrow_context()
+            output.extend(self._emit())
+        if self._held is not None:
+            output.append(self._held)
+            self._held = None
+        self._held_window = []
+        self._window, self._window_tokens = [], 0
+        self._fresh_start, self._fresh_tokens = 0, 0
+        return output
+
+    def _add(self, sentence: str) -> list:
+        tokens = tokenizer.count(sentence)
+        if not tokens:
+            return []
+        if tokens > self.max_tokens:
+            output = []
+            for part in split_by_tokens(sentence, self.max_tokens):
+                output.extend(self._add(part))
+            return output
+
+        output = []
+        if self._window_tokens + tokens > self.max_tokens and self._fresh_tokens:
+            output.extend(self._emit())
+            self._slide()
+        # 重叠部分加上新句子仍超出窗口时，从头部丢弃重叠句子
+        while self._window and self._window_tokens + tokens > self.max_tokens:
+            _, dropped = self._window.pop(0)
+            self._window_tokens -= dropped
+            self._fresh_start -= 1
+        self._window.append((sentence, tokens))
+        self._window_tokens += tokens
+        self._fresh_tokens += tokens
+        return output
+
+    def _slide(self):
+        """
+        保留当前窗口末尾不超过 overlap_tokens 的整句，作为下一窗口的开头。
+        """
+        overlap, overlap_tokens = [], 0
+        for sentence, tokens in reversed(self._window):
+            if overlap_tokens + tokens > self.overlap_tokens:
+                break
+            overlap.insert(0, (sentence, tokens))
+            overlap_tokens += tokens
+        self._window = overlap
+        self._window_tokens = overlap_tokens
+        self._fresh_start = len(overlap)
+        self._fresh_tokens = 0
+
+    def _window_text(self) -> str:
+        return "".join(sentence for sentence, _ in self._window).strip()
+
+    def _borrow_context(self):
+        """
+        末尾碎片过小时，从上一切片中重叠部分之前的句子由后向前借入，直到再借就会超过 max_tokens。
+        碎片本身是上一切片装不下的内容，整体并入必然超限，因此改为扩大与上一切片的重叠。
+        """
+        # 窗口开头的 _fresh_start 个句子即上一切片末尾的重叠句子
+        borrowable = self._held_window[:len(self._held_window) - self._fresh_start]
+        for sentence, tokens in reversed(borrowable):
+            if self._window_tokens + tokens > self.max_tokens:
+                break
+            self._window.insert(0, (sentence, tokens))
+            self._window_tokens += tokens
+
+    def _emit(self) -> list:
+        held, self._held = self._held, self._window_text()
+        self._held_window = list(self._window)
+        return [held] if held is not None else []
+
+
+def split_by_tokens(text: str, max_tokens: int) -> list:
+    """
+    将超长文本切成不超过 max_tokens 的片段。
+    按字符比例估算切点后逐步收缩，兼容 tiktoken 与启发式计数两种模式。
+    """
+    parts = []
+    while text:
+        total = tokenizer.count(text)
+        if total <= max_tokens:
+            parts.append(text)
+            break
+        end = max(1, len(text) * max_tokens // total)
+        while end > 1 and tokenizer.count(text[:end]) > max_tokens:
+            end = end * 9 // 10
+        parts.append(text[:end])
+        text = text[end:]
+    return parts
+
+
+CHUNKERS = ("window", "paragraph")
+
+
+def get_chunker(strategy: Optional[str] = None, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None):
+    """
+    按策略名称创建切片器：
+    - window：token 滑动窗口（默认，大小/重叠可按上传请求覆盖）
+    - paragraph：按空行切分段落（旧策略）
+    """
+    strategy = strategy or settings.CHUNKER_DEFAULT
+    if strategy == "window":
+        return SlidingWindowChunker(
+            max_tokens=settings.CHUNK_MAX_TOKENS if chunk_size is None else chunk_size,
+            overlap_tokens=settings.CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap,
+            min_tokens=settings.CHUNK_MIN_TOKENS,
+        )
+    if strategy == "paragraph":
+        return ParagraphChunker()
+    raise ValueError(f"Unknown chunker: {strategy}, expected one of {', '.join(CHUNKERS)}")
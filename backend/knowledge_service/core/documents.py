@@ -0,0 +1,178 @@
+import json
+import uuid
+from typing import Optional
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from backend.knowledge_service.core.db import async_session
+from backend.knowledge_service.core.vector_client import vector_client
+from backend.shared.core.mq import content_hash
+from backend.shared.models.document import Document, DocumentStatus
+
+
+def stable_doc_id(filename: str, tenant: Optional[str] = None, doc_id: Optional[str] = None) -> str:
+    """
+    文档的稳定标识：优先使用上传时显式指定的 doc_id，否则由 (租户, 文件名) 生成确定性的 UUID。
+    同一文档重新上传时标识不变，才能与已索引的切片集合做差异比较。
+    没有租户时不能只凭文件名生成标识（不同用户的同名文件会互相覆盖），必须显式指定 doc_id。
+    """
+    if doc_id:
+        return doc_id
+    if not tenant:
+        raise ValueError("doc_id is required when the upload has no tenant")
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{tenant}/{filename}"))
+
+
+def _check_tenant(document: Document, tenant: Optional[str]):
+    if document.tenant and document.tenant != tenant:
+        raise PermissionError(f"Document {document.doc_id} belongs to another tenant")
+
+
+async def begin_sync(doc_id: str, title: str, tenant: Optional[str] = None) -> set:
+    """
+    将文档标记为处理中（首次上传时创建记录），返回上次同步记录的切片指纹集合。
+    文档属于其他租户时抛出 PermissionError。
+    """
+    try:
+        return await _begin_sync(doc_id, title, tenant)
+    except IntegrityError:
+        # 同一文档的并发首次上传：另一个请求已先创建记录（doc_id 唯一约束），在新事务中重新读取
+        return await _begin_sync(doc_id, title, tenant)
+
+
+async def _begin_sync(doc_id: str, title: str, tenant: Optional[str]) -> set:
+    async with async_session() as session:
+        document = await session.scalar(select(Document).where(Document.doc_id == doc_id))
+        if document is None:
+            document = Document(doc_id=doc_id, title=title, tenant=tenant)
+            session.add(document)
+        _check_tenant(document, tenant)
+        previous = set(json.loads(document.chunk_hashes or "[]"))
+        document.title = title
+        document.status = DocumentStatus.PROCESSING
+        await session.commit()
+    return previous
+
+
+async def finish_sync(doc_id: str, chunk_hashes: set, chunk_count: int, status: DocumentStatus):
+    """
+    记录本次同步后文档引用的切片指纹集合与状态。
+    """
+    async with async_session() as session:
+        document = await session.scalar(select(Document).where(Document.doc_id == doc_id))
+        document.chunk_hashes = json.dumps(sorted(chunk_hashes))
+        document.chunk_count = chunk_count
+        document.status = status
+        await session.commit()
+
+
+async def get_document(doc_id: str, tenant: Optional[str] = None) -> Optional[Document]:
+    """
+    读取文档记录（不存在或属于其他租户时返回 None）。
+    """
+    async with async_session() as session:
+        document = await session.scalar(select(Document).where(Document.doc_id == doc_id))
+    if document is None or (document.tenant and document.tenant != tenant):
+        return None
+    return document
+
+
+async def mark_indexed(doc_id: str, chunk_hashes: set):
+    """
+    全部切片都已确认写入索引后，将等待确认的文档标记为已索引。
+    期间文档被重新上传（切片集合已变化）时不修改状态。
+    """
+    async with async_session() as session:
+        document = await session.scalar(select(Document).where(Document.doc_id == doc_id))
+        if (
+            document is not None
+            and document.status == DocumentStatus.PENDING
+            and document.chunk_hashes == json.dumps(sorted(chunk_hashes))
+        ):
+            document.status = DocumentStatus.INDEXED
+            await session.commit()
+
+
+class ChunkSync:
+    """
+    一次上传的增量重新索引：
+    - 只有向量服务确认已写入索引的旧切片 (unchanged) 无需发送，其余切片（含上次未确认的）
+      通过 publisher 发送到消息队列；同一文档内重复的切片只发送一次
+    - 上次记录中、本次已不存在的切片 (removed) 在同步完成时从向量库删除
+    """
+
+    def __init__(self, doc_id: str, source: str, previous: set, unchanged: set, publisher):
+        self.doc_id = doc_id
+        self.source = source
+        self.previous = previous
+        self.unchanged = unchanged
+        self.publisher = publisher
+        self.chunk_count = 0
+        self.seen = set()
+        self.published = set()
+
+    @property
+    def removed(self) -> set:
+        return self.previous - self.seen
+
+    async def add(self, chunk: str):
+        """
+        记录一个切片，需要向量化时发送。
+        """
+        fingerprint = content_hash(chunk)
+        if fingerprint not in self.seen:
+            self.seen.add(fingerprint)
+            if fingerprint not in self.unchanged:
+                self.published.add(fingerprint)
+                await self.publisher.add({
+                    "id": f"{self.doc_id}_{self.chunk_count}",
+                    "text": chunk,
+                    "metadata": {
+                        "source": self.source,
+                        "doc_id": self.doc_id,
+                        "chunk_index": self.chunk_count,
+                        "content_hash": fingerprint,
+                    },
+                })
+        self.chunk_count += 1
+
+    async def fail(self):
+        """
+        同步失败：取消未完成的发送，文档标记为 FAILED。
+        已发送的切片也计入记录，下次同步时可以正确删除。
+        """
+        self.publisher.cancel()
+        await finish_sync(self.doc_id, self.previous | self.published, self.chunk_count, DocumentStatus.FAILED)
+
+    async def commit(self) -> DocumentStatus:
+        """
+        删除新版本中已不存在的切片并记录本次同步结果，返回文档状态：
+        有切片等待向量化时为 PENDING（由消费者写入索引后才算完成），否则为 INDEXED。
+        删除失败时文档标记为 FAILED（保留新旧切片，下次同步时重新删除）并抛出异常。
+        """
+        removed = self.removed
+        try:
+            if removed:
+                await vector_client.delete_chunks(self.doc_id, sorted(removed))
+        except Exception:
+            await finish_sync(self.doc_id, self.previous | self.seen, self.chunk_count, DocumentStatus.FAILED)
+            raise
+        status = DocumentStatus.PENDING if self.published else DocumentStatus.INDEXED
+        await finish_sync(self.doc_id, self.seen, self.chunk_count, status)
+        return status
+
+
+async def start_sync(doc_id: str, title: str, tenant: Optional[str], publisher) -> ChunkSync:
+    """
+    开始一次文档同步（文档标记为处理中），查询上次记录的切片中已确认写入索引的部分。
+    只信任向量服务确认已写入的切片；未确认的（仍在队列中、重试中或进入死信队列）重新发送，
+    向量服务按内容去重，已有向量不会重复计算。
+    文档属于其他租户时抛出 PermissionError。
+    """
+    previous = await begin_sync(doc_id, title, tenant)
+    try:
+        unchanged = await vector_client.indexed_chunks(doc_id, sorted(previous))
+    except Exception as e:
+        logger.warning(f"Failed to confirm indexed chunks of {title}, resending all: {e}")
+        unchanged = set()
+    return ChunkSync(doc_id, title, previous, unchanged, publisher)
@@ -0,0 +1,143 @@
+import asyncio
+import codecs
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import UploadFile
+from loguru import logger
+from prometheus_client import Gauge, Histogram
+from backend.shared.core.config import settings
+from backend.knowledge_service.core.parser import count_pdf_pages, extract_pdf_pages
+
+# 上传文件按块读取的大小
+READ_BLOCK_SIZE = 64 * 1024
+
+PARSER_POOL_WORKERS = Gauge(
+    "knowledge_parser_pool_workers",
+    "Worker processes in the document parser pool",
+)
+PARSER_TASKS_IN_FLIGHT = Gauge(
+    "knowledge_parser_tasks_in_flight",
+    "Parse tasks submitted to the process pool and not yet finished",
+)
+PARSER_POOL_SATURATION = Gauge(
+    "knowledge_parser_pool_saturation",
+    "In-flight parse tasks divided by parser pool workers (>1 means tasks are queueing)",
+)
+PARSER_TASK_SECONDS = Histogram(
+    "knowledge_parser_task_seconds",
+    "Parse task latency including time queued for a worker process",
+    ["operation"],
+)
+
+
+class ParserPool:
+    """
+    文档解析进程池。
+    pypdf 解析是纯 Python 的 CPU 密集型任务，放在线程池中会被 GIL 串行化，
+    因此使用独立进程 (spawn) 执行，首次提交任务时才创建进程池。
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._in_flight = 0
+
+    @property
+    def workers(self) -> int:
+        return settings.PARSER_PROCESSES or os.cpu_count() or 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            PARSER_POOL_WORKERS.set(self.workers)
+            logger.info(f"Started document parser pool with {self.workers} processes")
+        return self._executor
+
+    def _track(self, delta: int):
+        self._in_flight += delta
+        PARSER_TASKS_IN_FLIGHT.set(self._in_flight)
+        PARSER_POOL_SATURATION.set(self._in_flight / self.workers)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self._track(1)
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._track(-1)
+            PARSER_TASK_SECONDS.labels(fn.__name__).observe(time.perf_counter() - started)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+parser_pool = ParserPool()
+
+
+def spool_to_disk(fileobj, suffix: str) -> str:
+    """
+    将上传文件复制到命名临时文件（分块复制），供解析子进程按路径打开。
+    """
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(fileobj, tmp, READ_BLOCK_SIZE)
+        return tmp.name
+
+
+async def iter_pdf_pages(path: str):
+    """
+    按页序逐页产出 PDF 文本。
+    文档按 PARSER_PAGES_PER_TASK 页切分为多个页区间并行解析，
+    同时在途的区间数不超过进程数，结果按原始页序产出，内存占用与文档大小无关。
+    """
+    total = await parser_pool.run(count_pdf_pages, path)
+    step = settings.PARSER_PAGES_PER_TASK
+    ranges = iter([(start, min(start + step, total)) for start in range(0, total, step)])
+
+    pending = deque()
+
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range is not None:
+            pending.append(asyncio.ensure_future(parser_pool.run(extract_pdf_pages, path, *page_range)))
+
+    for _ in range(parser_pool.workers):
+        submit_next()
+    try:
+        while pending:
+            texts = await pending.popleft()
+            submit_next()
+            for text in texts:
+                yield text
+    finally:
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_text_file(file: UploadFile):
+    """
+    按块读取 UTF-8 文本文件，增量解码（正确处理跨块的多字节字符）。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        block = await file.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
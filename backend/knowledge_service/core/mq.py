@@ -1,62 +1,131 @@
-import pika
-import json
+import asyncio
+import itertools
+import aio_pika
+from loguru import logger
 from backend.shared.core.config import settings
+from backend.shared.core.mq import EMBEDDING_QUEUE, encode_chunks
 
 
 class RabbitMQProducer:
     """
-    RabbitMQ 生产者封装类。
+    异步 RabbitMQ 生产者 (aio-pika)：
+    - 单个自动重连的连接（只创建一次，断线由 connect_robust 恢复）+ MQ_CHANNEL_POOL_SIZE 个开启发布确认的通道，轮询使用
+    - 同一通道上可并发发布多条消息，broker 确认以流水线方式返回，无需逐条等待
     """
 
     def __init__(self):
         self.connection = None
-        self.channel = None
+        self._channels = []
+        self._cursor = None
+        self._connect_lock = asyncio.Lock()
 
-    def connect(self):
+    async def connect(self):
         """
-        建立 RabbitMQ 连接。
+        首次调用时建立 RabbitMQ 连接和通道池（并发调用只建立一次）。
+        连接由 connect_robust 创建，断线后自动重连并恢复通道，不再重新创建连接（避免遗留旧连接上的通道）；
+        首次连接失败时关闭已建立的连接，下次调用重新尝试。
         """
-        if not self.connection or self.connection.is_closed:
-            credentials = pika.PlainCredentials(
-                settings.RABBITMQ_DEFAULT_USER, settings.RABBITMQ_DEFAULT_PASS
-            )
-            parameters = pika.ConnectionParameters(
+        if self._cursor is not None:
+            return
+        async with self._connect_lock:
+            if self._cursor is not None:
+                return
+            connection = await aio_pika.connect_robust(
                 host=settings.RABBITMQ_HOST,
                 port=settings.RABBITMQ_PORT,
-                credentials=credentials,
+                login=settings.RABBITMQ_DEFAULT_USER,
+                password=settings.RABBITMQ_DEFAULT_PASS,
             )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            # 声明队列，确保其存在
-            self.channel.queue_declare(queue="embedding_queue", durable=True)
+            try:
+                channels = [
+                    await connection.channel(publisher_confirms=True)
+                    for _ in range(settings.MQ_CHANNEL_POOL_SIZE)
+                ]
+                # 声明队列，确保其存在
+                await channels[0].declare_queue(EMBEDDING_QUEUE, durable=True)
+            except Exception:
+                await connection.close()
+                raise
+            self.connection, self._channels = connection, channels
+            self._cursor = itertools.cycle(channels)
+            logger.info(f"RabbitMQ producer connected with {len(channels)} channels")
 
-    def publish(self, message: dict):
+    async def publish_chunks(self, chunks: list):
         """
-        发送消息到队列。
+        将多个切片打包为一条持久化消息发送，并等待 broker 确认。
         """
-        try:
-            if not self.connection or self.connection.is_closed:
-                self.connect()
-
-            self.channel.basic_publish(
-                exchange="",
-                routing_key="embedding_queue",
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent (消息持久化)
-                ),
-            )
-        except (pika.exceptions.ConnectionClosed, pika.exceptions.StreamLostError):
-            # 连接断开时重试一次
-            self.connect()
-            self.channel.basic_publish(
-                exchange="",
-                routing_key="embedding_queue",
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                ),
-            )
+        await self.connect()
+        channel = next(self._cursor)
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                encode_chunks(chunks),
+                content_type="application/json",
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,  # 消息持久化
+            ),
+            routing_key=EMBEDDING_QUEUE,
+        )
+
+    def batch(self) -> "ChunkBatchPublisher":
+        return ChunkBatchPublisher(self)
+
+    async def close(self):
+        async with self._connect_lock:
+            if self.connection:
+                await self.connection.close()
+            self.connection, self._channels, self._cursor = None, [], None
+
+
+class ChunkBatchPublisher:
+    """
+    单次上传的切片发布器：
+    - 每 MQ_CHUNKS_PER_MESSAGE 个切片打包为一条消息
+    - 消息发出后不阻塞等待确认，未确认的消息最多 MQ_MAX_UNCONFIRMED 条（流水线确认），
+      达到上限时 add() 等待，形成背压
+    - flush() 发送剩余切片并等待全部确认，任一消息发布失败时抛出异常
+    - cancel() 在上传失败时丢弃未发送的切片并取消仍在等待确认的发布
+    """
+
+    def __init__(self, producer: RabbitMQProducer):
+        self._producer = producer
+        self._chunks = []
+        self._pending = set()
+        self._semaphore = asyncio.Semaphore(settings.MQ_MAX_UNCONFIRMED)
+        self._error = None
+
+    async def add(self, chunk: dict):
+        self._raise_if_failed()
+        self._chunks.append(chunk)
+        if len(self._chunks) >= settings.MQ_CHUNKS_PER_MESSAGE:
+            await self._send()
+
+    async def flush(self):
+        if self._chunks:
+            await self._send()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        self._raise_if_failed()
+
+    def cancel(self):
+        self._chunks = []
+        for task in list(self._pending):
+            task.cancel()
+
+    async def _send(self):
+        chunks, self._chunks = self._chunks, []
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._producer.publish_chunks(chunks))
+        self._pending.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._pending.discard(task)
+        self._semaphore.release()
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
 
 
 producer = RabbitMQProducer()
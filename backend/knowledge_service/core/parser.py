@@ -0,0 +1,26 @@
+from loguru import logger
+from pypdf import PdfReader
+
+# 注意：本模块中的函数在解析进程池的子进程中执行，只依赖可序列化的参数（文件路径与页码）。
+
+
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> list:
+    """
+    提取 [start, end) 页的文本，返回按页顺序排列的非空页面文本。
+    单页提取失败时跳过该页并继续。
+    """
+    reader = PdfReader(path)
+    texts = []
+    for page_number in range(start, end):
+        try:
+            page_text = reader.pages[page_number].extract_text()
+        except Exception as e:
+            logger.warning(f"Failed to extract PDF page {page_number}: {e}")
+            continue
+        if page_text:
+            texts.append(page_text + "\n")
+    return texts
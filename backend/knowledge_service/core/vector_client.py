@@ -0,0 +1,36 @@
+from backend.shared.rpc import vector_pb2, vector_pb2_grpc
+from backend.shared.core.grpc_pool import AsyncGrpcClient
+
+
+class VectorServiceClient(AsyncGrpcClient):
+    """
+    向量服务 gRPC 客户端。
+    文档重新索引时删除已不存在的切片、查询切片是否已完成向量化（新增切片仍经消息队列异步向量化）。
+    """
+    stub_class = vector_pb2_grpc.VectorServiceStub
+
+    def __init__(self):
+        super().__init__("vector-service", "localhost:50051")
+
+    async def delete_chunks(self, doc_id: str, ids: list):
+        """
+        移除文档对这些切片的引用，无引用的切片从索引中删除。
+        """
+        stub = await self.get_stub()
+        request = vector_pb2.DeleteChunksRequest(doc_id=doc_id, ids=ids)
+        return await stub.DeleteChunks(request, timeout=self.timeout)
+
+
+    async def indexed_chunks(self, doc_id: str, ids: list) -> set:
+        """
+        返回其中已写入索引并登记了该文档引用的切片指纹。
+        """
+        if not ids:
+            return set()
+        stub = await self.get_stub()
+        request = vector_pb2.IndexedChunksRequest(doc_id=doc_id, ids=ids)
+        response = await stub.IndexedChunks(request, timeout=self.timeout)
+        return set(response.ids)
+
+
+vector_client = VectorServiceClient()
@@ -0,0 +1,122 @@
+import sys
+import os
+import argparse
+import pika
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from backend.shared.core.config import settings
+from backend.shared.core.mq import (
+    ATTEMPTS_HEADER,
+    DEAD_LETTER_QUEUE,
+    EMBEDDING_QUEUE,
+    ERROR_HEADER,
+    OUTAGE_RETRIES_HEADER,
+    decode_chunks,
+)
+from loguru import logger
+
+
+def connect():
+    credentials = pika.PlainCredentials(
+        settings.RABBITMQ_DEFAULT_USER, settings.RABBITMQ_DEFAULT_PASS
+    )
+    parameters = pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        credentials=credentials,
+    )
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+    return connection, channel
+
+
+def fetch(channel, limit: int):
+    """
+    从死信队列取出最多 limit 条消息（不自动确认）。
+    未 ack 的消息在连接关闭后由 broker 放回死信队列。
+    """
+    messages = []
+    while len(messages) < limit:
+        method, properties, body = channel.basic_get(queue=DEAD_LETTER_QUEUE, auto_ack=False)
+        if method is None:
+            break
+        messages.append((method, properties, body))
+    return messages
+
+
+def describe(properties, body) -> str:
+    headers = properties.headers or {}
+    try:
+        chunks = decode_chunks(body)
+        sources = sorted({str(chunk.get("metadata", {}).get("source", "")) for chunk in chunks})
+        summary = f"{len(chunks)} chunks, sources={sources}, first_id={chunks[0]['id'] if chunks else None}"
+    except Exception as e:
+        summary = f"undecodable body ({len(body)} bytes): {e}"
+    return (
+        f"attempts={headers.get(ATTEMPTS_HEADER)} outage_retries={headers.get(OUTAGE_RETRIES_HEADER)} "
+        f"error={headers.get(ERROR_HEADER)!r} | {summary}"
+    )
+
+
+def inspect(channel, limit: int):
+    messages = fetch(channel, limit)
+    for index, (_, properties, body) in enumerate(messages, 1):
+        print(f"[{index}] {describe(properties, body)}")
+    print(f"{len(messages)} message(s) shown, {DEAD_LETTER_QUEUE} unchanged")
+
+
+def replay(channel, limit: int):
+    """
+    将死信消息重新发布到主队列（清除重试次数，重新开始计数），broker 确认后再从死信队列删除。
+    """
+    channel.confirm_delivery()
+    messages = fetch(channel, limit)
+    for method, properties, body in messages:
+        channel.basic_publish(
+            exchange="",
+            routing_key=EMBEDDING_QUEUE,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.content_type or "application/json",
+                delivery_mode=pika.DeliveryMode.Persistent,
+            ),
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+    logger.info(f"Replayed {len(messages)} message(s) from {DEAD_LETTER_QUEUE} to {EMBEDDING_QUEUE}")
+
+
+def purge(channel):
+    result = channel.queue_purge(queue=DEAD_LETTER_QUEUE)
+    logger.info(f"Purged {result.method.message_count} message(s) from {DEAD_LETTER_QUEUE}")
+
+
+def main():
+    """
+    向量化任务死信队列工具：
+    - inspect：查看死信消息（重试次数、最后一次错误、切片来源），不改变队列
+    - replay：修复问题后将死信消息重新投递到主队列
+    - purge：清空死信队列
+    """
+    parser = argparse.ArgumentParser(description=f"Inspect and replay messages in {DEAD_LETTER_QUEUE}")
+    parser.add_argument("command", choices=("inspect", "replay", "purge"))
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    connection, channel = connect()
+    try:
+        if args.command == "inspect":
+            inspect(channel, args.limit)
+        elif args.command == "replay":
+            replay(channel, args.limit)
+        else:
+            purge(channel)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import sys
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+from loguru import logger
 
 sys.path.append(
     os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -13,6 +15,11 @@ from backend.shared.telemetry.logging import setup_logging
 from backend.shared.telemetry.tracing import setup_tracing, instrument_app
 from backend.shared.telemetry.metrics import setup_metrics
 from backend.knowledge_service.core.mq import producer
+from backend.knowledge_service.core.ingest import parser_pool
+from backend.knowledge_service.core.db import engine
+from backend.knowledge_service.core.vector_client import vector_client
+from backend.shared.models.base import Base
+from backend.shared.core.tokenizer import tokenizer
 from backend.shared.core.discovery import registry, get_local_ip
 
 
@@ -25,10 +32,19 @@ setup_tracing("knowledge-service")
 async def lifespan(app: FastAPI):
     """
     生命周期管理器：
-    - 启动时：连接 RabbitMQ、注册服务到 Nacos
-    - 关闭时：注销服务、关闭 RabbitMQ 连接
+    - 启动时：初始化文档表、连接 RabbitMQ 和向量服务、预加载切片用的分词器、注册服务到 Nacos
+    - 关闭时：注销服务、关闭 RabbitMQ 连接、gRPC 通道、数据库连接和文档解析进程池
     """
-    producer.connect()
+    # 初始化数据库表（开发环境便利性）；MySQL 不可用时记录错误，服务照常启动，上传请求在访问数据库时失败
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    except Exception as e:
+        logger.error(f"Failed to initialize document tables: {e}")
+
+    await producer.connect()
+    await vector_client.start()
+    await asyncio.to_thread(tokenizer.load)
 
     # 注册服务到 Nacos
     ip = get_local_ip()
@@ -40,8 +56,11 @@ async def lifespan(app: FastAPI):
     # 注销服务
     registry.deregister_service("knowledge-service", ip, port)
 
-    if producer.connection:
-        producer.connection.close()
+    await producer.close()
+    await vector_client.close()
+    await engine.dispose()
+
+    parser_pool.shutdown()
 
 
 app = FastAPI(title="Knowledge Service", lifespan=lifespan)
@@ -1,7 +1,6 @@
 import sys
 import os
 import pika
-import json
 import grpc
 import time
 sys.path.append(
@@ -11,8 +10,19 @@ sys.path.append(
 from backend.shared.core.config import settings
 from backend.shared.rpc import vector_pb2, vector_pb2_grpc
 from backend.shared.core.discovery import registry
+from backend.shared.core.balancer import get_balancer, healthy_instances
+from backend.shared.core.mq import (
+    ATTEMPTS_HEADER,
+    EMBEDDING_QUEUE,
+    OUTAGE_CODES,
+    OUTAGE_RETRIES_HEADER,
+    decode_chunks,
+    encode_chunks,
+    failure_headers,
+    is_outage,
+    topology,
+)
 from loguru import logger
-import random
 
 
 def consume():
@@ -43,58 +53,107 @@ def consume():
             time.sleep(5)
 
     channel = connection.channel()
-    channel.queue_declare(queue="embedding_queue", durable=True)
-
-    # 连接向量服务 gRPC (通过 Nacos 服务发现)
-    target = "localhost:50051"  # Default fallback
-    try:
-        instances = registry.get_service("vector-service")
-        hosts = instances.get("hosts", []) if isinstance(instances, dict) else instances
-        healthy = [
-            i for i in hosts if i.get("healthy", True) and i.get("enabled", True)
-        ]
-        if healthy:
-            inst = random.choice(healthy)
-            target = f"{inst['ip']}:{inst['port']}"
-            logger.info(f"Discovered Vector Service at {target}")
-        else:
-            logger.warning("No healthy Vector Service found in Nacos, using default.")
-    except Exception as e:
-        logger.error(f"Failed to discover Vector Service: {e}")
-
-    logger.info(f"Connecting to Vector Service at {target}...")
-    channel_grpc = grpc.insecure_channel(target)
-    stub = vector_pb2_grpc.VectorServiceStub(channel_grpc)
+    # 发布确认：失败消息确认写入重试/死信队列后才 ack 原消息
+    channel.confirm_delivery()
+    for name, arguments in topology():
+        channel.queue_declare(queue=name, durable=True, arguments=arguments)
 
-    def callback(ch, method, properties, body):
+    # 连接向量服务 gRPC：通过 Nacos 服务发现，每条消息由负载均衡器按延迟选择实例
+    balancer = get_balancer("vector-service")
+    stubs = {}
+
+    def get_stub():
+        try:
+            healthy = healthy_instances(registry.get_service("vector-service"))
+            if not healthy:
+                logger.warning("No healthy Vector Service found in Nacos, using default.")
+            balancer.update(healthy)
+        except Exception as e:
+            logger.error(f"Failed to discover Vector Service: {e}")
+
+        target = balancer.pick("localhost:50051")  # Default fallback
+        if target not in stubs:
+            logger.info(f"Connecting to Vector Service at {target}...")
+            stubs[target] = vector_pb2_grpc.VectorServiceStub(grpc.insecure_channel(target))
+        return target, stubs[target]
+
+    def reroute(ch, method, properties, body, error, outage: bool = False):
         """
-        RabbitMQ 消息回调函数。
+        将失败的消息发往按指数退避的重试队列，次数用尽后发往死信队列，然后 ack 原消息。
+        下游服务不可用时发往 outage 重试队列，不消耗消息的重试次数。
         """
+        route, headers = failure_headers(properties.headers, error, outage=outage)
         try:
-            message = json.loads(body)
-            logger.info(f"Processing chunk: {message['id']}")
-
-            # 调用向量服务进行 Upsert 操作
-            request = vector_pb2.UpsertRequest(
-                id=message["id"], text=message["text"], metadata=message["metadata"]
+            ch.basic_publish(
+                exchange="",
+                routing_key=route,
+                body=body,
+                properties=pika.BasicProperties(
+                    headers=headers,
+                    content_type="application/json",
+                    delivery_mode=pika.DeliveryMode.Persistent,
+                ),
             )
+        except Exception as e:
+            logger.error(f"Failed to reroute message to {route}: {e}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        logger.warning(
+            f"Message rerouted to {route} (attempt {headers[ATTEMPTS_HEADER]}, "
+            f"outage retry {headers[OUTAGE_RETRIES_HEADER]})"
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-            response = stub.Upsert(request)
-
-            if response.success:
-                logger.info(f"Successfully indexed chunk {message['id']}")
+    def callback(ch, method, properties, body):
+        """
+        RabbitMQ 消息回调函数。
+        """
+        try:
+            chunks = decode_chunks(body)
+            logger.info(f"Processing {len(chunks)} chunks")
+
+            # 一条消息可包含多个切片，通过 BatchUpsert 流式 RPC 一次写入
+            requests = [
+                vector_pb2.UpsertRequest(
+                    id=chunk["id"],
+                    text=chunk["text"],
+                    metadata={k: str(v) for k, v in chunk["metadata"].items()},
+                )
+                for chunk in chunks
+            ]
+            target, stub = get_stub()
+            started = time.perf_counter()
+            balancer.acquire(target)
+            try:
+                # 设置调用期限：向量服务挂起时不会无限期阻塞消费者
+                response = stub.BatchUpsert(iter(requests), timeout=settings.MQ_CONSUMER_TIMEOUT)
+            except Exception as e:
+                # 只有实例不可用（连接失败、调用超时）计入延迟惩罚和熔断器
+                failed = isinstance(e, grpc.RpcError) and e.code() in OUTAGE_CODES
+                balancer.release(target, time.perf_counter() - started, failed=failed)
+                raise
+            balancer.release(target, time.perf_counter() - started)
+
+            failed = [r for r in response.results if not r.success]
+            if not failed:
+                logger.info(f"Successfully indexed {len(chunks)} chunks")
                 ch.basic_ack(delivery_tag=method.delivery_tag)
             else:
-                logger.error(f"Failed to index chunk {message['id']}: {response.error}")
+                for result in failed:
+                    logger.error(f"Failed to index chunk {result.id}: {result.error}")
 
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                # 只重试失败的切片
+                failed_ids = {r.id for r in failed}
+                retry_chunks = [chunk for chunk in chunks if chunk["id"] in failed_ids]
+                outage = all(r.outage for r in failed)
+                reroute(ch, method, properties, encode_chunks(retry_chunks), failed[0].error, outage)
 
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            reroute(ch, method, properties, body, e, is_outage(e))
 
     channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue="embedding_queue", on_message_callback=callback)
+    channel.basic_consume(queue=EMBEDDING_QUEUE, on_message_callback=callback)
 
     logger.info("Knowledge Worker is waiting for messages...")
     channel.start_consuming()
@@ -1,10 +1,17 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from backend.shared.core.llm_factory import get_llm_client
 from backend.shared.core.config import settings
 from backend.rag_engine.core.vector_client import vector_client
 from backend.rag_engine.core.cost_client import cost_client
+from backend.rag_engine.core.answer_cache import answer_cache
+from backend.rag_engine.core.context_packer import pack_prompt
 from loguru import logger
+from dataclasses import dataclass, field
+from typing import Optional
+import asyncio
+import time
 import uuid
 import json
 from redis.asyncio import Redis
@@ -17,128 +24,353 @@ redis_client = Redis(
     decode_responses=True
 )
 
+PROMPT_TEMPLATE = """你是一个专业的企业级智能知识库助手。你的任务是基于提供的【上下文信息】来回答用户的提问。 
+ 
+     ### 核心原则 
+     1. **严格基于上下文**：你的所有回答必须完全依据下方的【上下文信息】。严禁利用你原本的训练数据进行编造或发散。 
+     2. **诚实兜底**：如果【上下文信息】中没有包含回答用户问题所需的知识，请直接回答：“抱歉，当前的知识库中没有关于该问题的记录，请联系人工客服。” 不要尝试编造答案。 
+     3. **格式规范**： 
+        - 使用清晰的 Markdown 格式。 
+        - 如果信息包含步骤，请使用编号列表 (1. 2. 3.)。 
+        - 如果信息包含多个要点，请使用无序列表 (- )。 
+     4. **语言风格**：保持专业、客观、简洁，语气亲切。 
+ 
+     ### 上下文信息 (Context) 
+     {context} 
+     """
+
+# 大模型欠费或访问被拒绝时返回的测试应答
+MOCK_ANSWER = "【系统提示】由于底层大模型服务（阿里云 DashScope）账户欠费或访问被拒绝，无法生成智能回答。\n\n这是一条自动生成的测试响应，用于验证系统链路畅通。请联系管理员检查 API 额度。"
+
+# SSE 响应头：禁止缓存以及反向代理（如 Nginx）缓冲
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
 class ChatRequest(BaseModel):
     query: str
     user_id: str
+    session_id: Optional[str] = None  # 会话 ID，不传时使用用户的默认会话
+    stream: bool = False
+    debug: bool = False
 
 
 class ChatResponse(BaseModel):
     answer: str
     sources: list
+    timings: Optional[dict] = None  # 调试模式下返回各阶段耗时 (毫秒)
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@dataclass
+class ChatTurn:
     """
-    RAG 对话接口。
-    编排 RAG 流程：费用检查 -> 知识检索 -> LLM 生成。
-    使用 Saga 模式（简化版）处理分布式事务。
+    单轮对话在编排过程中的上下文状态。
     """
-    logger.info(f"Received chat request from {request.user_id}: {request.query}")
+    request: ChatRequest
+    transaction_id: str
+    estimated_tokens: int
+    history_key: str
+    history: list = field(default_factory=list)
+    sources: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    cache_key: Optional[str] = None
+    context_key: Optional[str] = None
+    query_embedding: Optional[list] = None
+
+
+def is_llm_unavailable(e: Exception) -> bool:
+    """
+    判断大模型调用异常是否属于欠费/拒绝访问等可降级的错误。
+    """
+    return "Arrearage" in str(e) or "Access denied" in str(e) or "400" in str(e)
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
 
-    # 第一步：检查余额并预扣费（乐观锁策略）
-    transaction_id = str(uuid.uuid4())
-    estimated_tokens = 100  # Simplified token estimation (简化估算)
+async def timed(timings: dict, stage: str, awaitable):
+    """
+    等待 awaitable 完成，并将该阶段耗时（毫秒）记录到 timings 中。
+    """
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = elapsed_ms(started)
+
+
+def finish_timings(turn: ChatTurn) -> Optional[dict]:
+    """
+    仅在调试模式下返回各阶段耗时明细（含总耗时）。
+    """
+    if not turn.request.debug:
+        return None
+    turn.timings["total"] = elapsed_ms(turn.started)
+    return turn.timings
 
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    按 Server-Sent Events 格式编码一条事件。
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def refund(turn: ChatTurn):
+    """
+    补偿事务：回滚本轮预扣的费用。
+    退款失败（如费用服务不可用或熔断中）只记录日志，不覆盖调用方要返回给客户端的原始错误。
+    """
     try:
-        # 调用 Cost Service 进行扣费
-        deduct_res = cost_client.deduct(
-            request.user_id, estimated_tokens, settings.LLM_MODEL, transaction_id
+        await cost_client.refund(
+            turn.request.user_id, turn.estimated_tokens, settings.LLM_MODEL, turn.transaction_id
         )
-        if not deduct_res.success:
-            logger.warning(
-                f"Deduction failed for {request.user_id}: {deduct_res.message}"
-            )
-            raise HTTPException(
-                status_code=402, detail=f"Insufficient funds: {deduct_res.message}"
-            )
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"Cost service failed: {e}")
-        raise HTTPException(status_code=500, detail="Cost service unavailable")
+        logger.error(f"Refund failed for transaction {turn.transaction_id}: {e}")
+
+
+def history_key(request: ChatRequest) -> str:
+    if request.session_id:
+        return f"chat_turns:{request.user_id}:{request.session_id}"
+    return f"chat_turns:{request.user_id}"
+
+
+def decode_history(raw_turns: list) -> list:
+    """
+    将 Redis 列表中的轮次（紧凑 JSON 数组 [问题, 回答]）还原为对话消息列表。
+    """
+    history = []
+    for raw in raw_turns:
+        query, answer = json.loads(raw)
+        history.append({"role": "user", "content": query})
+        history.append({"role": "assistant", "content": answer})
+    return history
+
+
+async def load_history(turn: ChatTurn) -> tuple:
+    """
+    一次往返读取最近 HISTORY_MAX_TURNS 轮历史和知识库版本号。
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.lrange(turn.history_key, -settings.HISTORY_MAX_TURNS, -1)
+        pipe.get(settings.KB_VERSION_KEY)
+        raw_turns, kb_version = await pipe.execute()
+    return decode_history(raw_turns), kb_version
 
-    # 第二步：从向量服务检索上下文
+
+async def save_history(turn: ChatTurn, answer: str):
+    """
+    将本轮问答追加到 Redis 历史列表末尾 (RPUSH)，并裁剪为最近 HISTORY_MAX_TURNS 轮。
+    只写入本轮数据，同一用户的并发请求不会互相覆盖。
+    """
+    record = json.dumps([turn.request.query, answer], ensure_ascii=False, separators=(",", ":"))
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.rpush(turn.history_key, record)
+        pipe.ltrim(turn.history_key, -settings.HISTORY_MAX_TURNS, -1)
+        pipe.expire(turn.history_key, settings.HISTORY_TTL)
+        await pipe.execute()
+
+
+def cache_answer(turn: ChatTurn, answer: str):
+    if settings.ANSWER_CACHE_ENABLED and answer:
+        answer_cache.put(turn.cache_key, turn.context_key, answer, turn.query_embedding)
+
+
+async def stream_chat(turn: ChatTurn, messages: list, cached_answer: Optional[str] = None):
+    """
+    流式生成回答 (SSE)：
+    1. 首先推送检索到的来源 (sources 事件)
+    2. 逐 token 转发大模型输出 (delta 事件)，命中回答缓存时一次性推送
+    3. 生成结束后写入 Redis 历史记录并推送 done 事件
+    """
+    yield sse_event("sources", {"sources": turn.sources})
+
+    answer_parts = []
+    if cached_answer is not None:
+        answer_parts.append(cached_answer)
+        yield sse_event("delta", {"content": cached_answer})
+    else:
+        llm_started = time.perf_counter()
+        try:
+            client = get_llm_client()
+            response = await client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+            )
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not answer_parts:
+                        turn.timings["first_token"] = elapsed_ms(llm_started)
+                    answer_parts.append(delta)
+                    yield sse_event("delta", {"content": delta})
+            cache_answer(turn, "".join(answer_parts))
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}")
+
+            # 尚未输出任何内容时，沿用非流式模式的欠费降级应答
+            if not answer_parts and is_llm_unavailable(e):
+                answer_parts.append(MOCK_ANSWER)
+                yield sse_event("delta", {"content": MOCK_ANSWER})
+            else:
+                await refund(turn)
+                yield sse_event("error", {"detail": f"LLM generation failed: {str(e)}"})
+                return
+        turn.timings["llm"] = elapsed_ms(llm_started)
+
+    answer = "".join(answer_parts)
     try:
-        search_response = vector_client.search(request.query)
-        context_texts = []
-        sources = []
-        for result in search_response.results:
-            context_texts.append(result.content)
-            sources.append(result.metadata.get("source", "unknown"))
-
-        context_str = "\n\n".join(context_texts)
-        logger.info(f"Retrieved {len(context_texts)} chunks")
+        await timed(turn.timings, "save_history", save_history(turn, answer))
     except Exception as e:
-        logger.error(f"Retrieval failed: {e}")
+        logger.error(f"Failed to save chat history: {e}")
+
+    done = {"answer": answer, "sources": turn.sources}
+    if turn.request.debug:
+        done["timings"] = finish_timings(turn)
+    yield sse_event("done", done)
 
-        # 补偿事务：如果检索失败，回滚扣费（退款）
-        cost_client.refund(
-            request.user_id, estimated_tokens, settings.LLM_MODEL, transaction_id
+
+@router.post("/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat(request: ChatRequest):
+    """
+    RAG 对话接口。
+    编排 RAG 流程：(费用检查 | 知识检索 | 历史读取) 并发执行 -> Prompt 打包 -> 回答缓存 -> LLM 生成。
+    使用 Saga 模式（简化版）处理分布式事务。
+    当 request.stream 为 True 时，以 SSE 形式逐 token 返回回答；
+    当 request.debug 为 True 时，返回各阶段耗时明细。
+    """
+    logger.info(f"Received chat request from {request.user_id}: {request.query}")
+
+    turn = ChatTurn(
+        request=request,
+        transaction_id=str(uuid.uuid4()),
+        estimated_tokens=100,  # Simplified token estimation (简化估算)
+        history_key=history_key(request),
+    )
+    semantic_cache = settings.ANSWER_CACHE_ENABLED and settings.ANSWER_CACHE_SEMANTIC_ENABLED
+
+    # 第一步：预扣费、知识检索、读取历史记录（及知识库版本号）互不依赖，并发执行
+    stages = [
+        timed(
+            turn.timings,
+            "deduct",
+            cost_client.deduct(
+                request.user_id, turn.estimated_tokens, settings.LLM_MODEL, turn.transaction_id
+            ),
+        ),
+        timed(
+            turn.timings,
+            "retrieval",
+            # 语义缓存复用检索时计算的问题向量，不再单独调用 EmbedText
+            vector_client.search(
+                request.query,
+                settings.RETRIEVAL_TOP_K,
+                settings.RETRIEVAL_MIN_SCORE,
+                include_vector=semantic_cache,
+            ),
+        ),
+        timed(turn.timings, "history", load_history(turn)),
+    ]
+    deduct_res, search_res, history_res = await asyncio.gather(*stages, return_exceptions=True)
+
+    # 第二步：校验扣费结果（乐观锁策略）
+    if isinstance(deduct_res, Exception):
+        logger.error(f"Cost service failed: {deduct_res}")
+        raise HTTPException(status_code=500, detail="Cost service unavailable")
+    if not deduct_res.success:
+        logger.warning(
+            f"Deduction failed for {request.user_id}: {deduct_res.message}"
         )
+        raise HTTPException(
+            status_code=402, detail=f"Insufficient funds: {deduct_res.message}"
+        )
+
+    # 补偿事务：扣费成功后，检索或历史读取任一环节失败都需要回滚扣费（退款）
+    if isinstance(search_res, Exception):
+        logger.error(f"Retrieval failed: {search_res}")
+        await refund(turn)
         raise HTTPException(status_code=500, detail="Retrieval failed")
+    if isinstance(history_res, Exception):
+        logger.error(f"History fetch failed: {history_res}")
+        await refund(turn)
+        raise HTTPException(status_code=500, detail="History fetch failed")
+
+    turn.history, kb_version = history_res
 
-    # 第三步：构建 Prompt 并调用大模型 (Qwen)
     try:
-        PROMPT_TEMPLATE = """你是一个专业的企业级智能知识库助手。你的任务是基于提供的【上下文信息】来回答用户的提问。 
- 
-     ### 核心原则 
-     1. **严格基于上下文**：你的所有回答必须完全依据下方的【上下文信息】。严禁利用你原本的训练数据进行编造或发散。 
-     2. **诚实兜底**：如果【上下文信息】中没有包含回答用户问题所需的知识，请直接回答：“抱歉，当前的知识库中没有关于该问题的记录，请联系人工客服。” 不要尝试编造答案。 
-     3. **格式规范**： 
-        - 使用清晰的 Markdown 格式。 
-        - 如果信息包含步骤，请使用编号列表 (1. 2. 3.)。 
-        - 如果信息包含多个要点，请使用无序列表 (- )。 
-     4. **语言风格**：保持专业、客观、简洁，语气亲切。 
- 
-     ### 上下文信息 (Context) 
-     {context} 
-     """
-        system_content = PROMPT_TEMPLATE.replace("{context}", context_str)
-        
-        # 从 Redis 获取历史对话记录
-        history_key = f"chat_history:{request.user_id}"
-        history_json = await redis_client.get(history_key)
-        history = json.loads(history_json) if history_json else []
-        
-        # 构建消息列表
-        messages = [{"role": "system", "content": system_content}]
-        messages.extend(history)
-        
-        messages.append({"role": "user", "content": request.query})
-
-        client = get_llm_client()
-        response = await client.chat.completions.create(
-            model=settings.LLM_MODEL,
-            messages=messages,
-            temperature=0.7,
-            stream=False,
+        # 第三步：在 token 预算内组装 Prompt（去除重复切片，优先裁剪最早的历史轮次）
+        packed = pack_prompt(PROMPT_TEMPLATE, request.query, list(search_res.results), turn.history)
+        chunk_ids = [chunk.id for chunk in packed.chunks]
+        turn.sources = [chunk.metadata.get("source", "unknown") for chunk in packed.chunks]
+        logger.info(
+            f"Retrieved {len(search_res.results)} chunks, packed {len(packed.chunks)} "
+            f"into {packed.prompt_tokens} prompt tokens"
         )
-        answer = response.choices[0].message.content
-        
-        history.append({"role": "user", "content": request.query})
-        history.append({"role": "assistant", "content": answer})
-        
-        await redis_client.set(history_key, json.dumps(history), ex=3600)
 
-        return ChatResponse(answer=answer, sources=sources)
+        # 第四步：查询回答缓存（检索响应未携带问题向量时仅退化为精确匹配）
+        cached_answer = None
+        if settings.ANSWER_CACHE_ENABLED:
+            if semantic_cache and search_res.query_vector:
+                turn.query_embedding = list(search_res.query_vector)
+            # 打包进 Prompt 的历史对话（系统提示与当前问题之间的消息）同样决定回答内容
+            turn.context_key = answer_cache.context_key(
+                chunk_ids, settings.LLM_MODEL, request.user_id, packed.messages[1:-1]
+            )
+            turn.cache_key = answer_cache.make_key(request.query, turn.context_key)
+            answer_cache.sync_version(kb_version)
+            cached_answer = answer_cache.get(turn.cache_key, turn.context_key, turn.query_embedding)
+    except Exception as e:
+        logger.error(f"Prompt assembly failed: {e}")
+        await refund(turn)
+        raise HTTPException(status_code=500, detail="Prompt assembly failed")
+
+    # 第五步：调用大模型 (Qwen)
+    try:
+        messages = packed.messages
+
+        if request.stream:
+            return StreamingResponse(
+                stream_chat(turn, messages, cached_answer),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS,
+            )
+
+        if cached_answer is not None:
+            answer = cached_answer
+        else:
+            client = get_llm_client()
+            response = await timed(
+                turn.timings,
+                "llm",
+                client.chat.completions.create(
+                    model=settings.LLM_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    stream=False,
+                ),
+            )
+            answer = response.choices[0].message.content
+            cache_answer(turn, answer)
 
     except Exception as e:
         logger.error(f"LLM call failed: {e}")
 
         # Fallback for Arrearage (Overdue Payment) or other API errors during LLM call
         # 针对大模型欠费或其他调用错误的降级处理
-        if "Arrearage" in str(e) or "Access denied" in str(e) or "400" in str(e):
-             mock_answer = "【系统提示】由于底层大模型服务（阿里云 DashScope）账户欠费或访问被拒绝，无法生成智能回答。\n\n这是一条自动生成的测试响应，用于验证系统链路畅通。请联系管理员检查 API 额度。"
-             
-             # Still record history for testing flow
-             history.append({"role": "user", "content": request.query})
-             history.append({"role": "assistant", "content": mock_answer})
-             await redis_client.set(history_key, json.dumps(history), ex=3600)
-             
-             return ChatResponse(answer=mock_answer, sources=sources)
-
-        cost_client.refund(
-            request.user_id, estimated_tokens, settings.LLM_MODEL, transaction_id
-        )
-        raise HTTPException(status_code=500, detail=f"LLM generation failed: {str(e)}")
+        if not is_llm_unavailable(e):
+            await refund(turn)
+            raise HTTPException(status_code=500, detail=f"LLM generation failed: {str(e)}")
+        answer = MOCK_ANSWER
+
+    # 回答已经生成（降级应答同样记录历史以便测试流程），历史写入失败只记录日志，不退款也不影响返回
+    try:
+        await timed(turn.timings, "save_history", save_history(turn, answer))
+    except Exception as e:
+        logger.error(f"Failed to save chat history: {e}")
+
+    return ChatResponse(answer=answer, sources=turn.sources, timings=finish_timings(turn))
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+from prometheus_client import Counter, Gauge
+from backend.shared.core.config import settings
+
+ANSWER_CACHE_REQUESTS = Counter(
+    "rag_answer_cache_requests_total",
+    "Answer cache lookups by tier and result",
+    ["tier", "result"],
+)
+ANSWER_CACHE_ENTRIES = Gauge("rag_answer_cache_entries", "Number of cached answers")
+ANSWER_CACHE_INVALIDATIONS = Counter(
+    "rag_answer_cache_invalidations_total",
+    "Answer cache flushes caused by knowledge base updates",
+)
+
+_PUNCTUATION = re.compile(r"[\s?？!！。.,，;；:：]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化用户问题：去除首尾空白和句末标点、合并空白、统一小写。
+    """
+    query = _WHITESPACE.sub(" ", query.strip().lower())
+    return _PUNCTUATION.sub("", query)
+
+
+def cosine_similarity(a: list, b: list) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class CacheEntry:
+    __slots__ = ("answer", "context_key", "embedding", "expires_at")
+
+    def __init__(self, answer: str, context_key: str, embedding: Optional[list], expires_at: float):
+        self.answer = answer
+        self.context_key = context_key
+        self.embedding = embedding
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    大模型回答缓存（进程内 LRU + TTL）。
+    - 精确匹配：键为 (归一化问题, 检索到的切片 ID, 模型, 用户, 打包进 Prompt 的历史对话)
+    - 语义匹配（可选）：上下文键相同且问题向量余弦相似度超过阈值时复用回答
+    - 知识库版本号变化时整体失效
+    回答依赖 Prompt 中的历史对话，因此缓存只在同一用户、相同历史的请求之间复用。
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._by_context = {}
+        self._kb_version = None
+
+    @staticmethod
+    def context_key(chunk_ids: list, model: str, user_id: str = "", history: list = ()) -> str:
+        """
+        上下文键：相同的切片集合、模型、用户与历史对话才允许复用回答。
+        :param history: 实际打包进 Prompt 的 user/assistant 消息列表
+        """
+        history_digest = hashlib.sha256(
+            json.dumps([[m["role"], m["content"]] for m in history], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        raw = json.dumps([sorted(chunk_ids), model, user_id, history_digest])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(query: str, context_key: str) -> str:
+        raw = json.dumps([normalize_query(query), context_key], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def sync_version(self, kb_version: Optional[str]):
+        """
+        与 Redis 中的知识库版本号对齐，版本变化时清空缓存。
+        """
+        if kb_version != self._kb_version:
+            if self._entries:
+                ANSWER_CACHE_INVALIDATIONS.inc()
+            self.clear()
+            self._kb_version = kb_version
+
+    def clear(self):
+        self._entries.clear()
+        self._by_context.clear()
+        ANSWER_CACHE_ENTRIES.set(0)
+
+    def get(self, key: str, context_key: str, embedding: Optional[list] = None) -> Optional[str]:
+        """
+        先查精确匹配，未命中且提供了问题向量时再查语义匹配。
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            self._entries.move_to_end(key)
+            ANSWER_CACHE_REQUESTS.labels("exact", "hit").inc()
+            return entry.answer
+        if entry is not None:
+            self._remove(key)
+        ANSWER_CACHE_REQUESTS.labels("exact", "miss").inc()
+
+        if embedding is None or not settings.ANSWER_CACHE_SEMANTIC_ENABLED:
+            return None
+
+        best_key, best_score = None, settings.ANSWER_CACHE_SEMANTIC_THRESHOLD
+        for candidate_key in list(self._by_context.get(context_key, ())):
+            candidate = self._entries[candidate_key]
+            if candidate.expires_at <= now:
+                self._remove(candidate_key)
+                continue
+            if candidate.embedding is None:
+                continue
+            score = cosine_similarity(embedding, candidate.embedding)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+
+        if best_key is None:
+            ANSWER_CACHE_REQUESTS.labels("semantic", "miss").inc()
+            return None
+        self._entries.move_to_end(best_key)
+        ANSWER_CACHE_REQUESTS.labels("semantic", "hit").inc()
+        return self._entries[best_key].answer
+
+    def put(self, key: str, context_key: str, answer: str, embedding: Optional[list] = None):
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + settings.ANSWER_CACHE_TTL
+        self._entries[key] = CacheEntry(answer, context_key, embedding, expires_at)
+        self._by_context.setdefault(context_key, set()).add(key)
+
+        # 超出容量时淘汰最久未使用的条目
+        while len(self._entries) > settings.ANSWER_CACHE_MAX_ENTRIES:
+            self._remove(next(iter(self._entries)))
+        ANSWER_CACHE_ENTRIES.set(len(self._entries))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        keys = self._by_context.get(entry.context_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[entry.context_key]
+        ANSWER_CACHE_ENTRIES.set(len(self._entries))
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass, field
+from prometheus_client import Counter, Histogram
+from backend.shared.core.config import settings
+from backend.shared.core.tokenizer import tokenizer, MESSAGE_OVERHEAD_TOKENS
+
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens",
+    "Prompt tokens sent to the LLM after packing",
+    buckets=(250, 500, 1000, 2000, 4000, 6000, 8000, 16000, 32000),
+)
+PACKER_DROPPED = Counter(
+    "rag_prompt_packer_dropped_total",
+    "Chunks and history turns left out of the prompt by the packer",
+    ["kind", "reason"],
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """
+    去除空白后的字符 n-gram 集合，中英文通用。
+    """
+    text = WHITESPACE.sub("", text.lower())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class PackedPrompt:
+    """
+    打包结果：最终发送给大模型的消息列表，以及实际采用的检索切片。
+    """
+    messages: list
+    chunks: list = field(default_factory=list)
+    prompt_tokens: int = 0
+
+
+def pack_prompt(template: str, query: str, chunks: list, history: list) -> PackedPrompt:
+    """
+    在 PROMPT_TOKEN_BUDGET 内组装 Prompt：
+    1. 系统提示模板与当前问题必须保留
+    2. 检索切片按相似度从高到低放入（最多 CONTEXT_TOKEN_BUDGET），跳过近似重复与放不下的切片
+    3. 剩余预算从最近一轮开始回填历史对话，放不下时丢弃更早的轮次
+    :param chunks: 按相似度降序排列的 SearchResult 列表
+    :param history: 按时间顺序排列的 user/assistant 消息列表
+    """
+    budget = settings.PROMPT_TOKEN_BUDGET - (
+        tokenizer.count(template.replace("{context}", ""))
+        + tokenizer.count(query)
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+
+    # 检索上下文
+    context_budget = min(budget, settings.CONTEXT_TOKEN_BUDGET)
+    selected, selected_shingles = [], []
+    used = 0
+    for chunk in chunks:
+        chunk_shingles = shingles(chunk.content)
+        if any(jaccard(chunk_shingles, s) >= settings.CONTEXT_DEDUP_THRESHOLD for s in selected_shingles):
+            PACKER_DROPPED.labels("chunk", "duplicate").inc()
+            continue
+        tokens = tokenizer.count(chunk.content) + 1  # 切片之间的分隔符
+        if used + tokens > context_budget:
+            PACKER_DROPPED.labels("chunk", "budget").inc()
+            continue
+        selected.append(chunk)
+        selected_shingles.append(chunk_shingles)
+        used += tokens
+
+    # 历史对话：按轮（user + assistant）从新到旧回填，保证保留的历史连续
+    turns = [history[i:i + 2] for i in range(0, len(history), 2)]
+    kept = 0
+    for turn in reversed(turns):
+        tokens = tokenizer.count_messages(turn)
+        if used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+    if len(turns) > kept:
+        PACKER_DROPPED.labels("history_turn", "budget").inc(len(turns) - kept)
+
+    context_str = "\n\n".join(chunk.content for chunk in selected)
+    messages = [{"role": "system", "content": template.replace("{context}", context_str)}]
+    for turn in turns[len(turns) - kept:]:
+        messages.extend(turn)
+    messages.append({"role": "user", "content": query})
+
+    prompt_tokens = settings.PROMPT_TOKEN_BUDGET - budget + used
+    PROMPT_TOKENS.observe(prompt_tokens)
+    return PackedPrompt(messages=messages, chunks=selected, prompt_tokens=prompt_tokens)
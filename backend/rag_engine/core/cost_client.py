@@ -1,71 +1,49 @@
-import grpc
 from backend.shared.rpc import cost_pb2, cost_pb2_grpc
-from backend.shared.core.discovery import registry
-from loguru import logger
-import random
+from backend.shared.core.grpc_pool import AsyncGrpcClient
 
-class CostServiceClient:
+
+class CostServiceClient(AsyncGrpcClient):
     """
     成本服务 gRPC 客户端。
     处理服务发现和远程过程调用。
     """
-    def __init__(self):
-        self.service_name = "cost-service"
+    stub_class = cost_pb2_grpc.CostServiceStub
 
-    def get_channel(self):
-        """
-        获取带有服务发现功能的 gRPC 通道。
-        """
-        target = "localhost:50053" # Default fallback
-        try:
-            instances = registry.get_service(self.service_name)
-            hosts = instances.get('hosts', []) if isinstance(instances, dict) else instances
-            healthy = [i for i in hosts if i.get('healthy', True) and i.get('enabled', True)]
-            if healthy:
-                inst = random.choice(healthy)
-                target = f"{inst['ip']}:{inst['port']}"
-            else:
-                 logger.warning(f"No healthy {self.service_name} found in Nacos, using default.")
-        except Exception as e:
-            logger.error(f"Failed to discover {self.service_name}: {e}")
-        
-        return grpc.insecure_channel(target)
+    def __init__(self):
+        super().__init__("cost-service", "localhost:50053")
 
-    def check_balance(self, user_id: str):
+    async def check_balance(self, user_id: str):
         """
         通过 gRPC 检查用户余额。
         """
-        with self.get_channel() as channel:
-            stub = cost_pb2_grpc.CostServiceStub(channel)
-            request = cost_pb2.CheckBalanceRequest(user_id=user_id)
-            return stub.CheckBalance(request)
+        stub = await self.get_stub()
+        request = cost_pb2.CheckBalanceRequest(user_id=user_id)
+        return await stub.CheckBalance(request, timeout=self.timeout)
 
-    def deduct(self, user_id: str, token_count: int, model_name: str, transaction_id: str):
+    async def deduct(self, user_id: str, token_count: int, model_name: str, transaction_id: str):
         """
         通过 gRPC 扣除费用。
         """
-        with self.get_channel() as channel:
-            stub = cost_pb2_grpc.CostServiceStub(channel)
-            request = cost_pb2.DeductRequest(
-                user_id=user_id,
-                token_count=token_count,
-                model_name=model_name,
-                transaction_id=transaction_id
-            )
-            return stub.Deduct(request)
+        stub = await self.get_stub()
+        request = cost_pb2.DeductRequest(
+            user_id=user_id,
+            token_count=token_count,
+            model_name=model_name,
+            transaction_id=transaction_id
+        )
+        return await stub.Deduct(request, timeout=self.timeout)
 
-    def refund(self, user_id: str, token_count: int, model_name: str, transaction_id: str):
+    async def refund(self, user_id: str, token_count: int, model_name: str, transaction_id: str):
         """
         通过 gRPC 退还费用（回滚）。
         """
-        with self.get_channel() as channel:
-            stub = cost_pb2_grpc.CostServiceStub(channel)
-            request = cost_pb2.DeductRequest(
-                user_id=user_id,
-                token_count=token_count,
-                model_name=model_name,
-                transaction_id=transaction_id
-            )
-            return stub.Refund(request)
+        stub = await self.get_stub()
+        request = cost_pb2.DeductRequest(
+            user_id=user_id,
+            token_count=token_count,
+            model_name=model_name,
+            transaction_id=transaction_id
+        )
+        return await stub.Refund(request, timeout=self.timeout)
 
-cost_client = CostServiceClient()
\ No newline at end of file
+cost_client = CostServiceClient()
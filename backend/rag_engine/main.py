@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
@@ -13,6 +14,9 @@ from backend.shared.telemetry.logging import setup_logging
 from backend.shared.telemetry.tracing import setup_tracing, instrument_app
 from backend.shared.telemetry.metrics import setup_metrics
 from backend.shared.core.discovery import registry, get_local_ip
+from backend.rag_engine.core.vector_client import vector_client
+from backend.rag_engine.core.cost_client import cost_client
+from backend.shared.core.tokenizer import tokenizer
 
 
 # Initialize observability
@@ -25,17 +29,24 @@ setup_tracing("rag-engine")
 async def lifespan(app: FastAPI):
     """
     生命周期管理器：
-    - 启动时：获取本机 IP 并注册到 Nacos
-    - 关闭时：从 Nacos 注销服务
+    - 启动时：获取本机 IP 并注册到 Nacos，初始化 gRPC 通道池，预加载分词器
+    - 关闭时：从 Nacos 注销服务，关闭 gRPC 通道
     """
     ip = get_local_ip()
     port = 8002
     registry.register_service("rag-engine", ip, port)
 
+    await vector_client.start()
+    await cost_client.start()
+    await asyncio.to_thread(tokenizer.load)
+
     yield
 
     registry.deregister_service("rag-engine", ip, port)
 
+    await vector_client.close()
+    await cost_client.close()
+
 
 app = FastAPI(title="RAG Engine", lifespan=lifespan)
 
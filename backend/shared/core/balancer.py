@@ -0,0 +1,189 @@
+import random
+import threading
+from typing import Optional
+from prometheus_client import Counter, Gauge
+from backend.shared.core.circuit_breaker import CIRCUIT_REJECTED, CircuitOpenError, get_breaker
+from backend.shared.core.config import settings
+
+BALANCER_IN_FLIGHT = Gauge(
+    "balancer_in_flight_requests",
+    "Outstanding requests per service instance",
+    ["service", "instance"],
+)
+BALANCER_PANIC = Counter(
+    "balancer_panic_picks_total",
+    "Instance picks that ignored ejections because too many instances of the service were ejected",
+    ["service"],
+)
+BALANCER_LATENCY = Gauge(
+    "balancer_ewma_latency_seconds",
+    "EWMA of request latency per service instance, as used for instance selection",
+    ["service", "instance"],
+)
+
+
+class InstanceStats:
+    __slots__ = ("in_flight", "ewma", "weight")
+
+    def __init__(self, ewma: float, weight: float):
+        self.in_flight = 0
+        self.ewma = ewma
+        self.weight = weight
+
+
+class LoadBalancer:
+    """
+    延迟感知的实例选择（power of two choices）：
+    - 随机抽取两个实例，选择代价更低的一个
+    - 代价 = (未完成请求数 + 1) × EWMA 延迟 / Nacos 实例权重，慢实例和积压实例分到的流量自动减少，
+      并发相同时权重高的实例承担更多请求
+    - 失败的请求按不低于 BALANCER_FAILURE_PENALTY 的延迟计入，快速失败的实例不会因此吸引流量
+    - 每个实例带熔断器（shared.core.circuit_breaker），连续失败的实例被临时摘除，只在半开状态下接收探测请求
+    - 被摘除的实例超过 CIRCUIT_MAX_EJECTION_PERCENT（包括全部被摘除）时进入 panic 模式，忽略熔断状态，
+      在全部实例中选择：大面积故障多半来自共同的依赖或误判，此时摘除只会把流量压到剩下的少数实例上
+    线程安全，可同时用于事件循环和同步代码（如 pika Worker）。
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self._instances = {}  # target -> InstanceStats（当前可选实例）
+        self._stats = {}  # target -> InstanceStats（含已下线但仍有未完成请求的实例）
+        self._lock = threading.Lock()
+
+    def update(self, instances: list):
+        """
+        使用服务发现结果更新可选实例：instances 为 Nacos 实例字典（ip / port / weight），
+        权重 <= 0 的实例不参与选择。
+        """
+        with self._lock:
+            known = [s.ewma for s in self._stats.values() if s.ewma > 0]
+            # 新实例的初始延迟取已知实例的平均值，避免新实例在首个请求返回前被集中打满
+            initial = sum(known) / len(known) if known else 0.0
+            current = {}
+            for instance in instances:
+                weight = float(instance.get("weight", 1.0) or 0.0)
+                if weight <= 0:
+                    continue
+                target = f"{instance['ip']}:{instance['port']}"
+                stats = self._stats.get(target)
+                if stats is None:
+                    stats = self._stats[target] = InstanceStats(initial, weight)
+                stats.weight = weight
+                current[target] = stats
+            for target in set(self._stats) - set(current):
+                if not self._stats[target].in_flight:
+                    del self._stats[target]
+                    for gauge in (BALANCER_IN_FLIGHT, BALANCER_LATENCY):
+                        try:
+                            gauge.remove(self.service_name, target)
+                        except KeyError:
+                            pass
+            self._instances = current
+
+    def pick(self, default: Optional[str] = None) -> Optional[str]:
+        """
+        选择一个实例，返回 "ip:port"；没有实例时使用 default（可能为 None）。
+        跳过熔断中的实例；全部实例被摘除或摘除比例超过上限时在全部实例中选择（panic 模式）。
+        候选实例的放行名额恰好都被并发请求占用时抛出 CircuitOpenError，由调用方快速失败。
+        """
+        with self._lock:
+            targets = list(self._instances) or ([default] if default else [])
+            if not targets:
+                return None
+            candidates = [t for t in targets if get_breaker(self.service_name, t).available()]
+            ejected = len(targets) - len(candidates)
+            if not candidates or ejected > len(targets) * settings.CIRCUIT_MAX_EJECTION_PERCENT / 100:
+                BALANCER_PANIC.labels(self.service_name).inc()
+                if len(targets) == 1:
+                    return targets[0]
+                return min(random.sample(targets, 2), key=self._cost)
+            if len(candidates) > 1:
+                sampled = sorted(random.sample(candidates, 2), key=self._cost)
+                candidates = sampled + [t for t in candidates if t not in sampled]
+            # 选中即占用放行名额（半开实例只放行一个探测请求）：名额已被并发请求占用时改选其他实例
+            for target in candidates:
+                if get_breaker(self.service_name, target).allow():
+                    return target
+            CIRCUIT_REJECTED.labels(self.service_name).inc()
+            raise CircuitOpenError(f"All {self.service_name} instances are ejected")
+
+    def _cost(self, target: str) -> float:
+        stats = self._instances[target]
+        return (stats.in_flight + 1) * max(stats.ewma, 0.001) / stats.weight
+
+    def acquire(self, target: str):
+        """
+        请求发出前调用，计入实例的未完成请求数。
+        """
+        with self._lock:
+            stats = self._stats.get(target)
+            if stats is None:
+                stats = self._stats[target] = InstanceStats(0.0, 1.0)
+            stats.in_flight += 1
+            BALANCER_IN_FLIGHT.labels(self.service_name, target).set(stats.in_flight)
+
+    def release(self, target: str, latency: Optional[float] = None, failed: bool = False):
+        """
+        请求结束后调用；latency 为 None 时只减少未完成请求数（延迟和结果已通过 observe 记录）。
+        """
+        with self._lock:
+            stats = self._stats.get(target)
+            if stats is None:
+                return
+            stats.in_flight -= 1
+            BALANCER_IN_FLIGHT.labels(self.service_name, target).set(stats.in_flight)
+        if latency is not None or failed:
+            self.observe(target, latency or 0.0, failed)
+
+    def observe(self, target: str, latency: float, failed: bool = False):
+        """
+        记录一次请求延迟，更新实例的 EWMA，并将请求结果计入实例的熔断器。
+        """
+        get_breaker(self.service_name, target).record(failed)
+        if failed:
+            latency = max(latency, settings.BALANCER_FAILURE_PENALTY)
+        with self._lock:
+            stats = self._stats.get(target)
+            if stats is None:
+                return
+            alpha = settings.BALANCER_EWMA_ALPHA
+            stats.ewma = latency if stats.ewma <= 0 else alpha * latency + (1 - alpha) * stats.ewma
+            BALANCER_LATENCY.labels(self.service_name, target).set(stats.ewma)
+
+    def stats(self) -> dict:
+        """
+        各实例的当前统计：{target: {"in_flight", "ewma_latency", "weight", "available"}}。
+        """
+        with self._lock:
+            return {
+                target: {
+                    "in_flight": stats.in_flight,
+                    "ewma_latency": stats.ewma,
+                    "weight": stats.weight,
+                    "available": target in self._instances,
+                }
+                for target, stats in self._stats.items()
+            }
+
+
+_balancers = {}
+_balancers_lock = threading.Lock()
+
+
+def get_balancer(service_name: str) -> LoadBalancer:
+    """
+    获取指定服务的负载均衡器（进程内按服务名共享）。
+    """
+    with _balancers_lock:
+        balancer = _balancers.get(service_name)
+        if balancer is None:
+            balancer = _balancers[service_name] = LoadBalancer(service_name)
+        return balancer
+
+
+def healthy_instances(instances) -> list:
+    """
+    从 Nacos 查询结果中筛选健康且已启用的实例。
+    """
+    hosts = instances.get("hosts", []) if isinstance(instances, dict) else instances
+    return [i for i in hosts if i.get("healthy", True) and i.get("enabled", True)]
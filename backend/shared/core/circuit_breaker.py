@@ -0,0 +1,138 @@
+import threading
+import time
+from loguru import logger
+from prometheus_client import Counter, Gauge
+from backend.shared.core.config import settings
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per upstream instance (0 = closed, 1 = half-open, 2 = open)",
+    ["service", "instance"],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state transitions per upstream instance",
+    ["service", "instance", "state"],
+)
+CIRCUIT_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Requests failed fast because every candidate instance was ejected",
+    ["service"],
+)
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    目标实例（或服务的全部实例）处于熔断中，请求被快速拒绝。
+    """
+
+
+class CircuitBreaker:
+    """
+    单个上游实例的熔断器：
+    - closed：正常放行，连续失败 CIRCUIT_FAILURE_THRESHOLD 次后打开
+    - open：实例被临时摘除，期间请求不会发往该实例；摘除时长从 CIRCUIT_OPEN_SECONDS 开始，
+      连续被摘除时逐次翻倍，上限 CIRCUIT_MAX_OPEN_SECONDS
+    - half_open：摘除期满后只放行一个探测请求，成功则关闭并重置摘除时长，失败则再次打开
+    探测请求超过 CIRCUIT_OPEN_SECONDS 未回报结果（如请求被取消）时，允许发出新的探测请求。
+    线程安全，可同时用于事件循环和同步代码。
+    """
+
+    def __init__(self, service: str, instance: str):
+        self.service = service
+        self.instance = instance
+        self.state = CLOSED
+        self._failures = 0  # 连续失败次数
+        self._ejections = 0  # 连续被摘除次数，决定下次摘除时长
+        self._open_until = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(service, instance).set(STATE_VALUES[CLOSED])
+
+    def available(self) -> bool:
+        """
+        当前是否可以向该实例发送请求（不占用半开状态的探测名额）。
+        """
+        with self._lock:
+            return self._admit(time.monotonic(), claim=False)
+
+    def allow(self) -> bool:
+        """
+        请求发出前调用：可以发送时返回 True，半开状态下同时占用探测名额。
+        """
+        with self._lock:
+            return self._admit(time.monotonic(), claim=True)
+
+    def record(self, failed: bool):
+        """
+        记录一次请求结果。
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_started = None
+                if failed:
+                    self._open()
+                else:
+                    self._ejections = 0
+                    self._failures = 0
+                    self._transition(CLOSED)
+            elif self.state == CLOSED:
+                self._failures = self._failures + 1 if failed else 0
+                if self._failures >= settings.CIRCUIT_FAILURE_THRESHOLD:
+                    self._open()
+            # open 状态下回报的是摘除前已发出的请求，不影响摘除时长
+
+    def _admit(self, now: float, claim: bool) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now < self._open_until:
+                return False
+            self._transition(HALF_OPEN)
+        if self._probe_started is not None and now - self._probe_started < settings.CIRCUIT_OPEN_SECONDS:
+            return False
+        if claim:
+            self._probe_started = now
+        return True
+
+    def _open(self):
+        duration = min(
+            settings.CIRCUIT_OPEN_SECONDS * 2 ** self._ejections, settings.CIRCUIT_MAX_OPEN_SECONDS
+        )
+        self._ejections += 1
+        self._failures = 0
+        self._open_until = time.monotonic() + duration
+        self._transition(OPEN)
+        logger.warning(
+            f"Circuit opened for {self.service} instance {self.instance}, ejected for {duration:.0f}s"
+        )
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        if state == CLOSED:
+            logger.info(f"Circuit closed for {self.service} instance {self.instance}")
+        self.state = state
+        CIRCUIT_STATE.labels(self.service, self.instance).set(STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(self.service, self.instance, state).inc()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service: str, instance: str) -> CircuitBreaker:
+    """
+    获取指定服务实例的熔断器（进程内按 (服务名, 实例) 共享）。
+    """
+    with _breakers_lock:
+        breaker = _breakers.get((service, instance))
+        if breaker is None:
+            breaker = _breakers[(service, instance)] = CircuitBreaker(service, instance)
+        return breaker
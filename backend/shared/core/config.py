@@ -28,22 +28,106 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
+    HISTORY_MAX_TURNS: int = 20 # 每个会话在 Redis 中保留的最近对话轮数
+    HISTORY_TTL: int = 3600 # 会话历史的过期时间（秒），每轮对话后续期
+
+    # Answer Cache Configuration (回答缓存配置)
+    ANSWER_CACHE_ENABLED: bool = True # 是否启用回答缓存
+    ANSWER_CACHE_TTL: int = 600 # 缓存条目有效期（秒）
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024 # 缓存最大条目数，超出后按 LRU 淘汰
+    ANSWER_CACHE_SEMANTIC_ENABLED: bool = False # 是否启用语义缓存（需额外获取问题向量）
+    ANSWER_CACHE_SEMANTIC_THRESHOLD: float = 0.95 # 语义缓存命中所需的最小余弦相似度
+    KB_VERSION_KEY: str = "kb_version:knowledge_base" # 知识库版本号的 Redis 键，写入时递增以使缓存失效
+
+    # Prompt Packing Configuration (Prompt Token 预算配置)
+    TOKENIZER_ENCODING: str = "cl100k_base" # tiktoken 编码名称，不可用时退化为启发式估算
+    PROMPT_TOKEN_BUDGET: int = 6000 # 发送给大模型的 Prompt 总 token 上限（系统提示 + 历史 + 上下文 + 问题）
+    CONTEXT_TOKEN_BUDGET: int = 3000 # 其中检索上下文最多占用的 token 数，剩余预算留给历史对话
+    CONTEXT_DEDUP_THRESHOLD: float = 0.9 # 检索切片字符 3-gram Jaccard 相似度达到该值视为重复
+    RETRIEVAL_TOP_K: int = 5 # 每次对话检索的候选切片数
+    RETRIEVAL_MIN_SCORE: float = 0.0 # 检索结果的最低相似度分数，<= 0 表示不过滤
 
     # Nacos Configuration (服务注册与发现配置)
     NACOS_SERVER_ADDR: str = "localhost:8848" # Nacos 服务地址
     NACOS_NAMESPACE: str = "" # Nacos 命名空间ID，默认 public 为空字符串
     NACOS_USERNAME: Optional[str] = None
     NACOS_PASSWORD: Optional[str] = None
+    DISCOVERY_REFRESH_INTERVAL: float = 10.0 # 后台刷新服务发现缓存的间隔（秒）
+    DISCOVERY_SNAPSHOT_DIR: str = "data/discovery" # 服务实例快照目录，Nacos 不可用时用于冷启动
+    BALANCER_EWMA_ALPHA: float = 0.3 # 实例延迟 EWMA 的平滑系数，越大越偏重最近的请求
+    BALANCER_FAILURE_PENALTY: float = 1.0 # 失败请求计入延迟统计的最小值（秒）
+    CIRCUIT_FAILURE_THRESHOLD: int = 5 # 实例连续失败多少次后熔断（临时摘除）
+    CIRCUIT_OPEN_SECONDS: float = 10.0 # 首次摘除时长（秒），期满后放行一个探测请求
+    CIRCUIT_MAX_OPEN_SECONDS: float = 120.0 # 连续摘除时摘除时长逐次翻倍的上限（秒）
+    CIRCUIT_MAX_EJECTION_PERCENT: float = 50.0 # 同一服务最多摘除的实例比例（%），超过时忽略熔断状态在全部实例中选择
+
+    # gRPC Client Configuration (gRPC 客户端配置)
+    GRPC_TIMEOUT: float = 10.0 # 单次 RPC 调用超时时间（秒）
+    GRPC_CHANNELS_PER_ENDPOINT: int = 2 # 每个服务实例维持的长连接通道数
+
+    # Gateway Configuration (网关上游连接池配置)
+    GATEWAY_MAX_CONNECTIONS: int = 100 # 每个上游服务的最大连接数
+    GATEWAY_MAX_KEEPALIVE_CONNECTIONS: int = 20 # 每个上游服务保留的空闲 keep-alive 连接数
+    GATEWAY_KEEPALIVE_EXPIRY: float = 30.0 # 空闲连接的保留时间（秒）
+    GATEWAY_HTTP2: bool = False # 是否使用 HTTP/2 连接上游（需安装 h2）
+    GATEWAY_CONNECT_TIMEOUT: float = 5.0 # 建立上游连接的超时时间（秒）
+    GATEWAY_POOL_TIMEOUT: float = 10.0 # 连接池已满时等待空闲连接的超时时间（秒）
+    GATEWAY_AUTH_TIMEOUT: float = 30.0 # 认证路由的读写超时时间（秒）
+    GATEWAY_UPLOAD_TIMEOUT: float = 60.0 # 文档上传路由的读写超时时间（秒）
+    GATEWAY_CHAT_TIMEOUT: float = 120.0 # 对话路由的读写超时时间（秒）
 
     # RabbitMQ Configuration (消息队列配置)
     RABBITMQ_DEFAULT_USER: str = "guest"
     RABBITMQ_DEFAULT_PASS: str = "guest"
     RABBITMQ_HOST: str = "localhost"
     RABBITMQ_PORT: int = 5672
+    MQ_CHANNEL_POOL_SIZE: int = 4 # 生产者通道池大小（均开启发布确认）
+    MQ_CHUNKS_PER_MESSAGE: int = 32 # 每条向量化任务消息打包的切片数
+    MQ_MAX_UNCONFIRMED: int = 16 # 单次上传最多同时等待 broker 确认的消息数
+    MQ_CONSUMER_PREFETCH: int = 32 # 向量服务消费者的 prefetch（未确认消息数上限）
+    MQ_CONSUMER_BATCH_SIZE: int = 64 # 消费者微批的切片数，达到后立即处理
+    MQ_CONSUMER_BATCH_WAIT_MS: float = 50.0 # 微批最长等待时间（毫秒）
+    MQ_CONSUMER_CONCURRENCY: int = 4 # 同时处理的微批数
+    MQ_CONSUMER_TIMEOUT: float = 60.0 # 单个微批的处理超时时间（秒）
+    MQ_RECONNECT_MAX_DELAY: float = 30.0 # 消费者首次连接 RabbitMQ 失败后重试间隔的上限（秒），间隔从 1 秒开始翻倍
+    MQ_MAX_ATTEMPTS: int = 5 # 向量化任务的最大处理次数，用尽后进入死信队列
+    MQ_RETRY_BASE_DELAY_MS: int = 2000 # 首次重试的延迟（毫秒），之后每次翻倍
+    MQ_OUTAGE_RETRY_DELAY_MS: int = 30000 # 向量服务不可用（熔断/UNAVAILABLE/超时）时的重试延迟（毫秒），不计入 MQ_MAX_ATTEMPTS
+    MQ_OUTAGE_MAX_RETRIES: int = 120 # 向量服务不可用时的最大重试次数（默认约 1 小时），用尽后进入死信队列
+
+    # Document Ingestion Configuration (文档解析配置)
+    PARSER_PROCESSES: int = 0 # 文档解析进程池大小，0 表示使用 CPU 核数
+    PARSER_PAGES_PER_TASK: int = 16 # 大文档按页区间拆分给多个进程解析，每个任务的页数
+    CHUNKER_DEFAULT: str = "window" # 默认切片策略：window（token 滑动窗口）或 paragraph（按空行切分）
+    CHUNK_MAX_TOKENS: int = 500 # 滑动窗口切片的最大 token 数（需小于 Embedding 模型输入上限）
+    CHUNK_OVERLAP_TOKENS: int = 50 # 相邻切片的重叠 token 数
+    CHUNK_MIN_TOKENS: int = 50 # 文档末尾小于该 token 数的碎片并入前一个切片
 
     # ChromaDB Configuration (向量数据库配置)
     CHROMA_HOST: str = "localhost"
     CHROMA_PORT: int = 8000
+    CHROMA_MAX_CONCURRENCY: int = 8 # 同时执行的 Chroma 调用数（独立线程池大小）
+    CHROMA_TIMEOUT: float = 10.0 # 单次 Chroma 调用超时时间（秒），含排队时间
+
+    # Vector Store Configuration (向量存储后端配置)
+    VECTOR_STORE_BACKEND: str = "chroma" # 向量存储实现：chroma（远程服务）或 local（嵌入式索引）
+    LOCAL_INDEX_PATH: str = "data/vector_index" # 嵌入式索引的持久化目录
+    LOCAL_INDEX_IVF_MIN_SIZE: int = 20000 # 向量数达到该值后启用 IVF 倒排索引，否则暴力检索
+    LOCAL_INDEX_NPROBE: int = 8 # IVF 查询时扫描的簇数量
+    LOCAL_INDEX_QUANTIZATION: str = "none" # 检索时扫描的向量编码：none（float32）、int8（标量量化）或 pq（乘积量化）
+    LOCAL_INDEX_RERANK_FACTOR: int = 10 # 量化检索时取 top_k * 该倍数个候选，再用 float32 原始向量精排
+    LOCAL_INDEX_PQ_SUBVECTORS: int = 96 # PQ 子空间数量（每个向量编码为该数量的字节），需整除向量维度
+    LOCAL_INDEX_PQ_MIN_SIZE: int = 10000 # 向量数达到该值后训练 PQ 码本，训练前按 float32 检索
+
+    # Embedding Cache Configuration (向量缓存配置)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000 # 进程内 LRU 缓存的最大向量数
+    EMBEDDING_CACHE_TTL: int = 604800 # Redis 缓存的向量有效期（秒），默认 7 天
+    EMBEDDING_BATCH_SIZE: int = 25 # 单次 Embedding API 请求的最大文本数（DashScope 上限为 25）
+    UPSERT_BATCH_SIZE: int = 256 # BatchUpsert 单次写入 Chroma 的最大切片数
+
+    # Search Batching Configuration (检索微批处理配置)
+    SEARCH_BATCH_WINDOW_MS: float = 3.0 # 并发检索请求的合并时间窗口（毫秒）
+    SEARCH_BATCH_MAX_SIZE: int = 16 # 单批最多合并的查询数，达到后立即执行
 
     # Telemetry (可观测性配置 - Jaeger/Prometheus)
     JAEGER_HOST: str = "localhost"
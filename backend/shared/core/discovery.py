@@ -1,10 +1,26 @@
+import json
+import os
 import socket
 import logging
+import threading
+import time
 from nacos import NacosClient
+from prometheus_client import Counter, Gauge
 from backend.shared.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+DISCOVERY_REFRESHES = Counter(
+    "discovery_refresh_total",
+    "Background refreshes of cached service instances by result",
+    ["service", "result"],
+)
+DISCOVERY_CACHE_AGE = Gauge(
+    "discovery_cache_age_seconds",
+    "Age of the cached instance list at the last refresh attempt (grows while Nacos is unreachable)",
+    ["service"],
+)
+
 # 动态修改 NacosClient 的 get_access_token 方法，如果没有用户名密码则跳过认证获取 token
 original_get_access_token = NacosClient.get_access_token
 
@@ -22,10 +38,24 @@ def patched_get_access_token(self, force_refresh=False):
 NacosClient.get_access_token = patched_get_access_token
 
 
+def normalized_hosts(instances) -> list:
+    """
+    实例列表中影响路由的部分：按 (ip, port) 排序的 (ip, port, weight, healthy, enabled)。
+    Nacos 每次查询返回的 lastRefTime、cacheMillis 等字段都会变化，不能用于判断实例是否变化。
+    """
+    hosts = instances.get("hosts", []) if isinstance(instances, dict) else instances or []
+    return sorted(
+        (h.get("ip"), h.get("port"), h.get("weight", 1.0), h.get("healthy", True), h.get("enabled", True))
+        for h in hosts
+    )
+
+
 class NacosRegistry:
     """
     Nacos 服务注册与发现客户端封装。
     负责将当前服务注册到 Nacos Server，以及查询其他服务实例。
+    实例列表缓存在内存中，由后台线程定期刷新，查询不会阻塞在 Nacos 请求上。
+    NacosClient 在首次注册或查询时才创建（创建时即登录 Nacos），导入本模块不会访问 Nacos。
     """
 
     def __init__(self):
@@ -35,20 +65,26 @@ class NacosRegistry:
         if not self.namespace:
             self.namespace = None
 
-        username = settings.NACOS_USERNAME
-        password = settings.NACOS_PASSWORD
-
-        if not username:
-            username = None
-        if not password:
-            password = None
-
-        self.client = NacosClient(
-            self.server_addresses,
-            namespace=self.namespace,
-            username=username,
-            password=password,
-        )
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._cache = {}  # (service_name, group_name) -> (instances, fetched_at)
+        self._lock = threading.Lock()
+        self._service_locks = {}  # (service_name, group_name) -> 冷启动查询锁，不同服务互不阻塞
+        self._wake = threading.Event()
+        self._refresher = None
+
+    @property
+    def client(self) -> NacosClient:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = NacosClient(
+                        self.server_addresses,
+                        namespace=self.namespace,
+                        username=settings.NACOS_USERNAME or None,
+                        password=settings.NACOS_PASSWORD or None,
+                    )
+        return self._client
 
     def register_service(
         self, service_name: str, host: str, port: int, group_name: str = "DEFAULT_GROUP"
@@ -92,14 +128,104 @@ class NacosRegistry:
 
     def get_service(self, service_name: str, group_name: str = "DEFAULT_GROUP"):
         """
-        获取指定服务的实例列表。
+        获取指定服务的实例列表（读内存缓存）：
+        - 后台线程每 DISCOVERY_REFRESH_INTERVAL 秒刷新一次已查询过的服务
+        - 刷新失败时继续返回上一次成功的结果（stale-while-revalidate）
+        - 冷启动时先读取本地快照文件并立即触发后台刷新，快照也不存在时才同步查询一次 Nacos；
+          同步查询只持有该服务的锁，不阻塞其他服务的查询
         :return: 服务实例列表
         """
+        key = (service_name, group_name)
+        entry = self._cache.get(key)
+        if entry is None:
+            with self._lock:
+                service_lock = self._service_locks.setdefault(key, threading.Lock())
+            with service_lock:
+                entry = self._cache.get(key)
+                if entry is None:
+                    entry = self._load_snapshot(key)
+                    if entry is not None:
+                        self._cache[key] = entry
+                        self._wake.set()
+                    else:
+                        entry = self._refresh(key)
+            self._ensure_refresher()
+        return entry[0]
+
+    def watch(self, service_names: list, group_name: str = "DEFAULT_GROUP"):
+        """
+        预先加载服务实例并纳入后台刷新（在服务启动时调用，避免首个请求承担冷启动查询）。
+        """
+        for service_name in service_names:
+            self.get_service(service_name, group_name)
+
+    def _ensure_refresher(self):
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(
+                        target=self._refresh_loop, name="nacos-discovery", daemon=True
+                    )
+                    self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(settings.DISCOVERY_REFRESH_INTERVAL)
+            self._wake.clear()
+            for key in list(self._cache):
+                self._refresh(key)
+
+    def _refresh(self, key: tuple) -> tuple:
+        """
+        从 Nacos 拉取实例列表并更新缓存，失败时保留旧值。
+        """
+        service_name, group_name = key
+        previous = self._cache.get(key)
         try:
-            return self.client.list_naming_instance(service_name, group_name=group_name)
+            instances = self.client.list_naming_instance(service_name, group_name=group_name)
         except Exception as e:
-            logger.error(f"Failed to get service {service_name}: {e}")
-            return []
+            DISCOVERY_REFRESHES.labels(service_name, "error").inc()
+            if previous is None:
+                logger.error(f"Failed to get service {service_name}: {e}")
+                previous = ([], 0.0)
+                self._cache[key] = previous
+            else:
+                logger.warning(f"Failed to refresh service {service_name}, serving cached instances: {e}")
+                if previous[1]:
+                    DISCOVERY_CACHE_AGE.labels(service_name).set(time.time() - previous[1])
+            return previous
+
+        entry = (instances, time.time())
+        self._cache[key] = entry
+        DISCOVERY_REFRESHES.labels(service_name, "ok").inc()
+        DISCOVERY_CACHE_AGE.labels(service_name).set(0)
+        if previous is None or normalized_hosts(previous[0]) != normalized_hosts(instances):
+            self._save_snapshot(key, instances)
+        return entry
+
+    def _snapshot_file(self, key: tuple) -> str:
+        service_name, group_name = key
+        return os.path.join(settings.DISCOVERY_SNAPSHOT_DIR, f"{group_name}@@{service_name}.json")
+
+    def _load_snapshot(self, key: tuple):
+        try:
+            with open(self._snapshot_file(key), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        logger.info(f"Loaded {key[0]} instances from discovery snapshot")
+        return snapshot["instances"], snapshot["saved_at"]
+
+    def _save_snapshot(self, key: tuple, instances):
+        path = self._snapshot_file(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"instances": instances, "saved_at": time.time()}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Failed to write discovery snapshot {path}: {e}")
 
 
 def get_local_ip():
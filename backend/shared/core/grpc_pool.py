@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+import time
+import grpc
+from loguru import logger
+from backend.shared.core.balancer import get_balancer, healthy_instances
+from backend.shared.core.config import settings
+from backend.shared.core.discovery import registry
+
+# 长连接 keepalive 配置，保证空闲的 HTTP/2 连接不会被中间设备断开
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+# 表示实例本身不可用的状态码，计入延迟惩罚和熔断器；NOT_FOUND、INVALID_ARGUMENT 等业务错误不计入
+FAILURE_CODES = {
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+}
+
+
+class BalancerInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    记录每个实例通道上的未完成请求数、调用延迟和失败情况，供负载均衡器选择实例和熔断。
+    调用方取消请求（客户端断开、并发的其他阶段失败）时只释放未完成请求数，不计入延迟和熔断器。
+    """
+
+    def __init__(self, balancer, target: str):
+        self.balancer = balancer
+        self.target = target
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        started = time.perf_counter()
+        self.balancer.acquire(self.target)
+        try:
+            call = await continuation(client_call_details, request)
+            # code() 等待调用结束但不抛出异常，调用方仍按原样 await 返回的 call
+            code = await call.code()
+        except asyncio.CancelledError:
+            self.balancer.release(self.target)
+            raise
+        except BaseException:
+            self.balancer.release(self.target, time.perf_counter() - started, failed=True)
+            raise
+        if code == grpc.StatusCode.CANCELLED:
+            self.balancer.release(self.target)
+        else:
+            self.balancer.release(self.target, time.perf_counter() - started, code in FAILURE_CODES)
+        return call
+
+
+class AsyncGrpcClient:
+    """
+    基于 grpc.aio 的异步 gRPC 客户端基类。
+    - 为每个服务实例维护长连接通道池，复用 HTTP/2 连接
+    - 在后台定时刷新 Nacos 服务发现结果，调用路径上不再同步查询注册中心
+    - 按实例的未完成请求数和 EWMA 延迟选择实例（shared.core.balancer），跳过熔断中的实例
+    """
+
+    stub_class = None
+
+    def __init__(self, service_name: str, default_target: str):
+        self.service_name = service_name
+        self.default_target = default_target
+        self.timeout = settings.GRPC_TIMEOUT
+        self._pools = {}
+        self.balancer = get_balancer(service_name)
+        self._refresh_task = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        首次拉取服务实例并启动后台刷新任务。
+        """
+        async with self._start_lock:
+            if self._refresh_task is not None:
+                return
+            await self.refresh_targets()
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        """
+        停止后台刷新并关闭所有通道。
+        """
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        for target in list(self._pools):
+            await self._close_pool(target)
+
+    async def refresh_targets(self):
+        """
+        读取服务发现缓存中的健康实例列表（冷启动时可能同步查询 Nacos，因此在线程池中执行）。
+        """
+        try:
+            instances = await asyncio.to_thread(registry.get_service, self.service_name)
+            healthy = healthy_instances(instances)
+            targets = [f"{i['ip']}:{i['port']}" for i in healthy]
+            if not targets:
+                logger.warning(
+                    f"No healthy {self.service_name} found in Nacos, using default."
+                )
+        except Exception as e:
+            logger.error(f"Failed to discover {self.service_name}: {e}")
+            return
+
+        # 关闭已下线实例的通道
+        for target in set(self._pools) - set(targets) - {self.default_target}:
+            await self._close_pool(target)
+        self.balancer.update(healthy)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.DISCOVERY_REFRESH_INTERVAL)
+            await self.refresh_targets()
+
+    async def _close_pool(self, target: str):
+        channels, _, _ = self._pools.pop(target)
+        for channel in channels:
+            await channel.close()
+
+    def _get_pool(self, target: str):
+        pool = self._pools.get(target)
+        if pool is None:
+            interceptors = [BalancerInterceptor(self.balancer, target)]
+            channels = [
+                grpc.aio.insecure_channel(target, options=CHANNEL_OPTIONS, interceptors=interceptors)
+                for _ in range(settings.GRPC_CHANNELS_PER_ENDPOINT)
+            ]
+            stubs = [self.stub_class(channel) for channel in channels]
+            pool = (channels, stubs, itertools.cycle(range(len(channels))))
+            self._pools[target] = pool
+        return pool
+
+    async def get_stub(self):
+        """
+        由负载均衡器选择一个服务实例，并以轮询方式从其通道池中取出 Stub。
+        被摘除的实例过多时回退到全部实例；没有实例可以放行请求时抛出 CircuitOpenError，不再等待调用超时。
+        """
+        if self._refresh_task is None:
+            await self.start()
+        target = self.balancer.pick(self.default_target)
+        _, stubs, cursor = self._get_pool(target)
+        return stubs[next(cursor)]
@@ -1,7 +1,60 @@
-from openai import AsyncOpenAI
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from backend.shared.core.circuit_breaker import CIRCUIT_REJECTED, CircuitOpenError, get_breaker
 from backend.shared.core.config import settings
 
 
+def is_endpoint_failure(e: Exception) -> bool:
+    """
+    计入熔断器的失败：连接失败、超时、5xx 和 429（请求参数错误等 4xx 说明端点本身可用）。
+    """
+    if isinstance(e, APIConnectionError):  # 含 APITimeoutError
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code >= 500 or e.status_code == 429)
+
+
+class CircuitBreakerEndpoint:
+    """
+    按 (主机, 接口) 熔断的 SDK 调用包装：熔断器在 SDK 客户端之外，
+    SDK 内部重试全部失败后才计为一次失败，熔断期间直接抛出 CircuitOpenError，不会被 SDK 重试。
+    对话和 Embedding 接口各自熔断，一个接口故障不影响另一个。
+    """
+
+    def __init__(self, create, base_url: str, path: str):
+        self._create = create
+        url = urlsplit(base_url)
+        self.instance = f"{url.netloc}{url.path.rstrip('/')}{path}"
+
+    async def create(self, *args, **kwargs):
+        breaker = get_breaker("llm", self.instance)
+        if not breaker.allow():
+            CIRCUIT_REJECTED.labels("llm").inc()
+            raise CircuitOpenError(f"LLM endpoint {self.instance} is ejected")
+        try:
+            result = await self._create(*args, **kwargs)
+        except Exception as e:
+            breaker.record(failed=is_endpoint_failure(e))
+            raise
+        breaker.record(failed=False)
+        return result
+
+
+class CircuitBreakerLLM:
+    """
+    带熔断的 LLM 客户端，提供与 AsyncOpenAI 相同的 chat.completions.create / embeddings.create 调用方式。
+    流式对话在收到响应头时记录结果，生成中途的错误由调用方处理。
+    """
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        base_url = str(client.base_url)
+        self.chat = SimpleNamespace(
+            completions=CircuitBreakerEndpoint(client.chat.completions.create, base_url, "/chat/completions")
+        )
+        self.embeddings = CircuitBreakerEndpoint(client.embeddings.create, base_url, "/embeddings")
+
+
 class LLMFactory:
     """
     LLM 客户端工厂类，支持单例模式以复用连接。
@@ -10,20 +63,23 @@ class LLMFactory:
     _instance = None
 
     @classmethod
-    def get_client(cls) -> AsyncOpenAI:
+    def get_client(cls) -> CircuitBreakerLLM:
         """
-        获取或创建全局 AsyncOpenAI 客户端实例。
+        获取或创建全局 LLM 客户端实例。
         """
         if cls._instance is None:
             # 使用兼容 OpenAI 协议的配置初始化客户端（支持通义千问、vLLM 等）
-            cls._instance = AsyncOpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_BASE_URL,
+            # 沿用 SDK 默认的超时、重试和连接池配置，熔断在 SDK 客户端之外
+            cls._instance = CircuitBreakerLLM(
+                AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL,
+                )
             )
         return cls._instance
 
 
-def get_llm_client() -> AsyncOpenAI:
+def get_llm_client() -> CircuitBreakerLLM:
     """
     获取 LLM 客户端的辅助函数。
     """
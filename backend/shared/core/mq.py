@@ -0,0 +1,132 @@
+import hashlib
+import json
+import unicodedata
+import grpc
+import httpx
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from backend.shared.core.circuit_breaker import CircuitOpenError
+from backend.shared.core.config import settings
+from backend.shared.core.llm_factory import is_endpoint_failure
+
+# 向量化任务队列
+EMBEDDING_QUEUE = "embedding_queue"
+# 超过最大重试次数的消息进入死信队列，等待人工检查或重放
+DEAD_LETTER_QUEUE = f"{EMBEDDING_QUEUE}.dlq"
+
+# 消息头：已尝试处理的次数与最近一次失败原因
+ATTEMPTS_HEADER = "x-attempts"
+ERROR_HEADER = "x-last-error"
+# 消息头：因下游服务不可用而重试的次数（单独计数，不消耗 ATTEMPTS_HEADER 的重试次数）
+OUTAGE_RETRIES_HEADER = "x-outage-retries"
+
+# 向量服务整体不可用时的 gRPC 状态码：与消息内容无关，重试不消耗消息的重试次数
+OUTAGE_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED}
+
+
+def encode_chunks(chunks: list) -> bytes:
+    """
+    将多个切片打包为一条消息：{"chunks": [{"id", "text", "metadata"}, ...]}，紧凑 UTF-8 JSON。
+    """
+    return json.dumps({"chunks": chunks}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_chunks(body: bytes) -> list:
+    """
+    解析向量化任务消息，返回切片列表。
+    兼容旧格式的单切片消息 {"id", "text", "metadata"}。
+    """
+    message = json.loads(body)
+    if "chunks" in message:
+        return message["chunks"]
+    return [message]
+
+
+def content_hash(text: str) -> str:
+    """
+    切片内容指纹：NFKC 规范化并折叠空白后的 SHA-256。
+    仅排版不同（全角/半角、换行、缩进）的相同内容得到相同指纹，向量服务据此去重。
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def retry_delays() -> list:
+    """
+    各次重试的等待时间（毫秒），按 MQ_RETRY_BASE_DELAY_MS 指数增长：1x, 2x, 4x ...
+    """
+    return [settings.MQ_RETRY_BASE_DELAY_MS * 2 ** i for i in range(max(settings.MQ_MAX_ATTEMPTS - 1, 0))]
+
+
+def retry_queue(delay_ms: int) -> str:
+    # 队列名包含延迟时间：TTL 在声明后不可修改，调整配置时使用新队列即可
+    return f"{EMBEDDING_QUEUE}.retry.{delay_ms}ms"
+
+
+def outage_queue() -> str:
+    return f"{EMBEDDING_QUEUE}.retry.outage.{settings.MQ_OUTAGE_RETRY_DELAY_MS}ms"
+
+
+def topology() -> list:
+    """
+    重试拓扑涉及的全部队列 [(队列名, 队列参数)]：
+    - 主队列与死信队列
+    - 每级重试一个延迟队列：消息在其中停留 TTL 后经默认交换机死信回主队列
+    - 下游服务不可用时使用的固定延迟队列（同样死信回主队列）
+    """
+    delayed = [(retry_queue(delay), delay) for delay in retry_delays()]
+    delayed.append((outage_queue(), settings.MQ_OUTAGE_RETRY_DELAY_MS))
+    queues = [(EMBEDDING_QUEUE, None), (DEAD_LETTER_QUEUE, None)]
+    for name, delay in delayed:
+        queues.append((
+            name,
+            {
+                "x-message-ttl": delay,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": EMBEDDING_QUEUE,
+            },
+        ))
+    return queues
+
+
+def failure_route(attempts: int) -> str:
+    """
+    第 attempts 次处理失败后消息应发往的队列：对应级别的重试队列，次数用尽时为死信队列。
+    """
+    delays = retry_delays()
+    if attempts >= settings.MQ_MAX_ATTEMPTS or not delays:
+        return DEAD_LETTER_QUEUE
+    return retry_queue(delays[min(attempts, len(delays)) - 1])
+
+
+def failure_headers(headers: dict, error, outage: bool = False) -> tuple:
+    """
+    根据消息原有的头部计算下一跳：返回 (目标队列, 新的消息头)。
+    outage 为 True 表示下游服务不可用（与消息内容无关）：发往固定延迟的 outage 队列，
+    只累计 OUTAGE_RETRIES_HEADER，不消耗 MQ_MAX_ATTEMPTS，超过 MQ_OUTAGE_MAX_RETRIES 后进入死信队列。
+    """
+    headers = headers or {}
+    attempts = int(headers.get(ATTEMPTS_HEADER) or 0)
+    outages = int(headers.get(OUTAGE_RETRIES_HEADER) or 0)
+    if outage:
+        outages += 1
+        route = outage_queue() if outages <= settings.MQ_OUTAGE_MAX_RETRIES else DEAD_LETTER_QUEUE
+    else:
+        attempts += 1
+        route = failure_route(attempts)
+    return route, {ATTEMPTS_HEADER: attempts, OUTAGE_RETRIES_HEADER: outages, ERROR_HEADER: str(error)[:500]}
+
+
+def is_outage(error) -> bool:
+    """
+    判断失败是否由下游服务不可用引起（与消息内容无关，重试不消耗消息的重试次数）：
+    - 向量服务：全部实例熔断、连接失败或调用超时
+    - Embedding API：连接失败、超时、5xx、429 或熔断中
+    - 向量库 / Redis：连接失败或超时
+    """
+    if isinstance(error, (CircuitOpenError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, grpc.RpcError):
+        return error.code() in OUTAGE_CODES
+    if isinstance(error, (httpx.TransportError, RedisConnectionError, RedisTimeoutError)):
+        return True
+    return isinstance(error, Exception) and is_endpoint_failure(error)
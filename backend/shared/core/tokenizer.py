@@ -0,0 +1,66 @@
+import math
+import re
+import threading
+from loguru import logger
+from backend.shared.core.config import settings
+
+# 中日韩字符按单字计数，其余按单词/标点切分
+CJK_CHAR = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+WORD_OR_SYMBOL = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+# 每条对话消息的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class Tokenizer:
+    """
+    Token 计数器。
+    优先使用 tiktoken 的 BPE 编码 (TOKENIZER_ENCODING)；编码表加载失败（如离线环境无法下载）时
+    退化为启发式估算：CJK 字符 1 token/字，英文单词约 4 字符/token，标点 1 token。
+    编码表首次使用时加载，服务启动时可在线程中调用 load() 预热。
+    """
+
+    def __init__(self):
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(f"Tokenizer {settings.TOKENIZER_ENCODING} unavailable, using estimation: {e}")
+            self._loaded = True
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if not self._loaded:
+            self.load()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return self._estimate(text)
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        tokens = 0
+        for piece in WORD_OR_SYMBOL.findall(text):
+            if CJK_CHAR.match(piece) or len(piece) == 1:
+                tokens += 1
+            else:
+                tokens += math.ceil(len(piece) / 4)
+        return tokens
+
+    def count_messages(self, messages: list) -> int:
+        """
+        估算对话消息列表的 token 数（含每条消息的格式开销）。
+        """
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+tokenizer = Tokenizer()
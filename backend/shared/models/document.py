@@ -25,13 +25,23 @@ class Document(Base):
     __tablename__ = "documents"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Stable document identity (explicit id, or derived from tenant + filename)
+    # 稳定的文档标识（显式指定，或由租户 + 文件名生成），重新上传同一文档时保持不变
+    doc_id: Mapped[str] = mapped_column(String(64), unique=True, index=True, nullable=False)
+    tenant: Mapped[str] = mapped_column(String(64), nullable=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
-    content: Mapped[str] = mapped_column(Text, nullable=False)
+    # Full text is not kept for streamed uploads (流式上传不保存全文)
+    content: Mapped[str] = mapped_column(Text, nullable=True)
     status: Mapped[DocumentStatus] = mapped_column(SQLEnum(DocumentStatus), default=DocumentStatus.PENDING)
     
     # Stores the ID in ChromaDB (optional, or we use doc_id as metadata in chroma)
     # 存储 ChromaDB 中的 ID（可选，或者我们在 chroma 中使用 doc_id 作为元数据）
     vector_id: Mapped[str] = mapped_column(String(255), nullable=True)
+
+    # Content hashes of the indexed chunk set (JSON list), used to diff re-uploads
+    # 已索引切片的内容指纹集合（JSON 列表），重新上传时据此计算新增/删除的切片
+    chunk_hashes: Mapped[str] = mapped_column(Text, nullable=True)
+    chunk_count: Mapped[int] = mapped_column(Integer, default=0)
     
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
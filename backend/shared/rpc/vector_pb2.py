@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cvector.proto\x12\x06vector\"\x91\x01\n\rUpsertRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x35\n\x08metadata\x18\x03 \x03(\x0b\x32#.vector.UpsertRequest.MetadataEntry\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"0\n\x0eUpsertResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"\x1c\n\x0c\x45mbedRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x1f\n\rEmbedResponse\x12\x0e\n\x06vector\x18\x01 \x03(\x02\"E\n\rSearchRequest\x12\x12\n\nquery_text\x18\x01 \x01(\t\x12\r\n\x05top_k\x18\x02 \x01(\x05\x12\x11\n\tmin_score\x18\x03 \x01(\x02\"\xa1\x01\n\x0cSearchResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05score\x18\x02 \x01(\x02\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\t\x12\x34\n\x08metadata\x18\x04 \x03(\x0b\x32\".vector.SearchResult.MetadataEntry\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"7\n\x0eSearchResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.vector.SearchResult2\xbb\x01\n\rVectorService\x12\x38\n\tEmbedText\x12\x14.vector.EmbedRequest\x1a\x15.vector.EmbedResponse\x12\x37\n\x06Search\x12\x15.vector.SearchRequest\x1a\x16.vector.SearchResponse\x12\x37\n\x06Upsert\x12\x15.vector.UpsertRequest\x1a\x16.vector.UpsertResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cvector.proto\x12\x06vector\"\x91\x01\n\rUpsertRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x35\n\x08metadata\x18\x03 \x03(\x0b\x32#.vector.UpsertRequest.MetadataEntry\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"0\n\x0eUpsertResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05\x65rror\x18\x02 \x01(\t\"J\n\x0cUpsertResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x0e\n\x06outage\x18\x04 \x01(\x08\"<\n\x13\x42\x61tchUpsertResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.vector.UpsertResult\"2\n\x13\x44\x65leteChunksRequest\x12\x0e\n\x06\x64oc_id\x18\x01 \x01(\t\x12\x0b\n\x03ids\x18\x02 \x03(\t\"9\n\x14\x44\x65leteChunksResponse\x12\x10\n\x08released\x18\x01 \x01(\x05\x12\x0f\n\x07\x64\x65leted\x18\x02 \x01(\x05\"3\n\x14IndexedChunksRequest\x12\x0e\n\x06\x64oc_id\x18\x01 \x01(\t\x12\x0b\n\x03ids\x18\x02 \x03(\t\"$\n\x15IndexedChunksResponse\x12\x0b\n\x03ids\x18\x01 \x03(\t\"\x1c\n\x0c\x45mbedRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x1f\n\rEmbedResponse\x12\x0e\n\x06vector\x18\x01 \x03(\x02\"]\n\rSearchRequest\x12\x12\n\nquery_text\x18\x01 \x01(\t\x12\r\n\x05top_k\x18\x02 \x01(\x05\x12\x11\n\tmin_score\x18\x03 \x01(\x02\x12\x16\n\x0einclude_vector\x18\x04 \x01(\x08\"\xa1\x01\n\x0cSearchResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05score\x18\x02 \x01(\x02\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\t\x12\x34\n\x08metadata\x18\x04 \x03(\x0b\x32\".vector.SearchResult.MetadataEntry\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"M\n\x0eSearchResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.vector.SearchResult\x12\x14\n\x0cquery_vector\x18\x02 \x03(\x02\x32\x99\x03\n\rVectorService\x12\x38\n\tEmbedText\x12\x14.vector.EmbedRequest\x1a\x15.vector.EmbedResponse\x12\x37\n\x06Search\x12\x15.vector.SearchRequest\x1a\x16.vector.SearchResponse\x12\x37\n\x06Upsert\x12\x15.vector.UpsertRequest\x1a\x16.vector.UpsertResponse\x12\x43\n\x0b\x42\x61tchUpsert\x12\x15.vector.UpsertRequest\x1a\x1b.vector.BatchUpsertResponse(\x01\x12I\n\x0c\x44\x65leteChunks\x12\x1b.vector.DeleteChunksRequest\x1a\x1c.vector.DeleteChunksResponse\x12L\n\rIndexedChunks\x12\x1c.vector.IndexedChunksRequest\x1a\x1d.vector.IndexedChunksResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -41,18 +41,30 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_UPSERTREQUEST_METADATAENTRY']._serialized_end=170
   _globals['_UPSERTRESPONSE']._serialized_start=172
   _globals['_UPSERTRESPONSE']._serialized_end=220
-  _globals['_EMBEDREQUEST']._serialized_start=222
-  _globals['_EMBEDREQUEST']._serialized_end=250
-  _globals['_EMBEDRESPONSE']._serialized_start=252
-  _globals['_EMBEDRESPONSE']._serialized_end=283
-  _globals['_SEARCHREQUEST']._serialized_start=285
-  _globals['_SEARCHREQUEST']._serialized_end=354
-  _globals['_SEARCHRESULT']._serialized_start=357
-  _globals['_SEARCHRESULT']._serialized_end=518
+  _globals['_UPSERTRESULT']._serialized_start=222
+  _globals['_UPSERTRESULT']._serialized_end=296
+  _globals['_BATCHUPSERTRESPONSE']._serialized_start=298
+  _globals['_BATCHUPSERTRESPONSE']._serialized_end=358
+  _globals['_DELETECHUNKSREQUEST']._serialized_start=360
+  _globals['_DELETECHUNKSREQUEST']._serialized_end=410
+  _globals['_DELETECHUNKSRESPONSE']._serialized_start=412
+  _globals['_DELETECHUNKSRESPONSE']._serialized_end=469
+  _globals['_INDEXEDCHUNKSREQUEST']._serialized_start=471
+  _globals['_INDEXEDCHUNKSREQUEST']._serialized_end=522
+  _globals['_INDEXEDCHUNKSRESPONSE']._serialized_start=524
+  _globals['_INDEXEDCHUNKSRESPONSE']._serialized_end=560
+  _globals['_EMBEDREQUEST']._serialized_start=562
+  _globals['_EMBEDREQUEST']._serialized_end=590
+  _globals['_EMBEDRESPONSE']._serialized_start=592
+  _globals['_EMBEDRESPONSE']._serialized_end=623
+  _globals['_SEARCHREQUEST']._serialized_start=625
+  _globals['_SEARCHREQUEST']._serialized_end=718
+  _globals['_SEARCHRESULT']._serialized_start=721
+  _globals['_SEARCHRESULT']._serialized_end=882
   _globals['_SEARCHRESULT_METADATAENTRY']._serialized_start=123
   _globals['_SEARCHRESULT_METADATAENTRY']._serialized_end=170
-  _globals['_SEARCHRESPONSE']._serialized_start=520
-  _globals['_SEARCHRESPONSE']._serialized_end=575
-  _globals['_VECTORSERVICE']._serialized_start=578
-  _globals['_VECTORSERVICE']._serialized_end=765
+  _globals['_SEARCHRESPONSE']._serialized_start=884
+  _globals['_SEARCHRESPONSE']._serialized_end=961
+  _globals['_VECTORSERVICE']._serialized_start=964
+  _globals['_VECTORSERVICE']._serialized_end=1373
 # @@protoc_insertion_point(module_scope)
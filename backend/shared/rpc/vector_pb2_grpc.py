@@ -49,6 +49,21 @@ class VectorServiceStub(object):
                 request_serializer=vector__pb2.UpsertRequest.SerializeToString,
                 response_deserializer=vector__pb2.UpsertResponse.FromString,
                 _registered_method=True)
+        self.BatchUpsert = channel.stream_unary(
+                '/vector.VectorService/BatchUpsert',
+                request_serializer=vector__pb2.UpsertRequest.SerializeToString,
+                response_deserializer=vector__pb2.BatchUpsertResponse.FromString,
+                _registered_method=True)
+        self.DeleteChunks = channel.unary_unary(
+                '/vector.VectorService/DeleteChunks',
+                request_serializer=vector__pb2.DeleteChunksRequest.SerializeToString,
+                response_deserializer=vector__pb2.DeleteChunksResponse.FromString,
+                _registered_method=True)
+        self.IndexedChunks = channel.unary_unary(
+                '/vector.VectorService/IndexedChunks',
+                request_serializer=vector__pb2.IndexedChunksRequest.SerializeToString,
+                response_deserializer=vector__pb2.IndexedChunksResponse.FromString,
+                _registered_method=True)
 
 
 class VectorServiceServicer(object):
@@ -72,6 +87,27 @@ class VectorServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BatchUpsert(self, request_iterator, context):
+        """Client-streaming: chunks are embedded and written in batches
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def DeleteChunks(self, request, context):
+        """Drop a document's reference from chunks; chunks left without references are deleted
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def IndexedChunks(self, request, context):
+        """Which of the given chunks are indexed and referenced by the document (confirmed by the consumer)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_VectorServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -90,6 +126,21 @@ def add_VectorServiceServicer_to_server(servicer, server):
                     request_deserializer=vector__pb2.UpsertRequest.FromString,
                     response_serializer=vector__pb2.UpsertResponse.SerializeToString,
             ),
+            'BatchUpsert': grpc.stream_unary_rpc_method_handler(
+                    servicer.BatchUpsert,
+                    request_deserializer=vector__pb2.UpsertRequest.FromString,
+                    response_serializer=vector__pb2.BatchUpsertResponse.SerializeToString,
+            ),
+            'DeleteChunks': grpc.unary_unary_rpc_method_handler(
+                    servicer.DeleteChunks,
+                    request_deserializer=vector__pb2.DeleteChunksRequest.FromString,
+                    response_serializer=vector__pb2.DeleteChunksResponse.SerializeToString,
+            ),
+            'IndexedChunks': grpc.unary_unary_rpc_method_handler(
+                    servicer.IndexedChunks,
+                    request_deserializer=vector__pb2.IndexedChunksRequest.FromString,
+                    response_serializer=vector__pb2.IndexedChunksResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'vector.VectorService', rpc_method_handlers)
@@ -181,3 +232,84 @@ class VectorService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def BatchUpsert(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/vector.VectorService/BatchUpsert',
+            vector__pb2.UpsertRequest.SerializeToString,
+            vector__pb2.BatchUpsertResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def DeleteChunks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vector.VectorService/DeleteChunks',
+            vector__pb2.DeleteChunksRequest.SerializeToString,
+            vector__pb2.DeleteChunksResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def IndexedChunks(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vector.VectorService/IndexedChunks',
+            vector__pb2.IndexedChunksRequest.SerializeToString,
+            vector__pb2.IndexedChunksResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
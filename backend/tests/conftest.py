@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试以仓库根目录为导入起点（与各服务入口脚本相同，使用 backend.* 绝对导入）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
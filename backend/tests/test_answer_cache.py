@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+import pytest
+from backend.rag_engine.core import answer_cache as answer_cache_module
+from backend.rag_engine.core.answer_cache import AnswerCache, normalize_query
+from backend.shared.core.config import settings
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    return AnswerCache()
+
+
+def test_normalize_query_ignores_case_whitespace_and_trailing_punctuation():
+    assert normalize_query("  What   is RAG？ ") == normalize_query("what is rag")
+
+
+def test_exact_hit_for_normalized_query(cache):
+    context = AnswerCache.context_key(["b", "a"], "qwen")
+    cache.put(AnswerCache.make_key("What is RAG?", context), context, "answer")
+
+    # 切片顺序不影响上下文键
+    same_context = AnswerCache.context_key(["a", "b"], "qwen")
+    assert cache.get(AnswerCache.make_key("what is rag", same_context), same_context) == "answer"
+    other_model = AnswerCache.context_key(["a", "b"], "gpt")
+    assert cache.get(AnswerCache.make_key("what is rag", other_model), other_model) is None
+
+
+def test_entries_expire_after_ttl(cache, clock, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_TTL", 60)
+    context = AnswerCache.context_key(["a"], "qwen")
+    key = AnswerCache.make_key("q", context)
+    cache.put(key, context, "answer")
+
+    clock.now += 59
+    assert cache.get(key, context) == "answer"
+    clock.now += 2
+    assert cache.get(key, context) is None
+    assert not cache._entries and not cache._by_context
+
+
+def test_kb_version_change_invalidates(cache):
+    context = AnswerCache.context_key(["a"], "qwen")
+    key = AnswerCache.make_key("q", context)
+    cache.sync_version("1")
+    cache.put(key, context, "answer")
+
+    cache.sync_version("1")
+    assert cache.get(key, context) == "answer"
+    cache.sync_version("2")
+    assert cache.get(key, context) is None
+
+
+def test_lru_eviction(cache, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 2)
+    context = AnswerCache.context_key(["a"], "qwen")
+    keys = [AnswerCache.make_key(q, context) for q in ("q1", "q2", "q3")]
+    cache.put(keys[0], context, "a1")
+    cache.put(keys[1], context, "a2")
+    assert cache.get(keys[0], context) == "a1"  # q1 变为最近使用
+    cache.put(keys[2], context, "a3")
+
+    assert cache.get(keys[1], context) is None
+    assert cache.get(keys[0], context) == "a1"
+    assert cache.get(keys[2], context) == "a3"
+
+
+def test_semantic_hit_requires_same_context(cache, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_SEMANTIC_ENABLED", True)
+    monkeypatch.setattr(settings, "ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95)
+    context = AnswerCache.context_key(["a"], "qwen")
+    cache.put(AnswerCache.make_key("how to deploy", context), context, "answer", embedding=[1.0, 0.0])
+
+    near = [0.99, 0.05]
+    assert cache.get(AnswerCache.make_key("deployment steps", context), context, near) == "answer"
+    assert cache.get(AnswerCache.make_key("deployment steps", context), context, [0.0, 1.0]) is None
+
+    other = AnswerCache.context_key(["b"], "qwen")
+    assert cache.get(AnswerCache.make_key("deployment steps", other), other, near) is None
+
+
+def test_semantic_lookup_disabled_by_default(cache, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_SEMANTIC_ENABLED", False)
+    context = AnswerCache.context_key(["a"], "qwen")
+    cache.put(AnswerCache.make_key("how to deploy", context), context, "answer", embedding=[1.0, 0.0])
+    assert cache.get(AnswerCache.make_key("deployment steps", context), context, [1.0, 0.0]) is None
+
+
+def test_answers_are_not_shared_across_users_or_history(cache, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_SEMANTIC_ENABLED", True)
+    monkeypatch.setattr(settings, "ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95)
+    history = [{"role": "user", "content": "I use Kubernetes"}, {"role": "assistant", "content": "ok"}]
+    context = AnswerCache.context_key(["a"], "qwen", "alice", history)
+    cache.put(AnswerCache.make_key("how to deploy", context), context, "answer", embedding=[1.0, 0.0])
+
+    same = AnswerCache.context_key(["a"], "qwen", "alice", [dict(m) for m in history])
+    assert cache.get(AnswerCache.make_key("how to deploy", same), same, [1.0, 0.0]) == "answer"
+    for other in (
+        AnswerCache.context_key(["a"], "qwen", "bob", history),
+        AnswerCache.context_key(["a"], "qwen", "alice", []),
+        AnswerCache.context_key(["a"], "qwen", "alice", history[:1]),
+    ):
+        assert cache.get(AnswerCache.make_key("how to deploy", other), other, [1.0, 0.0]) is None
@@ -0,0 +1,152 @@
+import asyncio
+import uuid
+import grpc
+import pytest
+from backend.shared.core.balancer import LoadBalancer, healthy_instances
+from backend.shared.core.circuit_breaker import get_breaker
+from backend.shared.core.config import settings
+from backend.shared.core.grpc_pool import BalancerInterceptor
+
+
+def instances(*specs) -> list:
+    return [{"ip": ip, "port": 80, "weight": weight} for ip, weight in specs]
+
+
+@pytest.fixture
+def balancer():
+    # 熔断器按服务名全局共享，每个测试使用独立的服务名
+    return LoadBalancer(f"svc-{uuid.uuid4().hex[:8]}")
+
+
+def test_prefers_lower_latency(balancer):
+    balancer.update(instances(("fast", 1), ("slow", 1)))
+    balancer.observe("fast:80", 0.01)
+    balancer.observe("slow:80", 0.2)
+    assert {balancer.pick() for _ in range(50)} == {"fast:80"}
+
+
+def test_outstanding_requests_shift_load(balancer):
+    balancer.update(instances(("a", 1), ("b", 1)))
+    balancer.observe("a:80", 0.05)
+    balancer.observe("b:80", 0.05)
+    for _ in range(3):
+        balancer.acquire("a:80")
+    assert balancer.pick() == "b:80"
+    for _ in range(3):
+        balancer.release("a:80")
+    balancer.acquire("b:80")
+    assert balancer.pick() == "a:80"
+
+
+def test_weight_scales_cost(balancer):
+    balancer.update(instances(("big", 3), ("small", 1)))
+    balancer.observe("big:80", 0.05)
+    balancer.observe("small:80", 0.05)
+    # 代价 = (未完成请求数 + 1) × 延迟 / 权重：权重 3 的实例承担约 3 倍并发
+    balancer.acquire("big:80")
+    assert balancer.pick() == "big:80"
+    balancer.acquire("big:80")
+    balancer.acquire("big:80")
+    assert balancer.pick() == "small:80"
+
+
+def test_failures_are_penalized(balancer, monkeypatch):
+    monkeypatch.setattr(settings, "BALANCER_FAILURE_PENALTY", 1.0)
+    balancer.update(instances(("a", 1), ("b", 1)))
+    balancer.observe("a:80", 0.05)
+    balancer.observe("b:80", 0.05)
+    balancer.observe("a:80", 0.001, failed=True)
+    assert balancer.pick() == "b:80"
+    assert balancer.stats()["a:80"]["ewma_latency"] > balancer.stats()["b:80"]["ewma_latency"]
+
+
+def test_new_instance_starts_at_average_latency(balancer):
+    balancer.update(instances(("a", 1)))
+    balancer.observe("a:80", 0.1)
+    balancer.update(instances(("a", 1), ("b", 1)))
+    assert balancer.stats()["b:80"]["ewma_latency"] == pytest.approx(0.1)
+
+
+def test_zero_weight_and_removed_instances(balancer):
+    balancer.update(instances(("a", 1), ("drained", 0)))
+    assert {balancer.pick() for _ in range(20)} == {"a:80"}
+
+    balancer.acquire("a:80")
+    balancer.update(instances(("b", 1)))
+    # 已下线的实例保留统计直到未完成请求结束
+    assert balancer.stats()["a:80"]["available"] is False
+    balancer.release("a:80", 0.05)
+    balancer.update(instances(("b", 1)))
+    assert set(balancer.stats()) == {"b:80"}
+
+
+def test_default_target_when_no_instances(balancer):
+    assert balancer.pick() is None
+    assert balancer.pick("localhost:1") == "localhost:1"
+
+
+def test_half_open_probe_is_claimed_during_pick(balancer, monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 0.0)
+    balancer.update(instances(("a", 1), ("b", 1)))
+    balancer.observe("a:80", 0.01)
+    balancer.observe("b:80", 0.5)
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        get_breaker(balancer.service_name, "a:80").record(failed=True)
+
+    # a 摘除期满进入半开状态：第一个请求作为探测发往 a，探测未完成时其余请求改选 b
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 60.0)
+    assert balancer.pick() == "a:80"
+    assert {balancer.pick() for _ in range(20)} == {"b:80"}
+
+    balancer.observe("a:80", 0.01)
+    assert get_breaker(balancer.service_name, "a:80").state == "closed"
+    assert balancer.pick() == "a:80"
+
+
+def test_healthy_instances_filters_nacos_result():
+    hosts = [
+        {"ip": "a", "port": 1},
+        {"ip": "b", "port": 1, "healthy": False},
+        {"ip": "c", "port": 1, "enabled": False},
+    ]
+    assert healthy_instances({"hosts": hosts}) == hosts[:1]
+    assert healthy_instances(hosts) == hosts[:1]
+
+
+class FakeCall:
+    def __init__(self, code):
+        self._code = code
+
+    async def code(self):
+        return self._code
+
+
+def test_interceptor_ignores_cancelled_calls(balancer, monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    balancer.update(instances(("a", 1)))
+    interceptor = BalancerInterceptor(balancer, "a:80")
+    breaker = get_breaker(balancer.service_name, "a:80")
+
+    async def hang(details, request):
+        await asyncio.sleep(10)
+
+    async def cancelled_call(details, request):
+        return FakeCall(grpc.StatusCode.CANCELLED)
+
+    async def unavailable(details, request):
+        return FakeCall(grpc.StatusCode.UNAVAILABLE)
+
+    async def main():
+        task = asyncio.create_task(interceptor.intercept_unary_unary(hang, None, None))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await interceptor.intercept_unary_unary(cancelled_call, None, None)
+        assert balancer.stats()["a:80"]["in_flight"] == 0
+        assert breaker.state == "closed"
+
+        await interceptor.intercept_unary_unary(unavailable, None, None)
+        assert breaker.state == "open"
+
+    asyncio.run(main())
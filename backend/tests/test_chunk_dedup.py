@@ -0,0 +1,208 @@
+import asyncio
+import pytest
+from backend.shared.core.mq import content_hash
+from backend.shared.rpc import vector_pb2
+from backend.vector_service.core import chunk_refs as chunk_refs_module
+from backend.vector_service.core import embedding_cache as embedding_cache_module
+from backend.vector_service.core.local_index import LocalVectorStore
+from backend.vector_service.services import vector_service as vector_service_module
+from backend.vector_service.services.vector_service import VectorService
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        calls, self._calls = self._calls, []
+        return [await getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+class FakeRedis:
+    """
+    只实现引用表与知识库版本号用到的命令。
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hexists(self, key, field):
+        return field in self.hashes.get(key, {})
+
+    async def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+    async def hdel(self, key, field):
+        removed = self.hashes.get(key, {}).pop(field, None) is not None
+        if key in self.hashes and not self.hashes[key]:
+            del self.hashes[key]
+        return int(removed)
+
+    async def hrandfield(self, key, count, withvalues=False):
+        items = list(self.hashes.get(key, {}).items())[:count]
+        return [v for item in items for v in item] if withvalues else [k for k, _ in items]
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    async def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(chunk_refs_module, "redis_client", redis)
+    monkeypatch.setattr(vector_service_module, "redis_client", redis)
+    return redis
+
+
+@pytest.fixture
+def service(tmp_path, redis, monkeypatch):
+    monkeypatch.setattr(vector_service_module, "get_llm_client", lambda: None)
+    store = LocalVectorStore("dedup", path=str(tmp_path))
+    monkeypatch.setattr(vector_service_module, "get_vector_store", lambda: store)
+    service = VectorService()
+    service.embedded = []
+
+    async def fake_embeddings(texts: list) -> list:
+        service.embedded.extend(texts)
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    service._get_embeddings = fake_embeddings
+    return service
+
+
+def request(doc_id: str, index: int, text: str, source: str = None) -> vector_pb2.UpsertRequest:
+    return vector_pb2.UpsertRequest(
+        id=f"{doc_id}_{index}",
+        text=text,
+        metadata={
+            "doc_id": doc_id,
+            "source": source or f"{doc_id}.txt",
+            "chunk_index": str(index),
+            "content_hash": content_hash(text),
+        },
+    )
+
+
+def entries(service) -> dict:
+    result = asyncio.run(service.collection.get(include=["metadatas"]))
+    return dict(zip(result["ids"], result["metadatas"]))
+
+
+def test_duplicate_content_is_embedded_once(service, redis):
+    results = asyncio.run(service._upsert_batch([
+        request("a", 0, "shared text"),
+        request("a", 1, "unique to a"),
+        request("b", 0, "shared  text"),  # 仅空白不同，内容指纹相同
+    ]))
+    assert all(r.success for r in results)
+    assert [r.id for r in results] == ["a_0", "a_1", "b_0"]
+    assert sorted(service.embedded) == ["shared  text", "unique to a"]
+
+    shared = content_hash("shared text")
+    assert set(entries(service)) == {shared, content_hash("unique to a")}
+    assert redis.hashes[f"chunk_refs:{shared}"] == {"a": "a.txt", "b": "b.txt"}
+    assert redis.values
+
+
+def test_existing_content_only_adds_a_reference(service, redis):
+    asyncio.run(service._upsert_batch([request("a", 0, "shared text")]))
+    service.embedded.clear()
+    version = dict(redis.values)
+
+    asyncio.run(service._upsert_batch([request("b", 3, "shared text")]))
+    assert service.embedded == []
+    assert redis.hashes[f"chunk_refs:{content_hash('shared text')}"] == {"a": "a.txt", "b": "b.txt"}
+    # 没有新条目时知识库内容不变，回答缓存不需要失效
+    assert redis.values == version
+
+
+def test_search_metadata_hides_internal_fields(service):
+    asyncio.run(service._upsert_batch([request("a", 0, "shared text")]))
+    (metadata,) = entries(service).values()
+    assert metadata["content_hash"] == content_hash("shared text")
+    assert "doc_refs" not in metadata and "ref_count" not in metadata
+    assert "content_hash" in vector_service_module.INTERNAL_METADATA
+
+
+def test_release_keeps_entries_still_referenced(service, redis):
+    shared, only_a = content_hash("shared text"), content_hash("unique to a")
+    asyncio.run(service._upsert_batch([
+        request("a", 0, "shared text"), request("a", 1, "unique to a"), request("b", 0, "shared text"),
+    ]))
+
+    released, deleted = asyncio.run(service._release_chunks("a", [shared, only_a]))
+    assert (released, deleted) == (2, 1)
+    stored = entries(service)
+    assert set(stored) == {shared}
+    # 展示用的来源切换为仍引用该内容的文档
+    assert (stored[shared]["doc_id"], stored[shared]["source"]) == ("b", "b.txt")
+    assert f"chunk_refs:{only_a}" not in redis.hashes
+    assert redis.hashes[f"chunk_refs:{shared}"] == {"b": "b.txt"}
+
+    # 重复释放不产生影响
+    assert asyncio.run(service._release_chunks("a", [shared, only_a])) == (0, 0)
+
+    assert asyncio.run(service._release_chunks("b", [shared])) == (1, 1)
+    assert entries(service) == {}
+    assert redis.hashes == {}
+
+
+
+def test_indexed_chunks_reports_only_confirmed_references(service):
+    shared = content_hash("shared text")
+    asyncio.run(service._upsert_batch([request("a", 0, "shared text")]))
+
+    response = asyncio.run(service.IndexedChunks(
+        vector_pb2.IndexedChunksRequest(doc_id="a", ids=[shared, content_hash("pending")]), None
+    ))
+    assert list(response.ids) == [shared]
+    response = asyncio.run(service.IndexedChunks(vector_pb2.IndexedChunksRequest(doc_id="b", ids=[shared]), None))
+    assert list(response.ids) == []
+
+
+class FailingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, model, input):
+        self.calls += 1
+        raise RuntimeError("Error code: 400 - Arrearage")
+
+
+def test_embedding_failure_fails_the_upsert_instead_of_storing_random_vectors(service, redis, monkeypatch):
+    monkeypatch.setattr(embedding_cache_module, "redis_client", redis)
+    del service._get_embeddings  # 使用真实的向量化路径
+    service.client = type("Client", (), {"embeddings": FailingEmbeddings()})()
+
+    results = asyncio.run(service._upsert_batch([request("a", 0, "embedding outage text")]))
+    assert not results[0].success
+    assert "Arrearage" in results[0].error
+    assert entries(service) == {}
+
+    # 检索仍可退化为随机向量，不影响链路验证
+    vectors = asyncio.run(service._get_query_embeddings(["embedding outage query"]))
+    assert len(vectors) == 1 and len(vectors[0]) == 1536
@@ -0,0 +1,117 @@
+import random
+import pytest
+from backend.knowledge_service.core import chunker as chunker_module
+from backend.knowledge_service.core.chunker import (
+    ParagraphChunker,
+    SlidingWindowChunker,
+    get_chunker,
+    split_by_tokens,
+)
+from backend.shared.core.tokenizer import tokenizer
+
+
+def sample_text(sentences: int = 120, seed: int = 3) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sentences):
+        if rng.random() < 0.3:
+            parts.append("向量检索服务按内容指纹去重，" * rng.randint(1, 4) + f"第{i}句。")
+        else:
+            parts.append(" ".join(f"word{i}x{j}" for j in range(rng.randint(3, 30))) + ". ")
+        if rng.random() < 0.1:
+            parts.append("\n\n")
+    return "".join(parts)
+
+
+def run(chunker, text: str, piece: int = None) -> list:
+    pieces = [text] if piece is None else [text[i:i + piece] for i in range(0, len(text), piece)]
+    output = []
+    for p in pieces:
+        output.extend(chunker.feed(p))
+    output.extend(chunker.finish())
+    return output
+
+
+@pytest.mark.parametrize("max_tokens,overlap", [(64, 8), (128, 32), (40, 0)])
+def test_window_chunks_never_exceed_max_tokens(max_tokens, overlap):
+    chunks = run(SlidingWindowChunker(max_tokens, overlap, min_tokens=20), sample_text())
+    assert chunks
+    assert max(tokenizer.count(c) for c in chunks) <= max_tokens
+
+
+def test_window_output_independent_of_feed_boundaries():
+    text = sample_text()
+    expected = run(SlidingWindowChunker(64, 8, 16), text)
+    for piece in (1, 7, 100, 1000):
+        assert run(SlidingWindowChunker(64, 8, 16), text, piece) == expected
+
+
+def test_window_covers_every_sentence_and_overlaps_neighbours():
+    text = " ".join(f"Sentence number {i} ends here." for i in range(200))
+    chunks = run(SlidingWindowChunker(50, 15, 10), text)
+    for i in range(200):
+        assert any(f"Sentence number {i} ends" in c for c in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.split(". ")[-1].rstrip(".") in current
+
+
+class WordTokenizer:
+    """
+    按空白分词计数，便于精确构造切片边界。
+    """
+
+    @staticmethod
+    def count(text: str) -> int:
+        return len(text.split())
+
+
+def sentence(word: str, n: int) -> str:
+    return " ".join([word] * n) + ". "
+
+
+def test_small_tail_borrows_context_within_max_tokens(monkeypatch):
+    monkeypatch.setattr(chunker_module, "tokenizer", WordTokenizer())
+
+    # 末尾碎片 (4) 不足 min_tokens：从上一切片末尾借入整句，补足到 max_tokens 以内
+    text = sentence("a", 3) + sentence("d", 3) + sentence("e", 3) + sentence("b", 4)
+    chunks = run(SlidingWindowChunker(10, 0, min_tokens=5), text)
+    assert [WordTokenizer.count(c) for c in chunks] == [9, 10]
+    assert chunks[1] == "d d d. e e e. b b b b."
+
+    # 有重叠时只借入重叠部分之前的句子，不会重复
+    chunks = run(SlidingWindowChunker(10, 3, min_tokens=5), text)
+    assert chunks[1] == "d d d. e e e. b b b b."
+
+    # 上一切片没有可借入的整句时，碎片单独成片
+    chunks = run(SlidingWindowChunker(10, 0, min_tokens=5), sentence("a", 9) + sentence("b", 4))
+    assert [WordTokenizer.count(c) for c in chunks] == [9, 4]
+
+    # 足够大的末尾切片保持原样
+    chunks = run(SlidingWindowChunker(10, 0, min_tokens=5), sentence("a", 9) + sentence("b", 6))
+    assert [WordTokenizer.count(c) for c in chunks] == [9, 6]
+
+
+def test_oversized_sentence_is_split():
+    text = "x" * 5000
+    chunks = run(SlidingWindowChunker(32, 4, 8), text)
+    assert "".join(chunks) == text
+    assert max(tokenizer.count(c) for c in chunks) <= 32
+    assert all(tokenizer.count(p) <= 10 for p in split_by_tokens("word " * 200, 10))
+
+
+@pytest.mark.parametrize("size,overlap", [(0, 0), (-5, 0), (10, 10), (10, -1)])
+def test_invalid_window_parameters_are_rejected(size, overlap):
+    with pytest.raises(ValueError):
+        get_chunker("window", chunk_size=size, chunk_overlap=overlap)
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        get_chunker("sentence")
+
+
+def test_paragraph_chunker_matches_split():
+    text = sample_text() + "\n\n\n  \n\nlast paragraph\n"
+    expected = [p.strip() for p in text.split("\n\n") if p.strip()]
+    for piece in (None, 1, 3, 50):
+        assert run(ParagraphChunker(), text, piece) == expected
@@ -0,0 +1,189 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+import pytest
+from openai import APIConnectionError, APIStatusError, BadRequestError, InternalServerError, RateLimitError
+from backend.gateway_service.routers.proxy import INSTANCE_FAILURE_STATUS
+from backend.shared.core import circuit_breaker as circuit_breaker_module
+from backend.shared.core.balancer import LoadBalancer
+from backend.shared.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, get_breaker
+from backend.shared.core.config import settings
+from backend.shared.core.llm_factory import CircuitBreakerEndpoint, is_endpoint_failure
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 10.0)
+    monkeypatch.setattr(settings, "CIRCUIT_MAX_OPEN_SECONDS", 40.0)
+    monkeypatch.setattr(settings, "CIRCUIT_MAX_EJECTION_PERCENT", 50.0)
+
+
+def service_name() -> str:
+    return f"svc-{uuid.uuid4().hex[:8]}"
+
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record(failed=True)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(service_name(), "a")
+    breaker.record(failed=True)
+    breaker.record(failed=True)
+    breaker.record(failed=False)  # 成功重置连续失败计数
+    breaker.record(failed=True)
+    breaker.record(failed=True)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record(failed=True)
+    assert breaker.state == OPEN
+    assert not breaker.available() and not breaker.allow()
+
+
+def test_half_open_admits_a_single_probe(clock):
+    breaker = CircuitBreaker(service_name(), "a")
+    trip(breaker)
+    clock.now += 10
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # 探测未完成时其余请求仍被拒绝
+    assert not breaker.available() and not breaker.allow()
+
+    breaker.record(failed=False)
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_lost_probe_expires(clock):
+    breaker = CircuitBreaker(service_name(), "a")
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1  # 探测请求未回报结果（如被取消），超时后允许新的探测
+    assert breaker.allow()
+
+
+def test_ejection_time_doubles_up_to_the_cap_and_resets_on_recovery(clock):
+    breaker = CircuitBreaker(service_name(), "a")
+    trip(breaker)
+    for duration in (10, 20, 40, 40):
+        clock.now += duration - 0.1
+        assert not breaker.allow()
+        clock.now += 0.1
+        assert breaker.allow()
+        breaker.record(failed=True)  # 探测失败，再次摘除且时长翻倍
+        assert breaker.state == OPEN
+
+    clock.now += 40
+    assert breaker.allow()
+    breaker.record(failed=False)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_results_reported_while_open_do_not_extend_ejection(clock):
+    breaker = CircuitBreaker(service_name(), "a")
+    trip(breaker)
+    for _ in range(5):
+        breaker.record(failed=True)
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_panic_mode_when_too_many_instances_are_ejected(clock):
+    balancer = LoadBalancer(service_name())
+    balancer.update([{"ip": ip, "port": 80} for ip in "abcd"])
+
+    # 摘除一半（未超过 50%）：只在其余实例中选择
+    trip(get_breaker(balancer.service_name, "a:80"))
+    trip(get_breaker(balancer.service_name, "b:80"))
+    assert {balancer.pick() for _ in range(100)} == {"c:80", "d:80"}
+
+    # 超过上限后忽略熔断状态，在全部实例中选择
+    trip(get_breaker(balancer.service_name, "c:80"))
+    assert {balancer.pick() for _ in range(200)} == {"a:80", "b:80", "c:80", "d:80"}
+
+    # 全部摘除时同样回退到全部实例，而不是拒绝请求
+    trip(get_breaker(balancer.service_name, "d:80"))
+    assert balancer.pick() in {"a:80", "b:80", "c:80", "d:80"}
+
+
+def test_all_ejected_falls_back_even_without_cap(clock, monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_MAX_EJECTION_PERCENT", 100.0)
+    balancer = LoadBalancer(service_name())
+    balancer.update([{"ip": "a", "port": 80}, {"ip": "b", "port": 80}])
+    trip(get_breaker(balancer.service_name, "a:80"))
+    assert {balancer.pick() for _ in range(20)} == {"b:80"}
+    trip(get_breaker(balancer.service_name, "b:80"))
+    assert balancer.pick() in {"a:80", "b:80"}
+
+
+def test_gateway_counts_only_outage_statuses():
+    assert INSTANCE_FAILURE_STATUS == {502, 503, 504}
+
+
+def status_error(cls, status_code: int):
+    """
+    构造 SDK 状态码异常（不依赖 SDK 所用 HTTP 库的 Response 类型）。
+    """
+    error = cls.__new__(cls)
+    error.status_code = status_code
+    return error
+
+
+def test_llm_failure_classification():
+    assert is_endpoint_failure(APIConnectionError.__new__(APIConnectionError))
+    assert is_endpoint_failure(status_error(InternalServerError, 503))
+    assert is_endpoint_failure(status_error(RateLimitError, 429))
+    assert not is_endpoint_failure(status_error(BadRequestError, 400))
+    assert not is_endpoint_failure(status_error(APIStatusError, 404))
+    assert not is_endpoint_failure(ValueError("bad input"))
+
+
+def test_llm_endpoint_fails_fast_outside_the_sdk(clock):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise status_error(InternalServerError, 500)
+
+    base_url = f"http://{service_name()}/v1/"
+    chat = CircuitBreakerEndpoint(create, base_url, "/chat/completions")
+    embeddings = CircuitBreakerEndpoint(create, base_url, "/embeddings")
+    assert chat.instance != embeddings.instance
+    assert chat.instance.endswith("/v1/chat/completions")
+
+    async def main():
+        for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+            with pytest.raises(InternalServerError):
+                await chat.create(model="m")
+        # 熔断期间直接抛出 CircuitOpenError，不调用 SDK（也就不会被 SDK 重试）
+        with pytest.raises(CircuitOpenError):
+            await chat.create(model="m")
+        assert len(calls) == settings.CIRCUIT_FAILURE_THRESHOLD
+        # Embedding 接口独立熔断
+        with pytest.raises(InternalServerError):
+            await embeddings.create(model="m")
+
+    asyncio.run(main())
+    assert len(calls) == settings.CIRCUIT_FAILURE_THRESHOLD + 1
@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+import pytest
+from backend.rag_engine.core.context_packer import jaccard, pack_prompt, shingles
+from backend.shared.core.config import settings
+from backend.shared.core.tokenizer import tokenizer
+
+TEMPLATE = "Answer using the context.\n{context}"
+
+
+@dataclass
+class Chunk:
+    content: str
+
+
+def words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+@pytest.fixture(autouse=True)
+def budgets(monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", 400)
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_BUDGET", 200)
+    monkeypatch.setattr(settings, "CONTEXT_DEDUP_THRESHOLD", 0.9)
+
+
+def test_prompt_stays_within_budget():
+    chunks = [Chunk(words(f"c{i}x", 60)) for i in range(10)]
+    history = []
+    for i in range(10):
+        history += [{"role": "user", "content": words(f"u{i}x", 30)},
+                    {"role": "assistant", "content": words(f"a{i}x", 30)}]
+
+    packed = pack_prompt(TEMPLATE, "question", chunks, history)
+    assert packed.prompt_tokens <= settings.PROMPT_TOKEN_BUDGET
+    assert tokenizer.count_messages(packed.messages) <= packed.prompt_tokens
+    assert sum(tokenizer.count(c.content) + 1 for c in packed.chunks) <= settings.CONTEXT_TOKEN_BUDGET
+    assert packed.chunks and len(packed.chunks) < len(chunks)
+    assert packed.messages[0]["role"] == "system"
+    assert packed.messages[-1] == {"role": "user", "content": "question"}
+
+
+def test_chunks_keep_rank_order_and_skip_ones_that_do_not_fit():
+    big = Chunk(words("big", 500))
+    small = [Chunk(words(f"s{i}x", 10)) for i in range(3)]
+    packed = pack_prompt(TEMPLATE, "question", [small[0], big, small[1], small[2]], [])
+    assert packed.chunks == small
+    system = packed.messages[0]["content"]
+    assert system.index(small[0].content) < system.index(small[1].content) < system.index(small[2].content)
+
+
+def test_near_duplicate_chunks_are_dropped():
+    original = Chunk("The deployment guide explains how to configure Nacos and RabbitMQ for production.")
+    reformatted = Chunk("The  deployment guide explains how to configure Nacos and RabbitMQ for production")
+    other = Chunk("Chunk references are stored in Redis hashes keyed by content hash.")
+    assert jaccard(shingles(original.content), shingles(reformatted.content)) >= 0.9
+
+    packed = pack_prompt(TEMPLATE, "question", [original, reformatted, other], [])
+    assert packed.chunks == [original, other]
+
+
+def test_history_is_kept_newest_first_in_whole_turns(monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_BUDGET", 0)
+    history = []
+    for i in range(6):
+        history += [{"role": "user", "content": words(f"u{i}x", 40)},
+                    {"role": "assistant", "content": words(f"a{i}x", 40)}]
+
+    packed = pack_prompt(TEMPLATE, "question", [], history)
+    kept = packed.messages[1:-1]
+    assert 0 < len(kept) < len(history)
+    assert len(kept) % 2 == 0
+    # 保留的是最近的若干轮，且顺序不变
+    assert kept == history[-len(kept):]
+
+
+def test_everything_fits_when_budget_allows(monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", 100_000)
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_BUDGET", 50_000)
+    chunks = [Chunk(words(f"c{i}x", 20)) for i in range(3)]
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    packed = pack_prompt(TEMPLATE, "question", chunks, history)
+    assert packed.chunks == chunks
+    assert packed.messages[1:-1] == history
@@ -0,0 +1,80 @@
+import asyncio
+import uuid
+import httpx
+import pytest
+from starlette.requests import ClientDisconnect, Request
+from backend.gateway_service.routers import proxy
+from backend.shared.core.balancer import get_balancer
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    上游服务：返回分块的响应体，记录响应是否被关闭；实例 up:80 由服务发现返回。
+    """
+    service = f"svc-{uuid.uuid4().hex[:8]}"
+    state = {"closed": False}
+
+    class Body(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for _ in range(3):
+                yield b"chunk"
+
+        async def aclose(self):
+            state["closed"] = True
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=Body())))
+    monkeypatch.setattr(proxy.http_pool, "client", lambda name: client)
+    monkeypatch.setattr(proxy.registry, "get_service", lambda name: [{"ip": "up", "port": 80}])
+    state["service"] = service
+    return state
+
+
+def make_request() -> Request:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": [], "client": None}
+    return Request(scope, receive)
+
+
+def in_flight(service: str) -> int:
+    return get_balancer(service).stats()["up:80"]["in_flight"]
+
+
+async def serve(response, fail_on: str, spec_version: str = "2.4"):
+    """
+    以 ASGI 方式发送响应，客户端在收到 fail_on 类型的消息时断开。
+    """
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == fail_on:
+            raise OSError("client went away")
+
+    scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+    await response(scope, receive, send)
+
+
+@pytest.mark.parametrize("fail_on", ["http.response.start", "http.response.body"])
+def test_client_disconnect_releases_upstream(upstream, fail_on):
+    async def main():
+        response = await proxy.proxy_request(make_request(), upstream["service"], "/", timeout=5)
+        assert in_flight(upstream["service"]) == 1
+        with pytest.raises(ClientDisconnect):
+            await serve(response, fail_on)
+
+    asyncio.run(main())
+    assert upstream["closed"]
+    assert in_flight(upstream["service"]) == 0
+
+
+def test_completed_response_releases_once(upstream):
+    async def main():
+        response = await proxy.proxy_request(make_request(), upstream["service"], "/", timeout=5)
+        await serve(response, fail_on=None)
+
+    asyncio.run(main())
+    assert upstream["closed"]
+    assert in_flight(upstream["service"]) == 0
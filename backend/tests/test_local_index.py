@@ -0,0 +1,187 @@
+import threading
+import numpy as np
+import pytest
+from backend.shared.core.config import settings
+from backend.vector_service.core import local_index
+from backend.vector_service.core.local_index import LocalVectorStore, normalize
+
+DIM = 32
+SIZE = 3000
+
+
+@pytest.fixture
+def data():
+    """
+    带簇结构的测试向量（与真实 Embedding 一样在空间中成团分布）。
+    """
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(40, DIM))
+    points = centers[rng.integers(len(centers), size=SIZE)] + rng.normal(scale=0.4, size=(SIZE, DIM))
+    return normalize(points.astype(np.float32))
+
+
+@pytest.fixture
+def index_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_INDEX_IVF_MIN_SIZE", 2000)
+    monkeypatch.setattr(settings, "LOCAL_INDEX_NPROBE", 8)
+    monkeypatch.setattr(settings, "LOCAL_INDEX_PQ_MIN_SIZE", 2000)
+    monkeypatch.setattr(settings, "LOCAL_INDEX_PQ_SUBVECTORS", 8)
+    monkeypatch.setattr(settings, "LOCAL_INDEX_RERANK_FACTOR", 10)
+
+
+def build(tmp_path, data, quantization="none") -> LocalVectorStore:
+    store = LocalVectorStore("test", path=str(tmp_path), quantization=quantization)
+    store.upsert_sync(
+        ids=[str(i) for i in range(len(data))],
+        embeddings=data,
+        documents=[f"doc {i}" for i in range(len(data))],
+        metadatas=[{"n": i} for i in range(len(data))],
+    )
+    store.wait_for_training()
+    return store
+
+
+def recall_at(store: LocalVectorStore, data: np.ndarray, k: int = 10, queries: int = 100) -> float:
+    """
+    与精确暴力检索结果相比的平均 recall@k。
+    """
+    truth = np.argsort(-(data[:queries] @ data.T), axis=1)[:, :k]
+    result = store.query_sync(data[:queries], k)
+    return float(np.mean([
+        len({int(i) for i in ids} & set(expected)) / k for ids, expected in zip(result["ids"], truth)
+    ]))
+
+
+def test_flat_search_is_exact(tmp_path, data, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_INDEX_IVF_MIN_SIZE", 10 * SIZE)
+    store = build(tmp_path, data)
+    assert store._centroids is None
+    assert recall_at(store, data) == 1.0
+
+    result = store.query_sync(data[:1], 3)
+    assert result["ids"][0][0] == "0"
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert result["documents"][0][0] == "doc 0"
+    assert result["metadatas"][0][0] == {"n": 0}
+
+
+def test_ivf_recall_close_to_flat(tmp_path, data, index_settings):
+    store = build(tmp_path, data)
+    assert store._centroids is not None
+    assert recall_at(store, data) >= 0.9
+
+
+def test_queries_stay_exact_while_training(tmp_path, data, index_settings, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    train = local_index.spherical_kmeans
+
+    def blocked_kmeans(*args, **kwargs):
+        started.set()
+        release.wait(10)
+        return train(*args, **kwargs)
+
+    monkeypatch.setattr(local_index, "spherical_kmeans", blocked_kmeans)
+    store = LocalVectorStore("test", path=str(tmp_path))
+    store.upsert_sync(ids=[str(i) for i in range(2500)], embeddings=data[:2500])
+    assert started.wait(10)
+
+    # 训练在后台进行：查询与写入不等待训练，沿用暴力检索
+    store.upsert_sync(ids=[str(i) for i in range(2500, SIZE)], embeddings=data[2500:])
+    assert store._centroids is None
+    assert recall_at(store, data) == 1.0
+
+    release.set()
+    store.wait_for_training()
+    assert store._centroids is not None
+    # 训练期间写入的行也已分配到簇
+    assert store.query_sync(data[2900:2901], 1)["ids"][0] == ["2900"]
+
+
+def test_deleted_rows_are_not_returned(tmp_path, data, index_settings):
+    store = build(tmp_path, data)
+    store.delete_sync(ids=["0", "1"])
+    ids = store.query_sync(data[:2], 5)["ids"]
+    assert all("0" not in row and "1" not in row for row in ids)
+
+
+def test_index_survives_reload(tmp_path, data, index_settings):
+    store = build(tmp_path, data)
+    expected = store.query_sync(data[:5], 5)["ids"]
+
+    reloaded = LocalVectorStore("test", path=str(tmp_path))
+    reloaded.wait_for_training()
+    assert reloaded.query_sync(data[:5], 5)["ids"] == expected
+    assert reloaded._centroids is not None
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_quantized_recall_close_to_flat(tmp_path, data, index_settings, quantization):
+    store = build(tmp_path, data, quantization=quantization)
+    if quantization == "pq":
+        assert store._pq_codebooks is not None
+    assert store._quantized()
+    # 量化分数只用于粗筛，精排使用 float32 原始向量
+    assert recall_at(store, data) >= 0.9
+    result = store.query_sync(data[:1], 1)
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_pq_codes_cover_rows_written_after_training(tmp_path, data, index_settings):
+    store = build(tmp_path, data[:2500], quantization="pq")
+    store.upsert_sync(ids=[str(i) for i in range(2500, SIZE)], embeddings=data[2500:])
+    store.wait_for_training()
+    assert store.query_sync(data[2900:2901], 1)["ids"][0] == ["2900"]
+
+
+def test_unknown_quantization_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LocalVectorStore("test", path=str(tmp_path), quantization="fp16")
+
+
+def assert_lists_match_assignment(store: LocalVectorStore):
+    alive = np.flatnonzero(store._alive[:len(store._ids)])
+    listed = np.concatenate(store._lists)
+    assert sorted(listed.tolist()) == alive.tolist()
+    for c, rows in enumerate(store._lists):
+        assert (store._assign[rows] == c).all()
+
+
+def test_inverted_lists_track_upserts_and_deletes(tmp_path, data, index_settings):
+    store = build(tmp_path, data[:2500])
+    assert_lists_match_assignment(store)
+
+    store.delete_sync(ids=["0", "1", "2"])
+    store.upsert_sync(ids=["3", "new"], embeddings=[data[2600], data[2601]])  # 3 移动到新簇，new 复用空闲行
+    assert_lists_match_assignment(store)
+    assert store.query_sync(data[2601:2602], 1)["ids"][0] == ["new"]
+    # IVF 查询只扫描探测簇的倒排表
+    nprobe_rows = sorted(len(rows) for rows in store._lists)[-settings.LOCAL_INDEX_NPROBE:]
+    assert sum(nprobe_rows) < len(store._rows)
+
+    reloaded = LocalVectorStore("test", path=str(tmp_path))
+    assert reloaded.query_sync(data[2601:2602], 1)["ids"][0] == ["new"]
+    assert_lists_match_assignment(reloaded)
+
+
+def test_scores_are_computed_outside_the_lock(tmp_path, data, index_settings, monkeypatch):
+    store = build(tmp_path, data)
+    scan = local_index.ScanView.scan
+
+    def scan_and_delete(view, rows, queries):
+        # 计算分数时不持有索引锁：并发删除并复用同一行不会阻塞
+        assert not store._lock._is_owned()
+        scores = scan(view, rows, queries)
+        writer = threading.Thread(target=lambda: (
+            store.delete_sync(ids=["0"]),
+            store.upsert_sync(ids=["reused"], embeddings=[data[1500]]),
+        ))
+        writer.start()
+        writer.join(10)
+        assert not writer.is_alive()
+        return scores
+
+    monkeypatch.setattr(local_index.ScanView, "scan", scan_and_delete)
+    result = store.query_sync(data[:1], 3)
+    # 计算期间被删除并分配给新条目的行不会以旧分数返回
+    assert "0" not in result["ids"][0] and "reused" not in result["ids"][0]
+    assert len(result["ids"][0]) == 2
@@ -0,0 +1,270 @@
+import asyncio
+import grpc
+import httpx
+import pytest
+from openai import APIConnectionError
+from backend.shared.core.circuit_breaker import CircuitOpenError
+from backend.shared.core.config import settings
+from backend.shared.core.mq import (
+    ATTEMPTS_HEADER,
+    DEAD_LETTER_QUEUE,
+    EMBEDDING_QUEUE,
+    ERROR_HEADER,
+    OUTAGE_RETRIES_HEADER,
+    decode_chunks,
+    encode_chunks,
+    failure_headers,
+    is_outage,
+    outage_queue,
+    retry_delays,
+    retry_queue,
+    topology,
+)
+from backend.knowledge_service.core import mq as producer_mq
+from backend.shared.rpc import vector_pb2
+from backend.vector_service.core.mq_consumer import RabbitMQConsumer
+
+
+@pytest.fixture(autouse=True)
+def retry_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MQ_MAX_ATTEMPTS", 4)
+    monkeypatch.setattr(settings, "MQ_RETRY_BASE_DELAY_MS", 1000)
+    monkeypatch.setattr(settings, "MQ_OUTAGE_RETRY_DELAY_MS", 30000)
+    monkeypatch.setattr(settings, "MQ_OUTAGE_MAX_RETRIES", 2)
+
+
+def test_retry_delays_grow_exponentially():
+    assert retry_delays() == [1000, 2000, 4000]
+
+
+def test_topology_dead_letters_retry_queues_back_to_main_queue():
+    queues = dict(topology())
+    assert queues[EMBEDDING_QUEUE] is None
+    assert queues[DEAD_LETTER_QUEUE] is None
+    for name, delay in [(retry_queue(d), d) for d in retry_delays()] + [(outage_queue(), 30000)]:
+        assert queues[name] == {
+            "x-message-ttl": delay,
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": EMBEDDING_QUEUE,
+        }
+
+
+def test_failures_walk_the_backoff_ladder_then_dead_letter():
+    headers, routes = {}, []
+    for _ in range(settings.MQ_MAX_ATTEMPTS):
+        route, headers = failure_headers(headers, ValueError("bad chunk"))
+        routes.append(route)
+    assert routes == [retry_queue(1000), retry_queue(2000), retry_queue(4000), DEAD_LETTER_QUEUE]
+    assert headers[ATTEMPTS_HEADER] == settings.MQ_MAX_ATTEMPTS
+    assert headers[OUTAGE_RETRIES_HEADER] == 0
+    assert headers[ERROR_HEADER] == "bad chunk"
+
+
+def test_outage_retries_do_not_consume_attempts():
+    route, headers = failure_headers({ATTEMPTS_HEADER: 2}, "UNAVAILABLE", outage=True)
+    assert route == outage_queue()
+    assert headers[ATTEMPTS_HEADER] == 2
+    assert headers[OUTAGE_RETRIES_HEADER] == 1
+
+    route, headers = failure_headers(headers, "UNAVAILABLE", outage=True)
+    assert route == outage_queue()
+    route, headers = failure_headers(headers, "UNAVAILABLE", outage=True)
+    assert route == DEAD_LETTER_QUEUE
+    assert headers[OUTAGE_RETRIES_HEADER] == 3
+
+    # 服务恢复后的普通失败从原有的重试次数继续
+    route, headers = failure_headers({ATTEMPTS_HEADER: 2, OUTAGE_RETRIES_HEADER: 1}, "bad chunk")
+    assert route == retry_queue(4000)
+    assert headers[ATTEMPTS_HEADER] == 3
+
+
+def test_error_header_is_truncated():
+    _, headers = failure_headers(None, "x" * 2000)
+    assert len(headers[ERROR_HEADER]) == 500
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+def test_outage_classification():
+    assert is_outage(CircuitOpenError("all ejected"))
+    assert is_outage(FakeRpcError(grpc.StatusCode.UNAVAILABLE))
+    assert is_outage(FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED))
+    assert not is_outage(FakeRpcError(grpc.StatusCode.INVALID_ARGUMENT))
+    assert not is_outage(ValueError("bad chunk"))
+    # 向量服务内部：Embedding API、向量库不可用或超时
+    assert is_outage(TimeoutError())
+    assert is_outage(ConnectionRefusedError())
+    assert is_outage(httpx.ConnectError("refused"))
+    assert is_outage(APIConnectionError(request=httpx.Request("POST", "http://llm/v1/embeddings")))
+    assert not is_outage("entry removed concurrently")
+
+
+def test_chunk_messages_round_trip_and_accept_legacy_format():
+    chunks = [{"id": "d_0", "text": "中文内容", "metadata": {"doc_id": "d"}}]
+    assert decode_chunks(encode_chunks(chunks)) == chunks
+    assert decode_chunks(b'{"id": "d_0", "text": "t", "metadata": {}}') == [
+        {"id": "d_0", "text": "t", "metadata": {}}
+    ]
+
+
+class FakeMessage:
+    def __init__(self, chunks=None, body=None, headers=None):
+        self.body = body if body is not None else encode_chunks(chunks)
+        self.headers = headers or {}
+        self.acked = False
+        self.nacked = None
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue: bool):
+        self.nacked = requeue
+
+
+class FakeExchange:
+    def __init__(self, fail: bool = False):
+        self.published = []
+        self.fail = fail
+
+    async def publish(self, message, routing_key: str):
+        if self.fail:
+            raise ConnectionError("channel closed")
+        self.published.append((routing_key, message.headers, message.body))
+
+
+class FakeVectorService:
+    def __init__(self, failed_ids=(), outage: bool = False, error: Exception = None):
+        self.failed_ids = set(failed_ids)
+        self.outage = outage
+        self.error = error
+        self.batches = []
+
+    async def _upsert_batch(self, requests: list) -> list:
+        self.batches.append([r.id for r in requests])
+        if self.error is not None:
+            raise self.error
+        return [
+            vector_pb2.UpsertResult(
+                id=r.id,
+                success=r.id not in self.failed_ids,
+                error="embedding failed",
+                outage=self.outage and r.id in self.failed_ids,
+            )
+            for r in requests
+        ]
+
+
+def make_consumer(service, exchange) -> RabbitMQConsumer:
+    consumer = RabbitMQConsumer(service)
+    consumer.publish_channel = type("Channel", (), {"default_exchange": exchange})()
+    return consumer
+
+
+def chunk(id_: str) -> dict:
+    return {"id": id_, "text": f"text {id_}", "metadata": {"doc_id": "d"}}
+
+
+def test_consumer_acks_successes_and_retries_only_failed_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "MQ_CONSUMER_BATCH_SIZE", 3)
+    service, exchange = FakeVectorService(failed_ids={"b"}), FakeExchange()
+    ok, partial = FakeMessage([chunk("a")]), FakeMessage([chunk("b"), chunk("c")], headers={ATTEMPTS_HEADER: 1})
+
+    async def main():
+        consumer = make_consumer(service, exchange)
+        await consumer.on_message(ok)
+        await consumer.on_message(partial)
+        await asyncio.gather(*consumer._tasks)
+
+    asyncio.run(main())
+    # 两条消息合并为一个微批写入
+    assert service.batches == [["a", "b", "c"]]
+    assert ok.acked and partial.acked
+    assert exchange.published == [
+        (retry_queue(2000), {ATTEMPTS_HEADER: 2, OUTAGE_RETRIES_HEADER: 0, ERROR_HEADER: "embedding failed"},
+         encode_chunks([chunk("b")]))
+    ]
+
+
+def test_undecodable_message_goes_straight_to_dead_letter_queue():
+    exchange = FakeExchange()
+    message = FakeMessage(body=b"not json")
+    asyncio.run(make_consumer(FakeVectorService(), exchange).on_message(message))
+    assert message.acked
+    assert [(route, body) for route, _, body in exchange.published] == [(DEAD_LETTER_QUEUE, b"not json")]
+
+
+def test_failed_reroute_requeues_the_original_message(monkeypatch):
+    monkeypatch.setattr(settings, "MQ_CONSUMER_BATCH_SIZE", 1)
+    message = FakeMessage([chunk("a")])
+
+    async def main():
+        consumer = make_consumer(FakeVectorService(failed_ids={"a"}), FakeExchange(fail=True))
+        await consumer.on_message(message)
+        await asyncio.gather(*consumer._tasks)
+
+    asyncio.run(main())
+    assert not message.acked
+    assert message.nacked is True
+
+
+@pytest.mark.parametrize(
+    "service",
+    [FakeVectorService(failed_ids={"a"}, outage=True), FakeVectorService(error=TimeoutError())],
+)
+def test_consumer_outages_do_not_consume_attempts(monkeypatch, service):
+    monkeypatch.setattr(settings, "MQ_CONSUMER_BATCH_SIZE", 1)
+    exchange = FakeExchange()
+    message = FakeMessage([chunk("a")], headers={ATTEMPTS_HEADER: settings.MQ_MAX_ATTEMPTS - 1})
+
+    async def main():
+        consumer = make_consumer(service, exchange)
+        await consumer.on_message(message)
+        await asyncio.gather(*consumer._tasks)
+
+    asyncio.run(main())
+    assert message.acked
+    [(route, headers, _)] = exchange.published
+    assert route == outage_queue()
+    assert headers[ATTEMPTS_HEADER] == settings.MQ_MAX_ATTEMPTS - 1
+    assert headers[OUTAGE_RETRIES_HEADER] == 1
+
+
+def test_producer_connects_once(monkeypatch):
+    """
+    并发的首次发布只建立一个 connect_robust 连接；之后不再因连接状态重新建立（断线由 aio-pika 自动恢复）。
+    """
+    connections = []
+
+    class Channel:
+        async def declare_queue(self, *args, **kwargs):
+            await asyncio.sleep(0)
+
+    class Connection:
+        is_closed = False
+
+        async def channel(self, **kwargs):
+            await asyncio.sleep(0)
+            return Channel()
+
+    async def connect_robust(**kwargs):
+        await asyncio.sleep(0)
+        connections.append(Connection())
+        return connections[-1]
+
+    monkeypatch.setattr(producer_mq.aio_pika, "connect_robust", connect_robust)
+    producer = producer_mq.RabbitMQProducer()
+
+    async def main():
+        await asyncio.gather(*(producer.connect() for _ in range(5)))
+        connections[0].is_closed = True  # 断线重连期间
+        await producer.connect()
+
+    asyncio.run(main())
+    assert len(connections) == 1
+    assert len(producer._channels) == settings.MQ_CHANNEL_POOL_SIZE
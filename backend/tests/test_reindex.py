@@ -0,0 +1,253 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.exc import IntegrityError
+from backend.knowledge_service.api import routes
+from backend.knowledge_service.core import documents
+from backend.knowledge_service.core.documents import stable_doc_id
+from backend.shared.core.mq import content_hash
+from backend.shared.models.document import DocumentStatus
+
+
+class FakeDocuments:
+    """
+    内存中的文档记录，行为与 knowledge_service.core.documents 相同。
+    """
+
+    def __init__(self):
+        self.records = {}
+
+    async def begin_sync(self, doc_id, title, tenant=None):
+        record = self.records.setdefault(
+            doc_id, SimpleNamespace(title=title, tenant=tenant, chunk_hashes="[]", chunk_count=0, status=None)
+        )
+        if record.tenant and record.tenant != tenant:
+            raise PermissionError(f"Document {doc_id} belongs to another tenant")
+        record.title, record.status = title, DocumentStatus.PROCESSING
+        return set(json.loads(record.chunk_hashes))
+
+    async def finish_sync(self, doc_id, chunk_hashes, chunk_count, status):
+        record = self.records[doc_id]
+        record.chunk_hashes = json.dumps(sorted(chunk_hashes))
+        record.chunk_count, record.status = chunk_count, status
+
+    async def get_document(self, doc_id, tenant=None):
+        record = self.records.get(doc_id)
+        if record is None or (record.tenant and record.tenant != tenant):
+            return None
+        return record
+
+    async def mark_indexed(self, doc_id, chunk_hashes):
+        record = self.records[doc_id]
+        if record.status == DocumentStatus.PENDING and record.chunk_hashes == json.dumps(sorted(chunk_hashes)):
+            record.status = DocumentStatus.INDEXED
+
+
+class FakePublisher:
+    def __init__(self, owner):
+        self.owner = owner
+        self.cancelled = False
+
+    async def add(self, message):
+        if self.owner.fail_after is not None and len(self.owner.sent) >= self.owner.fail_after:
+            raise ConnectionError("broker unavailable")
+        self.owner.sent.append(message["text"])
+
+    async def flush(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+        self.fail_after = None
+        self.publishers = []
+
+    def batch(self):
+        self.publishers.append(FakePublisher(self))
+        return self.publishers[-1]
+
+
+class FakeVectorClient:
+    def __init__(self):
+        self.indexed = set()  # (doc_id, 指纹)
+        self.deleted = []
+
+    async def indexed_chunks(self, doc_id, ids):
+        return {i for i in ids if (doc_id, i) in self.indexed}
+
+    async def delete_chunks(self, doc_id, ids):
+        self.deleted.extend(ids)
+        self.indexed -= {(doc_id, i) for i in ids}
+
+
+@pytest.fixture
+def env(monkeypatch):
+    records, producer, vector_client = FakeDocuments(), FakeProducer(), FakeVectorClient()
+    for name in ("begin_sync", "finish_sync"):
+        monkeypatch.setattr(documents, name, getattr(records, name))
+    for name in ("get_document", "mark_indexed"):
+        monkeypatch.setattr(routes, name, getattr(records, name))
+    monkeypatch.setattr(routes, "producer", producer)
+    for module in (routes, documents):
+        monkeypatch.setattr(module, "vector_client", vector_client)
+    return SimpleNamespace(documents=records, producer=producer, vector_client=vector_client)
+
+
+def upload(env, text: str, tenant="7", doc_id=None, filename="notes.txt") -> dict:
+    env.producer.sent.clear()
+    env.vector_client.deleted.clear()
+    file = UploadFile(io.BytesIO(text.encode("utf-8")), filename=filename)
+    return asyncio.run(routes.upload_document(
+        file, chunker="paragraph", chunk_size=None, chunk_overlap=None, doc_id=doc_id, x_tenant_id=tenant
+    ))
+
+
+def confirm_all(env, doc_id: str):
+    """
+    模拟消费者写入索引：已发送的切片全部确认。
+    """
+    env.vector_client.indexed |= {(doc_id, content_hash(text)) for text in env.producer.sent}
+
+
+def status(env, doc_id: str, tenant="7") -> dict:
+    return asyncio.run(routes.get_document_status(doc_id, tenant))
+
+
+def test_stable_doc_id():
+    assert stable_doc_id("a.txt", "7") == stable_doc_id("a.txt", "7")
+    assert stable_doc_id("a.txt", "7") != stable_doc_id("a.txt", "8")
+    assert stable_doc_id("a.txt", None, "explicit") == "explicit"
+    with pytest.raises(ValueError):
+        stable_doc_id("a.txt")
+
+
+def test_reupload_sends_only_changed_chunks_and_deletes_removed(env):
+    first = upload(env, "p1\n\np2\n\np3")
+    doc_id = first["doc_id"]
+    assert first["status"] == "pending"
+    assert env.producer.sent == ["p1", "p2", "p3"]
+    confirm_all(env, doc_id)
+
+    second = upload(env, "p1\n\np2 changed\n\np3\n\np4")
+    assert env.producer.sent == ["p2 changed", "p4"]
+    assert env.vector_client.deleted == [content_hash("p2")]
+    assert (second["added_chunks"], second["removed_chunks"]) == (2, 1)
+    confirm_all(env, doc_id)
+
+    third = upload(env, "p1\n\np2 changed\n\np3\n\np4")
+    assert env.producer.sent == [] and env.vector_client.deleted == []
+    assert third["status"] == "indexed"
+
+
+def test_unconfirmed_chunks_are_resent(env):
+    doc_id = upload(env, "p1\n\np2\n\np3")["doc_id"]
+    env.vector_client.indexed.add((doc_id, content_hash("p1")))  # 只有 p1 已写入索引
+
+    upload(env, "p1\n\np2\n\np3")
+    assert env.producer.sent == ["p2", "p3"]
+
+
+def test_duplicate_chunks_within_a_document_are_sent_once(env):
+    result = upload(env, "same\n\nother\n\nsame")
+    assert env.producer.sent == ["same", "other"]
+    assert (result["chunks"], result["unique_chunks"]) == (3, 2)
+
+
+def test_status_becomes_indexed_after_confirmation(env):
+    doc_id = upload(env, "p1\n\np2")["doc_id"]
+    assert status(env, doc_id)["status"] == "pending"
+    assert status(env, doc_id)["indexed_chunks"] == 0
+
+    confirm_all(env, doc_id)
+    result = status(env, doc_id)
+    assert (result["status"], result["indexed_chunks"]) == ("indexed", 2)
+    assert env.documents.records[doc_id].status == DocumentStatus.INDEXED
+
+
+def test_tenant_isolation(env):
+    doc_id = upload(env, "p1", tenant="7")["doc_id"]
+    assert upload(env, "p1", tenant="8")["doc_id"] != doc_id
+
+    with pytest.raises(HTTPException) as error:
+        upload(env, "p1", tenant="8", doc_id=doc_id)
+    assert error.value.status_code == 403
+    with pytest.raises(HTTPException) as error:
+        status(env, doc_id, tenant="8")
+    assert error.value.status_code == 404
+
+
+def test_upload_without_tenant_requires_doc_id(env):
+    with pytest.raises(HTTPException) as error:
+        upload(env, "p1", tenant=None)
+    assert error.value.status_code == 400
+    assert upload(env, "p1", tenant=None, doc_id="manual")["doc_id"] == "manual"
+
+
+def test_failed_upload_cancels_publishing_and_keeps_sent_hashes(env):
+    doc_id = upload(env, "p1\n\np2")["doc_id"]
+    confirm_all(env, doc_id)
+
+    env.producer.fail_after = 1
+    with pytest.raises(HTTPException) as error:
+        upload(env, "q1\n\nq2\n\nq3")
+    assert error.value.status_code == 500
+    assert env.producer.publishers[-1].cancelled
+
+    record = env.documents.records[doc_id]
+    assert record.status == DocumentStatus.FAILED
+    # 旧切片与已发送的切片都保留在记录中，下次同步时能正确删除
+    assert {content_hash(t) for t in ("p1", "p2", "q1")} <= set(json.loads(record.chunk_hashes))
+
+
+def test_concurrent_first_upload_rereads_the_created_record(monkeypatch):
+    """
+    两个请求同时首次上传同一文档：后提交的一方违反 doc_id 唯一约束，应重新读取已创建的记录。
+    """
+    table = {}
+
+    class Session:
+        def __init__(self):
+            self.added = None
+            self.snapshot = dict(table)  # 事务开始时的快照，看不到随后并发创建的记录
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def scalar(self, statement):
+            return self.snapshot.get(statement.whereclause.right.value)
+
+        def add(self, document):
+            self.added = document
+
+        async def commit(self):
+            if self.added is not None:
+                if self.added.doc_id in table:
+                    raise IntegrityError("INSERT INTO documents", {}, Exception("Duplicate entry"))
+                table[self.added.doc_id] = self.added
+
+    sessions = []
+
+    def session_factory():
+        sessions.append(Session())
+        if len(sessions) == 1:
+            # 首个事务读取之后、提交之前，另一个请求创建了同一文档的记录
+            table["doc"] = documents.Document(doc_id="doc", title="a.txt", tenant="7", chunk_hashes='["h"]')
+        return sessions[-1]
+
+    monkeypatch.setattr(documents, "async_session", session_factory)
+    assert asyncio.run(documents.begin_sync("doc", "a.txt", "7")) == {"h"}
+    assert len(sessions) == 2
+    assert table["doc"].status == DocumentStatus.PROCESSING
+
+    with pytest.raises(PermissionError):
+        asyncio.run(documents.begin_sync("doc", "a.txt", "8"))
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from backend.shared.core.config import settings
+from backend.vector_service.core.search_batcher import SearchBatcher
+
+
+class FakeBackend:
+    """
+    记录调用次数的 Embedding / 检索实现：每个查询返回 10 个结果，ID 带查询文本前缀。
+    """
+
+    def __init__(self, fail: bool = False):
+        self.embed_calls = []
+        self.query_calls = []
+        self.fail = fail
+
+    async def embed(self, texts: list) -> list:
+        self.embed_calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("embedding unavailable")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def query(self, embeddings: list, n_results: int) -> dict:
+        self.query_calls.append((len(embeddings), n_results))
+        ids = [[f"{int(e[0])}-{i}" for i in range(n_results)] for e in embeddings]
+        return {
+            "ids": ids,
+            "distances": [[i / 10 for i in range(n_results)] for _ in embeddings],
+            "metadatas": [[{} for _ in range(n_results)] for _ in embeddings],
+            "documents": [["doc"] * n_results for _ in embeddings],
+        }
+
+
+@pytest.fixture(autouse=True)
+def batch_window(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BATCH_WINDOW_MS", 5.0)
+    monkeypatch.setattr(settings, "SEARCH_BATCH_MAX_SIZE", 16)
+
+
+def test_concurrent_queries_share_one_batch():
+    backend = FakeBackend()
+
+    async def main():
+        batcher = SearchBatcher(backend.embed, backend.query)
+        return await asyncio.gather(
+            batcher.search("a", 2), batcher.search("bb", 5), batcher.search("ccc", 3)
+        )
+
+    results = asyncio.run(main())
+    assert backend.embed_calls == [["a", "bb", "ccc"]]
+    assert backend.query_calls == [(3, 5)]
+    # 每个查询按自己的 top_k 截取，并附带本次使用的问题向量
+    assert [len(r["ids"]) for r in results] == [2, 5, 3]
+    assert results[1]["ids"][0] == "2-0"
+    assert results[2]["query_embedding"] == [3.0, 1.0]
+
+
+def test_identical_inflight_queries_are_coalesced():
+    backend = FakeBackend()
+
+    async def main():
+        batcher = SearchBatcher(backend.embed, backend.query)
+        return await asyncio.gather(*(batcher.search("same", 4) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert backend.embed_calls == [["same"]]
+    assert all(r == results[0] for r in results)
+
+
+def test_batch_flushes_at_max_size(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_BATCH_WINDOW_MS", 10_000.0)
+    monkeypatch.setattr(settings, "SEARCH_BATCH_MAX_SIZE", 2)
+    backend = FakeBackend()
+
+    async def main():
+        batcher = SearchBatcher(backend.embed, backend.query)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.search("a", 1), batcher.search("b", 1)), timeout=1
+        )
+
+    asyncio.run(main())
+    assert backend.embed_calls == [["a", "b"]]
+
+
+def test_failure_propagates_to_every_caller_and_clears_inflight():
+    backend = FakeBackend(fail=True)
+
+    async def main():
+        batcher = SearchBatcher(backend.embed, backend.query)
+        results = await asyncio.gather(
+            batcher.search("a", 1), batcher.search("a", 1), batcher.search("b", 1),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert not batcher._inflight
+
+        # 失败后相同的查询重新发起，而不是复用失败的结果
+        backend.fail = False
+        return await batcher.search("a", 1)
+
+    result = asyncio.run(main())
+    assert result["ids"] == ["1-0"]
+    assert len(backend.embed_calls) == 2
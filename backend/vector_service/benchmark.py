@@ -0,0 +1,120 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from backend.shared.core.config import settings
+from backend.vector_service.core.local_index import PQ_CENTROIDS, LocalVectorStore, normalize
+from loguru import logger
+
+
+def make_dataset(size: int, dim: int, queries: int, clusters: int, seed: int = 0):
+    """
+    生成带簇结构的合成向量（接近真实文本向量的分布），查询为数据点附近的扰动。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(clusters, size=size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    picks = rng.integers(size, size=queries)
+    query_vectors = data[picks] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    return normalize(data), normalize(query_vectors)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ data.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+def pq_subvectors(dim: int, preferred: int) -> int:
+    """
+    不超过 preferred 且能整除 dim 的最大子空间数。
+    """
+    return max(m for m in range(1, min(preferred, dim) + 1) if dim % m == 0)
+
+
+def run(mode: str, data: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, workdir: str) -> dict:
+    store = LocalVectorStore(mode, path=workdir, quantization=mode)
+    ids = [str(i) for i in range(len(data))]
+    for start in range(0, len(data), 4096):
+        store.upsert_sync(ids[start:start + 4096], data[start:start + 4096])
+
+    # 写入后在后台训练 IVF / PQ，等待训练完成，不计入查询延迟
+    started = time.perf_counter()
+    store.wait_for_training()
+    train_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = [store.query_sync([query], k)["ids"][0] for query in queries]
+    latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    hits = sum(len(set(map(int, found)) & set(expected)) for found, expected in zip(results, truth.tolist()))
+    stats = store.memory_stats()
+    return {
+        "mode": mode,
+        "ran": stats["quantization"],
+        "ivf_lists": stats["ivf_lists"],
+        "recall": hits / (len(queries) * k),
+        "bytes_per_vector": stats["bytes_per_vector"],
+        "scan_mb": stats["scan_bytes"] / 1024 / 1024,
+        "latency_ms": latency_ms,
+        "train_s": train_seconds,
+    }
+
+
+def main():
+    """
+    嵌入式向量索引量化基准：对比 none / int8 / pq 三种编码的 recall@k 与检索内存占用。
+    用法：python backend/vector_service/benchmark.py --size 100000 --dim 1536
+    """
+    parser = argparse.ArgumentParser(description="Recall@k vs memory benchmark for the local vector index")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--modes", default="none,int8,pq")
+    parser.add_argument("--ivf-min-size", type=int, help="默认取 LOCAL_INDEX_IVF_MIN_SIZE 与 --size 的较小值")
+    parser.add_argument("--pq-min-size", type=int, help="默认取 LOCAL_INDEX_PQ_MIN_SIZE 与 --size 的较小值")
+    parser.add_argument("--pq-subvectors", type=int, help="默认取不超过 LOCAL_INDEX_PQ_SUBVECTORS 且整除 --dim 的最大值")
+    args = parser.parse_args()
+
+    # 训练阈值不超过数据量，保证 IVF / PQ 在基准中实际生效（PQ 训练至少需要 PQ_CENTROIDS 个向量）
+    settings.LOCAL_INDEX_IVF_MIN_SIZE = args.ivf_min_size or min(settings.LOCAL_INDEX_IVF_MIN_SIZE, args.size)
+    settings.LOCAL_INDEX_PQ_MIN_SIZE = args.pq_min_size or min(settings.LOCAL_INDEX_PQ_MIN_SIZE, args.size)
+    settings.LOCAL_INDEX_PQ_SUBVECTORS = args.pq_subvectors or pq_subvectors(
+        args.dim, settings.LOCAL_INDEX_PQ_SUBVECTORS
+    )
+    if "pq" in args.modes.split(",") and args.size < max(settings.LOCAL_INDEX_PQ_MIN_SIZE, PQ_CENTROIDS):
+        logger.warning(f"PQ needs at least {PQ_CENTROIDS} vectors to train, the pq row will run unquantized")
+
+    logger.info(f"Generating {args.size} x {args.dim} vectors...")
+    data, queries = make_dataset(args.size, args.dim, args.queries, args.clusters)
+    truth = exact_top_k(data, queries, args.k)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes.split(","):
+            logger.info(f"Benchmarking quantization={mode}...")
+            rows.append(run(mode, data, queries, truth, args.k, workdir))
+
+    # ran 为实际生效的编码（训练完成前为 none），ivf 为倒排簇数（0 表示暴力检索）
+    print(
+        f"{'mode':<6} {'ran':<6} {'ivf':>5} {'recall@' + str(args.k):>9} {'B/vector':>9} "
+        f"{'scan MB':>9} {'ms/query':>9} {'train s':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['mode']:<6} {row['ran']:<6} {row['ivf_lists']:>5} {row['recall']:>9.4f} {row['bytes_per_vector']:>9} "
+            f"{row['scan_mb']:>9.1f} {row['latency_ms']:>9.2f} {row['train_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,25 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import chromadb
 from chromadb.config import Settings
+from prometheus_client import Gauge, Histogram
 from backend.shared.core.config import settings
+from backend.vector_service.core.vector_store import VectorStore
+
+CHROMA_QUEUE_DEPTH = Gauge(
+    "vector_chroma_queue_depth", "Chroma calls waiting for a free worker"
+)
+CHROMA_IN_FLIGHT = Gauge("vector_chroma_in_flight", "Chroma calls currently executing")
+CHROMA_LATENCY = Histogram(
+    "vector_chroma_call_seconds", "Chroma call latency", ["operation"]
+)
+
+# Chroma HttpClient 为同步客户端，使用独立线程池执行，避免阻塞 gRPC 事件循环
+executor = ThreadPoolExecutor(
+    max_workers=settings.CHROMA_MAX_CONCURRENCY, thread_name_prefix="chroma"
+)
 
 class ChromaClient:
     """
@@ -30,8 +49,66 @@ class ChromaClient:
         client = cls.get_client()
         return client.get_or_create_collection(name=name)
 
+
+class AsyncChromaCollection(VectorStore):
+    """
+    Chroma 集合的异步封装（VectorStore 的 Chroma 实现）。
+    同步调用在独立线程池中执行，并发数受 CHROMA_MAX_CONCURRENCY 限制，
+    单次调用（含排队时间）超过 CHROMA_TIMEOUT 即超时。
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._semaphore = asyncio.Semaphore(settings.CHROMA_MAX_CONCURRENCY)
+
+    async def query(self, **kwargs):
+        return await self._call("query", **kwargs)
+
+    async def upsert(self, **kwargs):
+        return await self._call("upsert", **kwargs)
+
+    async def update(self, **kwargs):
+        return await self._call("update", **kwargs)
+
+    async def get(self, **kwargs):
+        return await self._call("get", **kwargs)
+
+    async def delete(self, **kwargs):
+        return await self._call("delete", **kwargs)
+
+    async def _call(self, operation: str, **kwargs):
+        method = getattr(self._collection, operation)
+        loop = asyncio.get_running_loop()
+        async with asyncio.timeout(settings.CHROMA_TIMEOUT):
+            CHROMA_QUEUE_DEPTH.inc()
+            try:
+                await self._semaphore.acquire()
+            finally:
+                CHROMA_QUEUE_DEPTH.dec()
+
+            CHROMA_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            future = loop.run_in_executor(executor, partial(method, **kwargs))
+
+            def release(_):
+                # 线程真正执行完毕后才释放并发名额（超时不会中断正在执行的线程）
+                CHROMA_IN_FLIGHT.dec()
+                CHROMA_LATENCY.labels(operation).observe(time.perf_counter() - started)
+                self._semaphore.release()
+
+            future.add_done_callback(release)
+            return await asyncio.shield(future)
+
+
 def get_chroma_collection(name: str = "knowledge_base"):
     """
     获取默认知识库集合的辅助函数。
     """
     return ChromaClient.get_collection(name)
+
+
+def get_async_chroma_collection(name: str = "knowledge_base") -> AsyncChromaCollection:
+    """
+    获取默认知识库集合的异步封装。
+    """
+    return AsyncChromaCollection(get_chroma_collection(name))
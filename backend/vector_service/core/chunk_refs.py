@@ -0,0 +1,76 @@
+from typing import Optional
+from backend.vector_service.core.redis_client import redis_client
+
+# 每个切片条目一个 Redis 哈希：{doc_id: source}，记录引用该内容的文档
+REFS_KEY_PREFIX = "chunk_refs:"
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class ChunkRefs:
+    """
+    切片条目的文档引用表（存于 Redis，不写入向量库元数据）：
+    新增或移除一个引用只修改哈希中的一个字段，开销与引用该内容的文档数量无关，
+    检索结果的元数据也不会携带引用列表。
+    """
+
+    @staticmethod
+    def key(entry_id: str) -> str:
+        return f"{REFS_KEY_PREFIX}{entry_id}"
+
+    async def add(self, refs: dict):
+        """
+        批量添加引用：refs 为 {条目 ID: {doc_id: source}}，重复添加同一文档不会重复计数。
+        """
+        if not refs:
+            return
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for entry_id, docs in refs.items():
+                pipe.hset(self.key(entry_id), mapping=docs)
+            await pipe.execute()
+
+    async def lookup(self, doc_id: str, ids: list) -> dict:
+        """
+        返回引用了该文档的条目及其当前引用数：{条目 ID: 引用数}。
+        """
+        if not ids:
+            return {}
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for entry_id in ids:
+                pipe.hexists(self.key(entry_id), doc_id)
+                pipe.hlen(self.key(entry_id))
+            replies = await pipe.execute()
+        return {
+            entry_id: count
+            for entry_id, referenced, count in zip(ids, replies[::2], replies[1::2])
+            if referenced
+        }
+
+    async def remove(self, doc_id: str, ids: list):
+        """
+        从各条目中移除该文档的引用。
+        """
+        if not ids:
+            return
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for entry_id in ids:
+                pipe.hdel(self.key(entry_id), doc_id)
+            await pipe.execute()
+
+    async def any_ref(self, entry_id: str) -> Optional[tuple]:
+        """
+        返回条目的任意一个引用 (doc_id, source)，没有引用时返回 None。
+        """
+        refs = await redis_client.hrandfield(self.key(entry_id), 1, withvalues=True)
+        if not refs:
+            return None
+        return _decode(refs[0]), _decode(refs[1])
+
+    async def delete(self, ids: list):
+        if ids:
+            await redis_client.delete(*(self.key(entry_id) for entry_id in ids))
+
+
+chunk_refs = ChunkRefs()
@@ -0,0 +1,99 @@
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import Optional
+from loguru import logger
+from prometheus_client import Counter
+from backend.shared.core.config import settings
+from backend.vector_service.core.redis_client import redis_client
+
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "vector_embedding_cache_requests_total",
+    "Embedding cache lookups by tier and result",
+    ["tier", "result"],
+)
+
+
+class EmbeddingCache:
+    """
+    两级向量缓存：
+    - L1：进程内 LRU，向量以 float32 数组紧凑存储
+    - L2：Redis 共享缓存，值为 float32 二进制（而非 JSON 列表）
+    缓存键为 (EMBEDDING_MODEL, 文本哈希)。
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"emb:{settings.EMBEDDING_MODEL}:{digest}"
+
+    async def get(self, text: str) -> Optional[list]:
+        return (await self.get_many([text]))[0]
+
+    async def set(self, text: str, embedding: list):
+        await self.set_many([text], [embedding])
+
+    async def get_many(self, texts: list) -> list:
+        """
+        批量查询缓存，未命中的位置返回 None。L1 未命中的键通过一次 MGET 查询 Redis。
+        """
+        keys = [self.make_key(text) for text in texts]
+        results = [None] * len(texts)
+        missing = []
+        for i, key in enumerate(keys):
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                results[i] = vector.tolist()
+            else:
+                missing.append(i)
+        EMBEDDING_CACHE_REQUESTS.labels("memory", "hit").inc(len(texts) - len(missing))
+        EMBEDDING_CACHE_REQUESTS.labels("memory", "miss").inc(len(missing))
+        if not missing:
+            return results
+
+        try:
+            raws = await redis_client.mget([keys[i] for i in missing])
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+            return results
+
+        hits = 0
+        for i, raw in zip(missing, raws):
+            if raw is None:
+                continue
+            vector = array("f")
+            vector.frombytes(raw)
+            self._remember(keys[i], vector)
+            results[i] = vector.tolist()
+            hits += 1
+        EMBEDDING_CACHE_REQUESTS.labels("redis", "hit").inc(hits)
+        EMBEDDING_CACHE_REQUESTS.labels("redis", "miss").inc(len(missing) - hits)
+        return results
+
+    async def set_many(self, texts: list, embeddings: list):
+        """
+        批量写入缓存，Redis 写入通过 pipeline 一次提交。
+        """
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for text, embedding in zip(texts, embeddings):
+                    key = self.make_key(text)
+                    vector = array("f", embedding)
+                    self._remember(key, vector)
+                    pipe.set(key, vector.tobytes(), ex=settings.EMBEDDING_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    def _remember(self, key: str, vector: array):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.EMBEDDING_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,770 @@
+import asyncio
+import json
+import os
+import threading
+import numpy as np
+from loguru import logger
+from backend.shared.core.config import settings
+from backend.vector_service.core.vector_store import VectorStore
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGN_FILE = "ivf_assign.i32"
+INT8_CODES_FILE = "codes.i8"
+INT8_SCALES_FILE = "scales.f32"
+PQ_CODEBOOKS_FILE = "pq_codebooks.npy"
+PQ_CODES_FILE = "pq_codes.u8"
+
+QUANTIZATIONS = ("none", "int8", "pq")
+PQ_CENTROIDS = 256
+# 按块扫描：解码 int8/PQ 产生的临时 float32 块保持在 CPU 缓存量级
+SCAN_BLOCK_ROWS = 2048
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    按行 L2 归一化，之后内积即为余弦相似度。
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def int8_encode(vectors: np.ndarray):
+    """
+    逐行对称 int8 标量量化，返回 (codes, scales)，还原时 vector ≈ codes * scale。
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def kmeans(data: np.ndarray, k: int, rng: np.random.Generator, iterations: int = 10) -> np.ndarray:
+    """
+    欧氏距离 k-means，用于训练 PQ 子空间码本。
+    """
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmin((centroids ** 2).sum(axis=1) - 2 * data @ centroids.T, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+def spherical_kmeans(data: np.ndarray, k: int, rng: np.random.Generator, iterations: int = 10) -> np.ndarray:
+    """
+    球面 k-means（内积相似度，质心归一化），用于训练 IVF 倒排索引。
+    """
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                centroids[c] = data[rng.integers(len(data))]
+        centroids = normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def pq_encode(codebooks: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    按 PQ 码本将向量编码为每个子空间一个字节的码字下标。
+    """
+    m, _, sub_dim = codebooks.shape
+    codes = np.empty((len(vectors), m), dtype=np.uint8)
+    for j, codebook in enumerate(codebooks):
+        sub = vectors[:, j * sub_dim:(j + 1) * sub_dim]
+        codes[:, j] = np.argmin((codebook ** 2).sum(axis=1) - 2 * sub @ codebook.T, axis=1)
+    return codes
+
+
+def match_where(metadata: dict, where: dict) -> bool:
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+class ScanView:
+    """
+    查询所需矩阵的引用快照：在索引锁内获取，锁外计算分数。
+    写入只原地修改已有行，或在扩容、训练完成时替换为新的矩阵对象，快照中的引用始终可读。
+    """
+
+    __slots__ = ("vectors", "int8_codes", "int8_scales", "pq_codebooks", "pq_codes")
+
+    def __init__(self, vectors, int8_codes=None, int8_scales=None, pq_codebooks=None, pq_codes=None):
+        self.vectors = vectors
+        self.int8_codes = int8_codes
+        self.int8_scales = int8_scales
+        self.pq_codebooks = pq_codebooks
+        self.pq_codes = pq_codes
+
+    @property
+    def quantized(self) -> bool:
+        return self.int8_codes is not None or self.pq_codebooks is not None
+
+    def scan(self, rows, queries: np.ndarray) -> np.ndarray:
+        """
+        计算 rows（切片或行号数组）与各查询的内积，返回 (行数, 查询数) 矩阵。
+        启用量化时基于编码近似计算，不读取 float32 矩阵。
+        """
+        if self.int8_codes is not None:
+            codes = self.int8_codes[rows].astype(np.float32)
+            return (codes @ queries.T) * self.int8_scales[rows][:, None]
+        if self.pq_codebooks is not None:
+            # 非对称距离计算 (ADC)：每个查询先算出各子空间到码字的内积查找表
+            m, _, sub_dim = self.pq_codebooks.shape
+            tables = np.einsum("mcd,qmd->qmc", self.pq_codebooks, queries.reshape(len(queries), m, sub_dim))
+            codes = self.pq_codes[rows]
+            subspaces = np.arange(m)
+            return np.stack([table[subspaces, codes].sum(axis=1) for table in tables], axis=1)
+        return self.vectors[rows] @ queries.T
+
+
+class LocalVectorStore(VectorStore):
+    """
+    嵌入式向量索引 (IVF-Flat)：
+    - 向量归一化后存于内存映射的 float32 矩阵 (vectors.f32)，按行号寻址
+    - 文档与元数据以追加日志 (records.jsonl) 持久化，加载时回放
+    - 数据量达到 LOCAL_INDEX_IVF_MIN_SIZE 后训练球面 k-means 倒排索引，每个簇维护一个行号数组（倒排表），
+      查询只扫描 LOCAL_INDEX_NPROBE 个最近簇的倒排表；数据量较小时直接暴力计算
+    - 查询只在锁内取得矩阵引用、候选行号及其版本号，分数在锁外计算，最后在锁内丢弃
+      计算期间被删除或复用的行；倒排表数组只整体替换、不原地修改，并发写入不影响进行中的查询
+    - IVF / PQ 训练在后台线程中基于数据快照进行，不持有索引锁，完成后在锁内原子替换；
+      训练期间查询沿用当前索引（首次训练前为暴力检索 / float32 精确检索）
+    - 首次访问时才加载磁盘数据
+    - 可选量化 (LOCAL_INDEX_QUANTIZATION)：检索时只扫描紧凑编码
+      （int8 每维 1 字节，PQ 每个向量 LOCAL_INDEX_PQ_SUBVECTORS 字节），
+      再从 float32 矩阵读取少量候选精排，float32 矩阵无需常驻内存
+    返回的 distance 为余弦距离 (1 - cos)。
+    """
+
+    def __init__(self, name: str = "knowledge_base", path: str = None, quantization: str = None):
+        self.path = os.path.join(path or settings.LOCAL_INDEX_PATH, name)
+        self.quantization = quantization or settings.LOCAL_INDEX_QUANTIZATION
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {self.quantization}")
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._training = None  # 后台训练线程
+        self._pending_rows = None  # 训练快照之后写入或删除的行，替换索引时补算
+
+    # ---- 异步接口（numpy 计算在线程中执行，不阻塞事件循环） ----
+
+    async def query(self, query_embeddings: list, n_results: int, **kwargs) -> dict:
+        return await asyncio.to_thread(self.query_sync, query_embeddings, n_results)
+
+    async def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        return await asyncio.to_thread(self.upsert_sync, ids, embeddings, documents, metadatas)
+
+    async def update(self, ids: list, metadatas: list):
+        return await asyncio.to_thread(self.update_sync, ids, metadatas)
+
+    async def get(self, ids: list = None, where: dict = None, include: list = None, **kwargs) -> dict:
+        return await asyncio.to_thread(self.get_sync, ids, where, include)
+
+    async def delete(self, ids: list = None, where: dict = None, **kwargs):
+        return await asyncio.to_thread(self.delete_sync, ids, where)
+
+    # ---- 加载与持久化 ----
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.path, exist_ok=True)
+
+        self._dim = None
+        self._capacity = 0
+        self._vectors = None
+        self._assign = None
+        self._centroids = None
+        self._lists = None  # 倒排表：每个簇的存活行号数组
+        self._trained_size = 0
+        self._int8_codes = None
+        self._int8_scales = None
+        self._pq_codebooks = None
+        self._pq_codes = None
+        self._pq_trained_size = 0
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._rows = {}
+        self._free = []
+
+        if os.path.exists(self._file(HEADER_FILE)):
+            with open(self._file(HEADER_FILE)) as f:
+                header = json.load(f)
+            self._dim = header["dim"]
+            self._capacity = header["capacity"]
+            self._trained_size = header.get("trained_size", 0)
+            self._vectors = self._open_matrix(VECTORS_FILE, np.float32, self._dim)
+            if os.path.exists(self._file(CENTROIDS_FILE)):
+                self._centroids = np.load(self._file(CENTROIDS_FILE))
+                self._assign = self._open_matrix(ASSIGN_FILE, np.int32)
+            stored_quantization = header.get("quantization", "none")
+        else:
+            stored_quantization = self.quantization
+
+        log_lines = self._replay_records()
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._alive[list(self._rows.values())] = True
+        # 行版本号：行被删除或分配给新条目时递增，查询据此识别锁外计算期间被复用的行
+        self._generations = np.zeros(self._capacity, dtype=np.int64)
+        self._free = [row for row, id_ in enumerate(self._ids) if id_ is None]
+        if self._centroids is not None:
+            self._assign[~self._alive] = -1
+            self._lists = self._build_lists(self._assign, np.flatnonzero(self._alive), len(self._centroids))
+
+        if self._dim is not None:
+            self._check_dim()
+            if stored_quantization == self.quantization:
+                self._open_codes(header)
+            else:
+                # 量化方式变更：int8 立即从 float32 矩阵重新编码，PQ 等待下次训练
+                logger.info(f"Quantization changed from {stored_quantization} to {self.quantization}, rebuilding codes")
+                self._open_codes({})
+                if self.quantization == "int8":
+                    self._encode_rows(np.flatnonzero(self._alive))
+                self._write_header()
+
+        # 追加日志中的失效记录过多时压缩重写
+        if log_lines > 2 * len(self._rows) + 1000:
+            self._compact_records()
+
+        self._loaded = True
+        logger.info(f"Loaded local vector index {self.path} with {len(self._rows)} vectors")
+        self._schedule_training()
+
+    def _replay_records(self) -> int:
+        lines = 0
+        if not os.path.exists(self._file(RECORDS_FILE)):
+            return lines
+        with open(self._file(RECORDS_FILE), encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                record = json.loads(line)
+                row = record["row"]
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._documents.append(None)
+                    self._metadatas.append(None)
+                if record["op"] == "upsert":
+                    self._ids[row] = record["id"]
+                    self._documents[row] = record["document"]
+                    self._metadatas[row] = record["metadata"]
+                    self._rows[record["id"]] = row
+                else:
+                    self._rows.pop(self._ids[row], None)
+                    self._ids[row] = None
+                    self._documents[row] = None
+                    self._metadatas[row] = None
+        return lines
+
+    def _open_codes(self, header: dict):
+        if self.quantization == "int8":
+            self._int8_codes = self._open_matrix(INT8_CODES_FILE, np.int8, self._dim)
+            self._int8_scales = self._open_matrix(INT8_SCALES_FILE, np.float32)
+        elif self.quantization == "pq" and header.get("pq_trained_size") and os.path.exists(self._file(PQ_CODEBOOKS_FILE)):
+            self._pq_codebooks = np.load(self._file(PQ_CODEBOOKS_FILE))
+            self._pq_codes = self._open_matrix(PQ_CODES_FILE, np.uint8, len(self._pq_codebooks))
+            self._pq_trained_size = header["pq_trained_size"]
+
+    def _check_dim(self):
+        if self.quantization == "pq" and self._dim % settings.LOCAL_INDEX_PQ_SUBVECTORS:
+            raise ValueError(
+                f"LOCAL_INDEX_PQ_SUBVECTORS={settings.LOCAL_INDEX_PQ_SUBVECTORS} does not divide dimension {self._dim}"
+            )
+
+    def _compact_records(self):
+        tmp = self._file(RECORDS_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for id_, row in self._rows.items():
+                f.write(self._record("upsert", row))
+        os.replace(tmp, self._file(RECORDS_FILE))
+
+    def _record(self, op: str, row: int) -> str:
+        record = {"op": op, "row": row}
+        if op == "upsert":
+            record.update(
+                id=self._ids[row],
+                document=self._documents[row],
+                metadata=self._metadatas[row],
+            )
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def _write_header(self):
+        header = {
+            "dim": self._dim,
+            "capacity": self._capacity,
+            "trained_size": self._trained_size,
+            "quantization": self.quantization,
+            "pq_trained_size": self._pq_trained_size,
+        }
+        with open(self._file(HEADER_FILE), "w") as f:
+            json.dump(header, f)
+
+    def _open_matrix(self, name: str, dtype, width: int = None) -> np.memmap:
+        """
+        以读写模式内存映射文件，文件不足 capacity 行时先扩容。
+        """
+        shape = (self._capacity, width) if width else (self._capacity,)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(self._file(name), "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self._file(name), dtype=dtype, mode="r+", shape=shape)
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        self._capacity = max(rows, self._capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = self._open_matrix(VECTORS_FILE, np.float32, self._dim)
+        if self._assign is not None:
+            self._assign.flush()
+            old_capacity = len(self._assign)
+            self._assign = self._open_matrix(ASSIGN_FILE, np.int32)
+            self._assign[old_capacity:] = -1
+        if self.quantization == "int8":
+            if self._int8_codes is not None:
+                self._int8_codes.flush()
+                self._int8_scales.flush()
+            self._int8_codes = self._open_matrix(INT8_CODES_FILE, np.int8, self._dim)
+            self._int8_scales = self._open_matrix(INT8_SCALES_FILE, np.float32)
+        if self._pq_codes is not None:
+            self._pq_codes.flush()
+            self._pq_codes = self._open_matrix(PQ_CODES_FILE, np.uint8, len(self._pq_codebooks))
+        alive = np.zeros(self._capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        generations = np.zeros(self._capacity, dtype=np.int64)
+        generations[:len(self._generations)] = self._generations
+        self._generations = generations
+        self._write_header()
+
+    # ---- 写入 ----
+
+    def upsert_sync(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._lock:
+            self._load()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._check_dim()
+            if vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+
+            rows, new_rows = [], []
+            for id_ in ids:
+                row = self._rows.get(id_)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = len(self._ids)
+                        self._ids.append(None)
+                        self._documents.append(None)
+                        self._metadatas.append(None)
+                    self._rows[id_] = row
+                    new_rows.append(row)
+                rows.append(row)
+            self._ensure_capacity(len(self._ids))
+            self._generations[new_rows] += 1
+
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            if self._centroids is not None:
+                self._relist(np.asarray(rows), np.argmax(vectors @ self._centroids.T, axis=1))
+                self._assign.flush()
+            self._encode_rows(rows, vectors)
+
+            for row, id_, document, metadata in zip(rows, ids, documents, metadatas):
+                self._ids[row] = id_
+                self._documents[row] = document
+                self._metadatas[row] = dict(metadata or {})
+                self._alive[row] = True
+            with open(self._file(RECORDS_FILE), "a", encoding="utf-8") as f:
+                f.write("".join(self._record("upsert", row) for row in dict.fromkeys(rows)))
+            if self._pending_rows is not None:
+                self._pending_rows.update(rows)
+            self._schedule_training()
+
+    def update_sync(self, ids: list, metadatas: list):
+        with self._lock:
+            self._load()
+            rows = []
+            for id_, metadata in zip(ids, metadatas):
+                row = self._rows.get(id_)
+                if row is not None:
+                    self._metadatas[row] = dict(metadata or {})
+                    rows.append(row)
+            with open(self._file(RECORDS_FILE), "a", encoding="utf-8") as f:
+                f.write("".join(self._record("upsert", row) for row in dict.fromkeys(rows)))
+
+    def delete_sync(self, ids: list = None, where: dict = None):
+        with self._lock:
+            self._load()
+            rows = self._select_rows(ids, where)
+            for row in rows:
+                del self._rows[self._ids[row]]
+                self._ids[row] = None
+                self._documents[row] = None
+                self._metadatas[row] = None
+                self._alive[row] = False
+                self._free.append(row)
+            self._generations[rows] += 1
+            if self._centroids is not None and rows:
+                self._relist(np.asarray(rows), np.full(len(rows), -1))
+                self._assign.flush()
+            if self._pending_rows is not None:
+                self._pending_rows.update(rows)
+            with open(self._file(RECORDS_FILE), "a", encoding="utf-8") as f:
+                f.write("".join(self._record("delete", row) for row in rows))
+
+    # ---- 读取 ----
+
+    def _select_rows(self, ids: list = None, where: dict = None) -> list:
+        if ids is not None:
+            rows = [self._rows[id_] for id_ in ids if id_ in self._rows]
+        else:
+            rows = list(self._rows.values())
+        if where:
+            rows = [row for row in rows if match_where(self._metadatas[row], where)]
+        return rows
+
+    def get_sync(self, ids: list = None, where: dict = None, include: list = None) -> dict:
+        with self._lock:
+            self._load()
+            rows = self._select_rows(ids, where)
+            result = {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._documents[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows],
+            }
+            if include and "embeddings" in include:
+                result["embeddings"] = np.asarray(self._vectors[rows]).tolist() if rows else []
+            return result
+
+    def query_sync(self, query_embeddings: list, n_results: int) -> dict:
+        queries = normalize(np.asarray(query_embeddings, dtype=np.float32))
+        results = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+
+        # 锁内只取得矩阵引用、各查询的候选行号及其版本号
+        with self._lock:
+            self._load()
+            if not self._rows:
+                for field in results:
+                    results[field] = [[] for _ in queries]
+                return results
+
+            high_water = len(self._ids)
+            view = self._scan_view()
+            brute_force = self._centroids is None
+            if brute_force:
+                alive_rows = np.flatnonzero(self._alive[:high_water])
+                candidates = [alive_rows] * len(queries)
+                generations = [self._generations[alive_rows]] * len(queries)
+            else:
+                # 仅扫描与查询最相近的 nprobe 个簇的倒排表
+                nprobe = min(settings.LOCAL_INDEX_NPROBE, len(self._centroids))
+                probes = np.argpartition(-(queries @ self._centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+                candidates = [np.concatenate([self._lists[c] for c in probe]) for probe in probes]
+                generations = [self._generations[rows] for rows in candidates]
+
+        # 锁外计算分数
+        if brute_force:
+            # 暴力检索：按块扫描全部行，一次矩阵乘法同时计算所有查询
+            all_scores = np.concatenate([
+                view.scan(slice(start, min(start + SCAN_BLOCK_ROWS, high_water)), queries)
+                for start in range(0, high_water, SCAN_BLOCK_ROWS)
+            ])
+
+        hits = []
+        for i, query in enumerate(queries):
+            rows, row_generations = candidates[i], generations[i]
+            if brute_force:
+                scores = all_scores[rows, i]
+            else:
+                scores = view.scan(rows, query[None, :])[:, 0]
+
+            k = min(n_results, len(rows))
+            if view.quantized:
+                # 量化分数只用于粗筛，候选从 float32 矩阵读取原始向量精排
+                shortlist = self._top(scores, min(k * settings.LOCAL_INDEX_RERANK_FACTOR, len(rows)))
+                rows, row_generations = rows[shortlist], row_generations[shortlist]
+                scores = view.vectors[rows] @ query
+            top = self._top(scores, k)
+            hits.append((rows[top], row_generations[top], scores[top]))
+
+        # 锁内读取条目，丢弃计算期间被删除或复用的行
+        with self._lock:
+            for rows, row_generations, scores in hits:
+                current = self._generations[rows] == row_generations
+                rows, scores = rows[current], scores[current]
+                results["ids"].append([self._ids[row] for row in rows])
+                results["distances"].append([float(1.0 - s) for s in scores])
+                results["metadatas"].append([self._metadatas[row] for row in rows])
+                results["documents"].append([self._documents[row] for row in rows])
+        return results
+
+    def _scan_view(self) -> ScanView:
+        """
+        （持锁调用）当前矩阵引用的快照。
+        """
+        return ScanView(
+            self._vectors, self._int8_codes, self._int8_scales, self._pq_codebooks, self._pq_codes
+        )
+
+    @staticmethod
+    def _build_lists(assign: np.ndarray, rows: np.ndarray, nlist: int) -> list:
+        """
+        按簇分配将行号分组，返回每个簇的行号数组（倒排表）。
+        """
+        rows = rows[np.argsort(assign[rows], kind="stable")]
+        bounds = np.searchsorted(assign[rows], np.arange(nlist + 1))
+        return [rows[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+    def _relist(self, rows: np.ndarray, labels: np.ndarray):
+        """
+        （持锁调用）将行移到新的簇（label 为 -1 表示移出倒排表），同步更新分配表。
+        受影响的倒排表生成新数组替换，进行中的查询持有的旧数组不受影响。
+        """
+        # 同一批次内重复的行以最后一次写入为准
+        rows, last = np.unique(rows[::-1], return_index=True)
+        labels = np.asarray(labels)[::-1][last]
+        previous = self._assign[rows]
+        self._assign[rows] = labels
+        for c in np.unique(np.concatenate([previous, labels])):
+            if c < 0:
+                continue
+            members = self._lists[c]
+            members = members[~np.isin(members, rows)]
+            added = rows[labels == c]
+            self._lists[c] = np.concatenate([members, added]) if len(added) else members
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        返回分数最高的 k 个下标（降序）。
+        """
+        if not k:
+            return np.array([], dtype=int)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _quantized(self) -> bool:
+        return self._int8_codes is not None or self._pq_codebooks is not None
+
+    # ---- 量化编码 ----
+
+    def _encode_rows(self, rows, vectors: np.ndarray = None):
+        """
+        为指定行写入量化编码，未传入 vectors 时从 float32 矩阵分块读取。
+        """
+        if not self._quantized() or not len(rows):
+            return
+        if vectors is None:
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                block = rows[start:start + SCAN_BLOCK_ROWS]
+                self._encode_rows(block, np.asarray(self._vectors[block]))
+            return
+
+        if self._int8_codes is not None:
+            codes, scales = int8_encode(vectors)
+            self._int8_codes[rows] = codes
+            self._int8_scales[rows] = scales
+            self._int8_codes.flush()
+            self._int8_scales.flush()
+        else:
+            self._pq_codes[rows] = pq_encode(self._pq_codebooks, vectors)
+            self._pq_codes.flush()
+
+    def memory_stats(self) -> dict:
+        """
+        检索时需扫描的数据量（量化编码或 float32 矩阵），用于评估内存占用；
+        quantization 与 ivf_lists 为实际生效的编码方式与倒排簇数（训练完成前分别为 none 和 0）。
+        """
+        with self._lock:
+            self._load()
+            dim = self._dim or 0
+            if self._int8_codes is not None:
+                bytes_per_vector = dim + 4  # int8 编码 + float32 缩放系数
+            elif self._pq_codebooks is not None:
+                bytes_per_vector = len(self._pq_codebooks)
+            else:
+                bytes_per_vector = dim * 4
+            return {
+                "vectors": len(self._rows),
+                "dim": dim,
+                "quantization": self.quantization if self._quantized() else "none",
+                "ivf_lists": len(self._centroids) if self._centroids is not None else 0,
+                "bytes_per_vector": bytes_per_vector,
+                "scan_bytes": bytes_per_vector * len(self._ids),
+            }
+
+    # ---- 后台训练 ----
+
+    def _needs_ivf(self) -> bool:
+        """
+        数据量达到阈值且自上次训练后增长一倍以上时，需要（重新）训练倒排索引。
+        """
+        size = len(self._rows)
+        if size < settings.LOCAL_INDEX_IVF_MIN_SIZE:
+            return False
+        return self._centroids is None or size >= 2 * self._trained_size
+
+    def _needs_pq(self) -> bool:
+        """
+        PQ 模式下数据量达到阈值且自上次训练后增长一倍以上时，需要（重新）训练码本。
+        """
+        if self.quantization != "pq":
+            return False
+        size = len(self._rows)
+        if size < max(settings.LOCAL_INDEX_PQ_MIN_SIZE, PQ_CENTROIDS):
+            return False
+        return self._pq_codebooks is None or size >= 2 * self._pq_trained_size
+
+    def _schedule_training(self):
+        """
+        （持锁调用）需要训练时启动后台训练线程，同一时刻最多一个。
+        """
+        if self._training is not None or not (self._needs_ivf() or self._needs_pq()):
+            return
+        self._training = threading.Thread(
+            target=self._train, name=f"local-index-train-{os.path.basename(self.path)}", daemon=True
+        )
+        self._training.start()
+
+    def wait_for_training(self):
+        """
+        等待后台训练完成（包括训练期间数据继续增长触发的再次训练），用于基准测试和离线导入。
+        """
+        while True:
+            with self._lock:
+                thread = self._training
+            if thread is None:
+                return
+            thread.join()
+
+    def _train(self):
+        succeeded = False
+        try:
+            self._train_ivf()
+            self._train_pq()
+            succeeded = True
+        except Exception as e:
+            logger.error(f"Local index training failed: {e}")
+        finally:
+            with self._lock:
+                self._training = None
+                self._pending_rows = None
+                # 训练失败时等待下一次写入再重试，避免失败后立即重复训练
+                if succeeded:
+                    self._schedule_training()
+
+    def _snapshot(self):
+        """
+        （持锁调用）记录训练快照：当前存活行与 float32 矩阵，并开始记录此后写入或删除的行。
+        """
+        self._pending_rows = set()
+        return len(self._rows), np.flatnonzero(self._alive[:len(self._ids)]), self._vectors
+
+    def _take_pending_rows(self) -> np.ndarray:
+        rows = np.array(sorted(self._pending_rows), dtype=np.int64)
+        self._pending_rows = None
+        return rows
+
+    def _new_matrix(self, name: str, dtype, shape: tuple) -> np.memmap:
+        return np.memmap(self._file(name + ".tmp"), dtype=dtype, mode="w+", shape=shape)
+
+    def _train_ivf(self):
+        """
+        在快照上训练球面 k-means，计算全部行的簇分配（写入临时文件）并构建倒排表，
+        然后在锁内补算训练期间写入或删除的行，原子替换质心、分配表与倒排表。
+        """
+        with self._lock:
+            if not self._needs_ivf():
+                return
+            size, rows, vectors = self._snapshot()
+
+        nlist = int(min(max(np.sqrt(size), 16), 4096))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(rows, min(len(rows), nlist * 64), replace=False))])
+        centroids = spherical_kmeans(sample, nlist, rng)
+
+        assign = self._new_matrix(ASSIGN_FILE, np.int32, (len(vectors),))
+        assign[:] = -1
+        for start in range(0, len(rows), 65536):
+            block = rows[start:start + 65536]
+            assign[block] = np.argmax(vectors[block] @ centroids.T, axis=1)
+        assign.flush()
+        lists = self._build_lists(assign, rows, nlist)
+        del assign
+
+        with self._lock:
+            os.replace(self._file(ASSIGN_FILE + ".tmp"), self._file(ASSIGN_FILE))
+            self._assign = self._open_matrix(ASSIGN_FILE, np.int32)
+            self._assign[len(vectors):] = -1  # 训练期间扩容新增的行
+            self._centroids = centroids
+            self._lists = lists
+            # 训练期间写入或删除的行：按新质心重新分配，已删除的行移出倒排表
+            pending = self._take_pending_rows()
+            if len(pending):
+                alive = self._alive[pending]
+                labels = np.full(len(pending), -1)
+                labels[alive] = np.argmax(self._vectors[pending[alive]] @ centroids.T, axis=1)
+                self._relist(pending, labels)
+            self._assign.flush()
+            np.save(self._file(CENTROIDS_FILE), centroids)
+            self._trained_size = size
+            self._write_header()
+        logger.info(f"Trained IVF index with {nlist} lists over {size} vectors")
+
+    def _train_pq(self):
+        """
+        在快照上训练 PQ 码本并编码全部行（写入临时文件），
+        然后在锁内重新编码训练期间写入的行，原子替换码本与编码。
+        """
+        with self._lock:
+            if not self._needs_pq():
+                return
+            size, rows, vectors = self._snapshot()
+
+        m = settings.LOCAL_INDEX_PQ_SUBVECTORS
+        sub_dim = self._dim // m
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(rows, min(len(rows), PQ_CENTROIDS * 64), replace=False))])
+        codebooks = np.stack([
+            kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], PQ_CENTROIDS, rng) for j in range(m)
+        ]).astype(np.float32)
+
+        codes = self._new_matrix(PQ_CODES_FILE, np.uint8, (len(vectors), m))
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block = rows[start:start + SCAN_BLOCK_ROWS]
+            codes[block] = pq_encode(codebooks, np.asarray(vectors[block]))
+        codes.flush()
+        del codes
+
+        with self._lock:
+            os.replace(self._file(PQ_CODES_FILE + ".tmp"), self._file(PQ_CODES_FILE))
+            self._pq_codes = self._open_matrix(PQ_CODES_FILE, np.uint8, m)
+            self._pq_codebooks = codebooks
+            self._encode_rows(self._take_pending_rows())
+            np.save(self._file(PQ_CODEBOOKS_FILE), codebooks)
+            self._pq_trained_size = size
+            self._write_header()
+        logger.info(f"Trained PQ codebooks ({m} x {PQ_CENTROIDS}) over {size} vectors")
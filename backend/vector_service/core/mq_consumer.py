@@ -1,105 +1,208 @@
-import pika
-import json
-import threading
 import asyncio
+import aio_pika
 from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
 from backend.shared.core.config import settings
-from backend.vector_service.services.vector_service import VectorService
+from backend.shared.core.mq import (
+    ATTEMPTS_HEADER,
+    DEAD_LETTER_QUEUE,
+    EMBEDDING_QUEUE,
+    decode_chunks,
+    encode_chunks,
+    failure_headers,
+    is_outage,
+    topology,
+)
 from backend.shared.rpc import vector_pb2
 
+CONSUMER_BATCH_CHUNKS = Histogram(
+    "vector_consumer_batch_chunks",
+    "Chunks per embedding micro-batch flushed by the MQ consumer",
+    buckets=(1, 8, 16, 32, 64, 128, 256),
+)
+CONSUMER_BATCHES_IN_FLIGHT = Gauge(
+    "vector_consumer_batches_in_flight",
+    "Embedding micro-batches currently being processed by the MQ consumer",
+)
+CONSUMER_REROUTED = Counter(
+    "vector_consumer_rerouted_messages_total",
+    "Failed embedding messages moved to a retry queue or the dead-letter queue",
+    ["destination"],
+)
+
 
 class RabbitMQConsumer:
     """
-    Vector Service 内部的 RabbitMQ 消费者，用于处理向量化任务。
+    Vector Service 内部的 RabbitMQ 消费者（aio-pika，运行在 gRPC 服务的事件循环中）：
+    - prefetch 为 MQ_CONSUMER_PREFETCH，broker 可同时投递多条未确认消息
+    - 消息按切片数累积成微批：达到 MQ_CONSUMER_BATCH_SIZE 个切片或等待 MQ_CONSUMER_BATCH_WAIT_MS 后刷新
+    - 每个微批走批量 Embedding + 一次向量库写入 (VectorService._upsert_batch)，
+      最多 MQ_CONSUMER_CONCURRENCY 个微批并发处理
+    - 逐条消息确认：消息中的切片全部处理完成后 ack
+    - 失败的切片不回到队头：重新打包发往按指数退避的延迟重试队列，
+      超过 MQ_MAX_ATTEMPTS 次后进入死信队列；无法解析的消息直接进入死信队列
+    - 下游服务（Embedding API、向量库）不可用引起的失败发往 outage 重试队列，不消耗消息的重试次数
     """
-    def __init__(self):
+
+    def __init__(self, vector_service):
+        self.vector_service = vector_service
         self.connection = None
         self.channel = None
-        self.vector_service = VectorService()
-        self.loop = None
+        self.publish_channel = None
+        self._batch = []  # [(message, chunks, requests)]
+        self._batch_chunks = 0
+        self._flush_handle = None
+        self._semaphore = asyncio.Semaphore(settings.MQ_CONSUMER_CONCURRENCY)
+        self._tasks = set()
+
+    async def run(self):
+        """
+        在后台任务中运行：连接失败时按指数退避重试（上限 MQ_RECONNECT_MAX_DELAY），直到连接成功。
+        连接建立后的断线由 connect_robust 自动重连。RabbitMQ 不可用不影响 gRPC 检索服务。
+        """
+        delay = 1.0
+        while True:
+            try:
+                await self.start()
+                return
+            except Exception:
+                if self.connection:
+                    await self.connection.close()
+                    self.connection = None
+                logger.warning(f"Retrying RabbitMQ connection in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.MQ_RECONNECT_MAX_DELAY)
 
-    def connect(self):
+    async def start(self):
         """
         连接 RabbitMQ 并开始消费。
         """
         try:
-            credentials = pika.PlainCredentials(
-                settings.RABBITMQ_DEFAULT_USER, settings.RABBITMQ_DEFAULT_PASS
-            )
-            parameters = pika.ConnectionParameters(
+            self.connection = await aio_pika.connect_robust(
                 host=settings.RABBITMQ_HOST,
                 port=settings.RABBITMQ_PORT,
-                credentials=credentials,
-            )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue="embedding_queue", durable=True)
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue="embedding_queue", on_message_callback=self.on_message
+                login=settings.RABBITMQ_DEFAULT_USER,
+                password=settings.RABBITMQ_DEFAULT_PASS,
             )
-            logger.info("RabbitMQ Consumer connected")
+            self.channel = await self.connection.channel()
+            # 转发失败消息的通道开启发布确认：确认写入重试/死信队列后才 ack 原消息
+            self.publish_channel = await self.connection.channel(publisher_confirms=True)
+            await self.channel.set_qos(prefetch_count=settings.MQ_CONSUMER_PREFETCH)
+            for name, arguments in topology():
+                queue = await self.channel.declare_queue(name, durable=True, arguments=arguments)
+                if name == EMBEDDING_QUEUE:
+                    main_queue = queue
+            await main_queue.consume(self.on_message)
+            logger.info(f"RabbitMQ Consumer connected (prefetch={settings.MQ_CONSUMER_PREFETCH})")
         except Exception as e:
             logger.error(f"Failed to connect to RabbitMQ: {e}")
-            # Retry logic could be added here
             raise
 
-    def on_message(self, ch, method, properties, body):
+    async def close(self):
         """
-        处理 RabbitMQ 消息，调用 VectorService.Upsert 进行向量化。
+        停止消费：处理完已累积的消息后关闭连接。
         """
-        try:
-            message = json.loads(body)
-            logger.info(f"Received message: {message.get('id', 'unknown')}")
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.connection:
+            await self.connection.close()
 
-            metadata = message.get("metadata", {})
-            str_metadata = {k: str(v) for k, v in metadata.items()}
+    async def on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        """
+        接收一条消息（可包含多个切片），放入当前微批。
+        """
+        try:
+            chunks = decode_chunks(message.body)
+            requests = [
+                vector_pb2.UpsertRequest(
+                    id=chunk["id"],
+                    text=chunk["text"],
+                    metadata={k: str(v) for k, v in chunk.get("metadata", {}).items()},
+                )
+                for chunk in chunks
+            ]
+        except Exception as e:
+            logger.error(f"Error decoding message: {e}")
+            await self._reroute(message, message.body, e, route=DEAD_LETTER_QUEUE)
+            return
 
-            request = vector_pb2.UpsertRequest(
-                id=message["id"], text=message["text"], metadata=str_metadata
+        self._batch.append((message, chunks, requests))
+        self._batch_chunks += len(requests)
+        if self._batch_chunks >= settings.MQ_CONSUMER_BATCH_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                settings.MQ_CONSUMER_BATCH_WAIT_MS / 1000, self._flush
             )
 
-            # 安全地调用异步 Upsert 方法
-            if self.loop and self.loop.is_running():
-                future = asyncio.run_coroutine_threadsafe(
-                    self.vector_service.Upsert(request, None), self.loop
-                )
-                try:
-                    response = future.result(timeout=30)  # Wait for result with timeout
-                    
-                    if response.success:
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                        logger.info(f"Processed message: {message['id']}")
-                    else:
-                        logger.error(f"Failed to process message: {response.error}")
-                        ch.basic_ack(
-                            delivery_tag=method.delivery_tag
-                        )  # Ack to remove from queue
-                except Exception as e:
-                    logger.error(f"Error waiting for Upsert result: {e}")
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-            else:
-                logger.error("Event loop is not running")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch, self._batch_chunks = self._batch, [], 0
+        if batch:
+            task = asyncio.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
-    def start(self, loop):
+    async def _process(self, batch: list):
         """
-        启动消费者循环。
+        处理一个微批：所有消息的切片合并为一次批量写入，然后逐条消息确认。
         """
-        self.loop = loop
-        self.connect()
-        logger.info("Starting RabbitMQ Consumer loop...")
-        self.channel.start_consuming()
+        async with self._semaphore:
+            CONSUMER_BATCHES_IN_FLIGHT.inc()
+            requests = [request for _, _, message_requests in batch for request in message_requests]
+            CONSUMER_BATCH_CHUNKS.observe(len(requests))
+            try:
+                async with asyncio.timeout(settings.MQ_CONSUMER_TIMEOUT):
+                    results = await self.vector_service._upsert_batch(requests)
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(requests)} chunks: {e}")
+                for message, _, _ in batch:
+                    await self._reroute(message, message.body, e, outage=is_outage(e))
+                return
+            finally:
+                CONSUMER_BATCHES_IN_FLIGHT.dec()
+
+        errors = {r.id: r for r in results if not r.success}
+        for message, chunks, message_requests in batch:
+            failed = [errors[r.id] for r in message_requests if r.id in errors]
+            if not failed:
+                await message.ack()
+                continue
+            for result in failed:
+                logger.error(f"Failed to process chunk {result.id}: {result.error}")
+            # 只重试失败的切片，已成功写入的切片不再重复 Embedding
+            retry_chunks = [chunk for chunk in chunks if chunk["id"] in errors]
+            outage = all(result.outage for result in failed)
+            await self._reroute(message, encode_chunks(retry_chunks), failed[0].error, outage=outage)
+        logger.info(f"Processed {len(requests) - len(errors)}/{len(requests)} chunks from {len(batch)} messages")
 
-    def run_in_thread(self, loop):
+    async def _reroute(self, message, body: bytes, error, route: str = None, outage: bool = False):
         """
-        在独立线程中运行消费者。
+        将失败的消息体发往下一级重试队列（或死信队列），broker 确认后 ack 原消息。
+        outage 为 True 时发往 outage 重试队列，不消耗消息的重试次数。
+        转发本身失败时退回 nack(requeue=True)，保证消息不丢失。
         """
-        thread = threading.Thread(target=self.start, args=(loop,))
-        thread.daemon = True
-        thread.start()
-        return thread
+        next_route, headers = failure_headers(message.headers, error, outage=outage)
+        route = route or next_route
+        try:
+            await self.publish_channel.default_exchange.publish(
+                aio_pika.Message(
+                    body,
+                    headers=headers,
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                ),
+                routing_key=route,
+            )
+        except Exception as e:
+            logger.error(f"Failed to reroute message to {route}: {e}")
+            await message.nack(requeue=True)
+            return
+        await message.ack()
+        destination = "dead_letter" if route == DEAD_LETTER_QUEUE else "retry"
+        CONSUMER_REROUTED.labels(destination=destination).inc()
+        if destination == "dead_letter":
+            logger.warning(f"Message moved to {route} after {headers[ATTEMPTS_HEADER]} attempts: {error}")
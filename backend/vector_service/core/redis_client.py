@@ -0,0 +1,9 @@
+from redis.asyncio import Redis
+from backend.shared.core.config import settings
+
+# 向量服务使用的 Redis 客户端（知识库版本号等共享状态）
+redis_client = Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    password=settings.REDIS_PASSWORD,
+)
@@ -0,0 +1,95 @@
+import asyncio
+from prometheus_client import Counter, Histogram
+from backend.shared.core.config import settings
+
+SEARCH_BATCH_SIZE = Histogram(
+    "vector_search_batch_size",
+    "Number of distinct queries per coalesced search batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+SEARCH_COALESCED = Counter(
+    "vector_search_coalesced_total",
+    "Search calls served by an identical in-flight query",
+)
+
+RESULT_FIELDS = ("ids", "distances", "metadatas", "documents")
+
+
+class SearchBatcher:
+    """
+    并发检索请求的微批处理与合并：
+    - 在 SEARCH_BATCH_WINDOW_MS 时间窗口内（或累计 SEARCH_BATCH_MAX_SIZE 条后）收集查询，
+      一次批量 Embedding 调用 + 一次多查询 collection.query
+    - 相同的并发查询共享同一个进行中的调用 (singleflight)
+    """
+
+    def __init__(self, embed_fn, query_fn):
+        """
+        :param embed_fn: async (texts) -> embeddings
+        :param query_fn: async (embeddings, n_results) -> Chroma 多查询结果
+        """
+        self._embed_fn = embed_fn
+        self._query_fn = query_fn
+        self._pending = {}
+        self._inflight = {}
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def search(self, query_text: str, top_k: int) -> dict:
+        """
+        返回单个查询的结果，字段与 Chroma 返回格式相同但去掉了外层的批次维度，
+        另附 query_embedding（本次查询使用的问题向量）。
+        """
+        key = (query_text, top_k)
+        future = self._inflight.get(key)
+        if future is not None:
+            SEARCH_COALESCED.inc()
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        self._pending[key] = future
+
+        if len(self._pending) >= settings.SEARCH_BATCH_MAX_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                settings.SEARCH_BATCH_WINDOW_MS / 1000, self._flush
+            )
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict):
+        keys = list(batch)
+        SEARCH_BATCH_SIZE.observe(len(keys))
+        try:
+            embeddings = await self._embed_fn([query_text for query_text, _ in keys])
+            n_results = max(max(top_k for _, top_k in keys), 1)
+            results = await self._query_fn(embeddings, n_results)
+
+            # 按各查询自己的 top_k 截取结果
+            for i, (key, future) in enumerate(batch.items()):
+                top_k = key[1]
+                result = {
+                    field: results[field][i][:top_k] if results.get(field) else []
+                    for field in RESULT_FIELDS
+                }
+                result["query_embedding"] = embeddings[i]
+                future.set_result(result)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for key in keys:
+                self._inflight.pop(key, None)
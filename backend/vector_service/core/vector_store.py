@@ -0,0 +1,51 @@
+from abc import ABC, abstractmethod
+from backend.shared.core.config import settings
+
+
+class VectorStore(ABC):
+    """
+    向量存储接口（抽象基类，未实现全部方法的后端在实例化时即报错）。
+    方法签名与返回格式与 Chroma Collection 保持一致，VectorService 可无差别切换实现：
+    - query 返回 {"ids", "distances", "metadatas", "documents"}，每个字段按查询分组
+    - get 返回扁平的 {"ids", "documents", "metadatas"}（include 含 "embeddings" 时附带向量）
+    - where 过滤条件为元数据等值匹配，如 {"doc_id": "..."}
+    """
+
+    @abstractmethod
+    async def query(self, query_embeddings: list, n_results: int, **kwargs) -> dict:
+        ...
+
+    @abstractmethod
+    async def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+        ...
+
+    @abstractmethod
+    async def update(self, ids: list, metadatas: list):
+        """
+        只更新已有条目的元数据，不修改向量与文档。
+        """
+
+    @abstractmethod
+    async def get(self, ids: list = None, where: dict = None, include: list = None, **kwargs) -> dict:
+        ...
+
+    @abstractmethod
+    async def delete(self, ids: list = None, where: dict = None, **kwargs):
+        ...
+
+
+def get_vector_store(name: str = "knowledge_base") -> VectorStore:
+    """
+    按 VECTOR_STORE_BACKEND 配置创建向量存储：
+    - chroma：远程 ChromaDB 服务（默认）
+    - local：进程内嵌入式 IVF 索引（内存映射 float32 矩阵，持久化到 LOCAL_INDEX_PATH）
+    """
+    if settings.VECTOR_STORE_BACKEND == "local":
+        from backend.vector_service.core.local_index import LocalVectorStore
+
+        return LocalVectorStore(name)
+    if settings.VECTOR_STORE_BACKEND == "chroma":
+        from backend.vector_service.core.chroma import get_async_chroma_collection
+
+        return get_async_chroma_collection(name)
+    raise ValueError(f"Unknown vector store backend: {settings.VECTOR_STORE_BACKEND}")
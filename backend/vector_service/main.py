@@ -37,18 +37,18 @@ def serve():
 
     async def server_start():
         server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=10))
-        vector_pb2_grpc.add_VectorServiceServicer_to_server(VectorService(), server)
+        service = VectorService()
+        vector_pb2_grpc.add_VectorServiceServicer_to_server(service, server)
         server.add_insecure_port("[::]:" + port)
 
         logger.info(f"Vector Service starting on port {port}...")
         await server.start()
 
         # Start RabbitMQ Consumer
-        # 启动 RabbitMQ 消费者，监听知识库文档上传事件
-        consumer = RabbitMQConsumer()
-        # We pass the current loop so the consumer thread can schedule tasks on it
-        loop = asyncio.get_running_loop()
-        consumer.run_in_thread(loop)
+        # 启动 RabbitMQ 消费者，监听知识库文档上传事件（与 gRPC 服务共享事件循环和 VectorService 实例）
+        # 在后台任务中连接（失败时退避重试），RabbitMQ 不可用时 gRPC 检索服务照常提供
+        consumer = RabbitMQConsumer(service)
+        consumer_task = asyncio.create_task(consumer.run())
 
         # Register with Nacos
         # 注册服务到 Nacos
@@ -62,6 +62,8 @@ def serve():
             """
             logger.info(f"Received signal {sig.name}...")
             registry.deregister_service("vector-service", ip, int(port))
+            consumer_task.cancel()
+            await consumer.close()
             await server.stop(5)
 
         loop = asyncio.get_running_loop()
@@ -0,0 +1,114 @@
+import sys
+import os
+import argparse
+import asyncio
+import json
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from backend.shared.core.config import settings
+from backend.shared.core.mq import content_hash
+from backend.vector_service.core.chunk_refs import chunk_refs
+from backend.vector_service.core.redis_client import redis_client
+from backend.vector_service.core.vector_store import get_vector_store
+from loguru import logger
+
+
+def as_list(vector) -> list:
+    return vector.tolist() if hasattr(vector, "tolist") else list(vector)
+
+
+async def migrate_batch(store, ids: list, created: set, dry_run: bool) -> dict:
+    """
+    迁移一批条目，返回各类操作的条目数。
+    """
+    result = await store.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+    rows = list(zip(result["ids"], result["documents"], result["metadatas"], result["embeddings"]))
+
+    # 旧 ID 条目对应的内容指纹中，已存在于向量库的部分
+    hashes = {}
+    for id_, document, metadata, _ in rows:
+        hashes[id_] = (metadata or {}).get("content_hash") or content_hash(document or "")
+    legacy_hashes = [h for id_, h in hashes.items() if h != id_]
+    existing = set((await store.get(ids=legacy_hashes, include=[]))["ids"]) if legacy_hashes else set()
+
+    inserts, updates, refs, deletes = {}, {}, {}, []
+    for id_, document, metadata, embedding in rows:
+        metadata = dict(metadata or {})
+        entry_id = hashes[id_]
+        stored_refs = json.loads(metadata.pop("doc_refs", None) or "{}")
+        had_refs = metadata.pop("ref_count", None) is not None or bool(stored_refs)
+        entry_refs = stored_refs or {metadata.get("doc_id") or id_: metadata.get("source", "")}
+
+        if entry_id == id_:
+            # 内容指纹 ID 的条目：引用表从元数据移入 Redis
+            if had_refs:
+                updates[id_] = metadata
+                refs.setdefault(entry_id, {}).update(entry_refs)
+            continue
+
+        # 旧格式 ID（{doc_id}_{i}）：按内容指纹重建条目，与已有的相同内容合并，复用原向量
+        if entry_id not in existing and entry_id not in created:
+            metadata["content_hash"] = entry_id
+            inserts[entry_id] = (as_list(embedding), document, metadata)
+            created.add(entry_id)
+        refs.setdefault(entry_id, {}).update(entry_refs)
+        deletes.append(id_)
+
+    if not dry_run:
+        if inserts:
+            await store.upsert(
+                ids=list(inserts),
+                embeddings=[v[0] for v in inserts.values()],
+                documents=[v[1] for v in inserts.values()],
+                metadatas=[v[2] for v in inserts.values()],
+            )
+        await chunk_refs.add(refs)
+        if updates:
+            await store.update(ids=list(updates), metadatas=list(updates.values()))
+        if deletes:
+            await store.delete(ids=deletes)
+    return {"rekeyed": len(inserts), "merged": len(deletes) - len(inserts), "refs_moved": len(updates)}
+
+
+async def migrate(batch_size: int, dry_run: bool):
+    store = get_vector_store()
+    ids = (await store.get(include=[]))["ids"]
+    logger.info(f"Scanning {len(ids)} entries ({'dry run' if dry_run else 'applying changes'})")
+
+    totals = {"rekeyed": 0, "merged": 0, "refs_moved": 0}
+    created = set()
+    for start in range(0, len(ids), batch_size):
+        counts = await migrate_batch(store, ids[start:start + batch_size], created, dry_run)
+        for name, count in counts.items():
+            totals[name] += count
+
+    if not dry_run and any(totals.values()):
+        await redis_client.incr(settings.KB_VERSION_KEY)
+    logger.info(
+        f"Re-keyed {totals['rekeyed']} legacy entries to content hashes, merged {totals['merged']} duplicates "
+        f"into existing entries, moved references of {totals['refs_moved']} entries to Redis"
+    )
+
+
+def main():
+    """
+    切片引用表迁移（升级后执行一次）：
+    - 旧格式 ID（{doc_id}_{i}）的条目按内容指纹重建（复用原向量，不调用 Embedding API），
+      相同内容合并为一个条目，原文档记为引用后删除旧条目；否则重新上传时会产生重复条目
+    - 元数据中的 doc_refs / ref_count 引用表移入 Redis（chunk_refs），并从元数据中删除
+    旧条目的 doc_id 为上传时随机生成的标识，与现在按租户和文件名生成的稳定标识不同：
+    重新上传后旧引用仍会保留对应条目，可通过 DeleteChunks 按旧 doc_id 释放。
+    用法：python backend/vector_service/migrate_refs.py [--dry-run]
+    """
+    parser = argparse.ArgumentParser(description="Move chunk references out of vector metadata and re-key legacy entries")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,248 @@
+import asyncio
 import grpc
 from loguru import logger
+from prometheus_client import Counter
 from backend.shared.rpc import vector_pb2, vector_pb2_grpc
 from backend.shared.core.llm_factory import get_llm_client
 from backend.shared.core.config import settings
-from backend.vector_service.core.chroma import get_chroma_collection
+from backend.shared.core.mq import content_hash, is_outage
+from backend.vector_service.core.vector_store import get_vector_store
+from backend.vector_service.core.redis_client import redis_client
+from backend.vector_service.core.chunk_refs import chunk_refs
+from backend.vector_service.core.embedding_cache import embedding_cache
+from backend.vector_service.core.search_batcher import SearchBatcher
 import uuid
 
+DEDUP_CHUNKS = Counter(
+    "vector_dedup_chunks_total",
+    "Upserted chunks by dedup result (duplicate chunks reuse an existing vector and skip embedding)",
+    ["result"],
+)
+
+
+# 仅供内部使用的元数据字段，不返回给检索调用方（doc_refs / ref_count 为旧版本写入的引用表）
+INTERNAL_METADATA = {"content_hash", "doc_refs", "ref_count"}
+
+
+def entry_refs(requests: list) -> dict:
+    """
+    请求中引用该内容的文档：{doc_id: source}（旧消息缺失 doc_id 时以切片 ID 代替）。
+    """
+    return {r.metadata.get("doc_id") or r.id: r.metadata.get("source", "") for r in requests}
+
+
 class VectorService(vector_pb2_grpc.VectorServiceServicer):
     def __init__(self):
         self.client = get_llm_client()
-        self.collection = get_chroma_collection()
+        self.collection = get_vector_store()
+        self._write_lock = asyncio.Lock()
+        self.search_batcher = SearchBatcher(self._get_query_embeddings, self._query)
 
     async def _get_embedding(self, text: str):
+        return (await self._get_embeddings([text]))[0]
+
+    async def _get_query_embeddings(self, texts: list) -> list:
+        """
+        检索查询的向量：Embedding API 欠费或拒绝访问时退化为随机向量。
+        写入路径不使用该降级：随机向量会按内容指纹存入索引，之后相同内容不会再重新向量化。
+        """
+        return await self._get_embeddings(texts, mock_fallback=True)
+
+    async def _get_embeddings(self, texts: list, mock_fallback: bool = False) -> list:
+        """
+        批量获取向量：优先命中两级向量缓存，未命中的文本去重后
+        按 EMBEDDING_BATCH_SIZE 分批调用 Embedding API。
+        """
+        embeddings = await embedding_cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+
+        computed = {}
+        for start in range(0, len(missing), settings.EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + settings.EMBEDDING_BATCH_SIZE]
+            computed.update(zip(batch, await self._embed_batch(batch, mock_fallback)))
+
+        return [e if e is not None else computed[t] for t, e in zip(texts, embeddings)]
+
+    async def _embed_batch(self, texts: list, mock_fallback: bool = False) -> list:
+        """
+        单次 Embedding API 调用，input 为文本列表。
+        mock_fallback 为 False 时调用失败直接抛出，由写入方重试（随机向量不写入缓存和索引）。
+        """
         try:
             response = await self.client.embeddings.create(
                 model=settings.EMBEDDING_MODEL,
-                input=text
+                input=texts
             )
-            return response.data[0].embedding
+            data = sorted(response.data, key=lambda item: item.index)
+            embeddings = [item.embedding for item in data]
+            await embedding_cache.set_many(texts, embeddings)
+            return embeddings
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             # Fallback for Arrearage (Overdue Payment) or other API errors
             # 针对欠费或其他 API 错误的降级处理：返回随机向量以保持服务可用性（仅供测试）
-            if "Arrearage" in str(e) or "Access denied" in str(e) or "400" in str(e):
+            if mock_fallback and ("Arrearage" in str(e) or "Access denied" in str(e) or "400" in str(e)):
                 logger.warning(f"Embedding API failed ({e}). Using mock embedding (random vector).")
                 import random
                 # Assuming 1536 dimensions for standard text-embedding models
-                return [random.random() for _ in range(1536)]
+                return [[random.random() for _ in range(1536)] for _ in texts]
             raise
 
+    async def _query(self, embeddings: list, n_results: int) -> dict:
+        """
+        一次 collection.query 调用检索多个查询向量。
+        """
+        return await self.collection.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+        )
+
+    async def _upsert_batch(self, requests: list) -> list:
+        """
+        批量写入，按内容去重：
+        - 条目 ID 为切片内容指纹（入库时写入 content_hash 元数据，旧消息缺失时在此计算），
+          相同内容在索引中只存一份向量，引用它的文档记录在 Redis 引用表中（chunk_refs）
+        - 已存在的内容只合并新文档的引用，不调用 Embedding API
+        - 新内容按 Embedding 批次获取向量后一次性写入
+        返回逐条（按请求中的切片 ID）的 UpsertResult；下游服务（Embedding API、向量库）不可用
+        引起的失败标记为 outage，消费者重试时不消耗消息的重试次数。
+        """
+        errors = {}
+        entries = {}  # 条目 ID -> 该内容对应的请求
+        for r in requests:
+            entries.setdefault(r.metadata.get("content_hash") or content_hash(r.text), []).append(r)
+
+        try:
+            existing = await self._get_metadatas(list(entries))
+        except Exception as e:
+            logger.error(f"Dedup lookup failed: {e}")
+            return self._results(requests, {r.id: e for r in requests})
+
+        embeddings = {}
+        new_ids = [entry_id for entry_id in entries if entry_id not in existing]
+        for start in range(0, len(new_ids), settings.EMBEDDING_BATCH_SIZE):
+            batch = new_ids[start:start + settings.EMBEDDING_BATCH_SIZE]
+            try:
+                vectors = await self._get_embeddings([entries[entry_id][-1].text for entry_id in batch])
+                embeddings.update(zip(batch, vectors))
+            except Exception as e:
+                errors.update((r.id, e) for entry_id in batch for r in entries[entry_id])
+
+        await self._write_entries(entries, existing, embeddings, errors)
+        return self._results(requests, errors)
+
+    @staticmethod
+    def _results(requests: list, errors: dict) -> list:
+        return [
+            vector_pb2.UpsertResult(
+                id=r.id,
+                success=r.id not in errors,
+                error=str(errors.get(r.id, "")),
+                outage=r.id in errors and is_outage(errors[r.id]),
+            )
+            for r in requests
+        ]
+
+    async def _write_entries(self, entries: dict, existing: dict, embeddings: dict, errors: dict):
+        """
+        写入新条目并登记所有条目的文档引用。
+        在锁内重新确认条目是否存在：并发批次可能同时写入相同内容，或条目已被并发删除。
+        """
+        async with self._write_lock:
+            try:
+                current = await self._get_metadatas([i for i in entries if i in existing or i in embeddings])
+            except Exception as e:
+                logger.error(f"Dedup lookup failed: {e}")
+                errors.update((r.id, e) for rs in entries.values() for r in rs)
+                return
+
+            inserts, refs = {}, {}
+            duplicates = 0
+            for entry_id, entry_requests in entries.items():
+                if entry_id in current:
+                    duplicates += len(entry_requests)
+                elif entry_id in embeddings:
+                    # 新条目的 source / doc_id / chunk_index 取首个引用文档的值，用于展示来源
+                    inserts[entry_id] = dict(entry_requests[0].metadata)
+                    duplicates += len(entry_requests) - 1
+                else:
+                    if entry_id in existing:
+                        # 查询后条目被并发删除，交由消息重试重新写入
+                        errors.update((r.id, "entry removed concurrently") for r in entry_requests)
+                    continue
+                refs[entry_id] = entry_refs(entry_requests)
+
+            try:
+                if inserts:
+                    await self.collection.upsert(
+                        ids=list(inserts),
+                        embeddings=[embeddings[i] for i in inserts],
+                        documents=[entries[i][-1].text for i in inserts],
+                        metadatas=list(inserts.values()),
+                    )
+                await chunk_refs.add(refs)
+            except Exception as e:
+                logger.error(f"Upsert failed: {e}")
+                errors.update((r.id, e) for i in refs for r in entries[i])
+                return
+
+        if inserts:
+            await self._bump_kb_version()
+        DEDUP_CHUNKS.labels("new").inc(len(inserts))
+        DEDUP_CHUNKS.labels("duplicate").inc(duplicates)
+        total = len(inserts) + duplicates
+        if duplicates:
+            logger.info(f"Dedup: {duplicates}/{total} chunks reused existing vectors ({duplicates / total:.0%})")
+
+    async def _release_chunks(self, doc_id: str, ids: list) -> tuple:
+        """
+        移除该文档对各条目的引用，不再被任何文档引用的条目从向量库删除。
+        先删除条目再移除引用：中途失败时重试 DeleteChunks 仍能找到这些条目。
+        返回 (移除引用的条目数, 删除的条目数)。
+        """
+        async with self._write_lock:
+            referenced = await chunk_refs.lookup(doc_id, ids)
+            deletes = [entry_id for entry_id, count in referenced.items() if count <= 1]
+            if deletes:
+                await self.collection.delete(ids=deletes)
+            await chunk_refs.remove(doc_id, list(referenced))
+            await chunk_refs.delete(deletes)
+
+            # 展示用的来源仍指向该文档的条目，切换为其他仍引用该内容的文档
+            updates = {}
+            kept = [entry_id for entry_id in referenced if entry_id not in deletes]
+            for entry_id, metadata in (await self._get_metadatas(kept)).items():
+                if metadata.get("doc_id") != doc_id:
+                    continue
+                ref = await chunk_refs.any_ref(entry_id)
+                if ref is None:
+                    continue
+                metadata = dict(metadata)
+                metadata["doc_id"], metadata["source"] = ref
+                metadata.pop("chunk_index", None)
+                updates[entry_id] = metadata
+            if updates:
+                await self.collection.update(ids=list(updates), metadatas=list(updates.values()))
+
+        if deletes or updates:
+            await self._bump_kb_version()
+        return len(referenced), len(deletes)
+
+    async def _get_metadatas(self, ids: list) -> dict:
+        if not ids:
+            return {}
+        result = await self.collection.get(ids=ids, include=["metadatas"])
+        return {id_: metadata or {} for id_, metadata in zip(result["ids"], result["metadatas"])}
+
+    async def _bump_kb_version(self):
+        """
+        知识库写入后递增版本号，使 RAG 引擎的回答缓存失效。
+        """
+        try:
+            await redis_client.incr(settings.KB_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to bump knowledge base version: {e}")
+
     async def EmbedText(self, request, context):
         try:
             logger.info(f"Embedding text: {request.text[:50]}...")
@@ -42,51 +256,86 @@ class VectorService(vector_pb2_grpc.VectorServiceServicer):
             return vector_pb2.EmbedResponse()
 
     async def Upsert(self, request, context):
+        logger.info(f"Upserting document: {request.id}")
+        result = (await self._upsert_batch([request]))[0]
+        if not result.success:
+            logger.error(f"Upsert failed: {result.error}")
+        return vector_pb2.UpsertResponse(success=result.success, error=result.error)
+
+    async def BatchUpsert(self, request_iterator, context):
+        """
+        客户端流式批量写入：按 UPSERT_BATCH_SIZE 累积切片后批量向量化并写入。
+        """
+        results = []
+        pending = []
+        async for request in request_iterator:
+            pending.append(request)
+            if len(pending) >= settings.UPSERT_BATCH_SIZE:
+                results.extend(await self._upsert_batch(pending))
+                pending = []
+        if pending:
+            results.extend(await self._upsert_batch(pending))
+
+        succeeded = sum(1 for r in results if r.success)
+        logger.info(f"Batch upserted {succeeded}/{len(results)} chunks")
+        return vector_pb2.BatchUpsertResponse(results=results)
+
+    async def DeleteChunks(self, request, context):
         try:
-            logger.info(f"Upserting document: {request.id}")
-            embedding = await self._get_embedding(request.text)
-            
-            self.collection.upsert(
-                ids=[request.id],
-                embeddings=[embedding],
-                documents=[request.text],
-                metadatas=[dict(request.metadata)]
-            )
-            return vector_pb2.UpsertResponse(success=True)
+            released, deleted = await self._release_chunks(request.doc_id, list(request.ids))
+            logger.info(f"Released {released} chunks of document {request.doc_id}, deleted {deleted}")
+            return vector_pb2.DeleteChunksResponse(released=released, deleted=deleted)
         except Exception as e:
-            logger.error(f"Upsert failed: {e}")
-            return vector_pb2.UpsertResponse(success=False, error=str(e))
+            logger.error(f"DeleteChunks failed: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return vector_pb2.DeleteChunksResponse()
+
+    async def IndexedChunks(self, request, context):
+        """
+        返回已写入索引且登记了该文档引用的切片 ID，供知识库服务确认向量化是否完成。
+        """
+        try:
+            referenced = await chunk_refs.lookup(request.doc_id, list(request.ids))
+            return vector_pb2.IndexedChunksResponse(ids=list(referenced))
+        except Exception as e:
+            logger.error(f"IndexedChunks failed: {e}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return vector_pb2.IndexedChunksResponse()
 
     async def Search(self, request, context):
         try:
             logger.info(f"Searching for: {request.query_text}")
-            query_embedding = await self._get_embedding(request.query_text)
-            
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=request.top_k,
-            )
+            # 经由微批处理器合并并发查询
+            results = await self.search_batcher.search(request.query_text, request.top_k)
 
             search_results = []
             if results["ids"]:
-                for i in range(len(results["ids"][0])):
-                    id_ = results["ids"][0][i]
-                    distance = results["distances"][0][i] if results["distances"] else 0
-                    
-                    metadata = results["metadatas"][0][i] if results["metadatas"] else {}
-                    content = results["documents"][0][i] if results["documents"] else ""
+                for i in range(len(results["ids"])):
+                    id_ = results["ids"][i]
+                    distance = results["distances"][i] if results["distances"] else 0
+
+                    score = 1.0 - distance  # Rough approx
+                    # min_score <= 0（proto 默认值）表示不过滤
+                    if request.min_score > 0 and score < request.min_score:
+                        continue
+
+                    metadata = results["metadatas"][i] if results["metadatas"] else {}
+                    content = results["documents"][i] if results["documents"] else ""
 
-                    # Convert metadata map
-                    meta_map = {k: str(v) for k, v in metadata.items()}
+                    # Convert metadata map（去掉内部字段）
+                    meta_map = {k: str(v) for k, v in metadata.items() if k not in INTERNAL_METADATA}
                     
                     search_results.append(vector_pb2.SearchResult(
                         id=id_,
-                        score=1.0 - distance, # Rough approx
+                        score=score,
                         content=content,
                         metadata=meta_map
                     ))
             
-            return vector_pb2.SearchResponse(results=search_results)
+            query_vector = results["query_embedding"] if request.include_vector else []
+            return vector_pb2.SearchResponse(results=search_results, query_vector=query_vector)
 
         except Exception as e:
             logger.error(f"Search failed: {e}")